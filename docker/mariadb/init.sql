@@ -2,7 +2,9 @@ CREATE TABLE IF NOT EXISTS files (
     id INT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
         path VARCHAR(1024) NOT NULL,
+    directory_id INT NULL,
         file_hash VARCHAR(64) NOT NULL,
+    hash_kind VARCHAR(8) NOT NULL DEFAULT 'xxh64',
     mtime DECIMAL(16, 6) NOT NULL,
     file_size BIGINT NOT NULL,
     object VARCHAR(255),
@@ -35,6 +37,9 @@ CREATE TABLE IF NOT EXISTS files (
         focpos INT,
     -- Housekeeping
             thumb MEDIUMBLOB,
+    thumb_format VARCHAR(8) NULL,
+    thumb_sizes VARCHAR(64) NULL,
+    thumb_attempt_mtime DECIMAL(16, 6) NULL,
     total_duplicate_count INT NOT NULL DEFAULT 1,
     visible_duplicate_count INT NOT NULL DEFAULT 1,
     is_hidden TINYINT(1) NOT NULL DEFAULT 0,
@@ -44,6 +49,7 @@ CREATE TABLE IF NOT EXISTS files (
                 -- Indexes
     UNIQUE INDEX idx_path (path),
     INDEX idx_file_hash (file_hash),
+    INDEX idx_hash_kind (hash_kind, file_hash),
     INDEX idx_deleted_at (deleted_at),
     INDEX idx_object (object),
     INDEX idx_filter (filter),
@@ -52,5 +58,49 @@ CREATE TABLE IF NOT EXISTS files (
                 INDEX idx_telescop (telescop),
     INDEX idx_total_duplicate_count (total_duplicate_count),
     INDEX idx_visible_duplicate_count (visible_duplicate_count),
-    INDEX idx_is_hidden (is_hidden)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
\ No newline at end of file
+    INDEX idx_is_hidden (is_hidden),
+    -- Listing indexes: live rows first, then the directory or filter column
+    INDEX idx_live_path (deleted_at, is_hidden, path(255)),
+    INDEX idx_live_name (deleted_at, is_hidden, name),
+    INDEX idx_live_date_obs (deleted_at, is_hidden, date_obs),
+    INDEX idx_live_object (deleted_at, is_hidden, object, date_obs),
+    INDEX idx_live_filter (deleted_at, is_hidden, filter, date_obs),
+    INDEX idx_live_imgtype (deleted_at, is_hidden, imgtype, date_obs),
+    INDEX idx_live_directory (directory_id, deleted_at, is_hidden)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS directories (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    parent_id INT NULL,
+    path VARCHAR(1024) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    depth INT NOT NULL DEFAULT 0,
+    -- Live files directly in this directory (file_count/total_exposure/latest_date_obs: visible only)
+    file_count INT NOT NULL DEFAULT 0,
+    live_count INT NOT NULL DEFAULT 0,
+    total_exposure DOUBLE NOT NULL DEFAULT 0,
+    latest_date_obs DATETIME NULL,
+    -- The same figures for the whole subtree
+    tree_file_count INT NOT NULL DEFAULT 0,
+    tree_live_count INT NOT NULL DEFAULT 0,
+    tree_exposure DOUBLE NOT NULL DEFAULT 0,
+    tree_latest_date_obs DATETIME NULL,
+    -- Set by the web app when it changed files here; the indexer refreshes the rollups
+    stale TINYINT(1) NOT NULL DEFAULT 0,
+    UNIQUE INDEX idx_dir_path (path),
+    INDEX idx_dir_parent (parent_id, name),
+    INDEX idx_dir_stale (stale)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Per-subtree counts for each (object, filter, imgtype) combination, used by
+-- the filter dropdowns and filtered totals. NULL header values are stored as ''.
+CREATE TABLE IF NOT EXISTS directory_facets (
+    directory_id INT NOT NULL,
+    object VARCHAR(255) NOT NULL DEFAULT '',
+    filter VARCHAR(50) NOT NULL DEFAULT '',
+    imgtype VARCHAR(50) NOT NULL DEFAULT '',
+    file_count INT NOT NULL DEFAULT 0,
+    live_count INT NOT NULL DEFAULT 0,
+    total_exposure DOUBLE NOT NULL DEFAULT 0,
+    PRIMARY KEY (directory_id, object, filter, imgtype)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""Reproducible ingest benchmark for the indexer.
+
+Generates a synthetic corpus, then runs a fixed sequence of scenarios
+through Indexer.full_pass() against a throwaway database:
+
+    cold     full ingest into an empty database
+    rescan   second pass with nothing changed
+    delta    a few files rewritten and a few added
+    rename   an object folder renamed (move detection)
+    delete   an object folder deleted (soft delete)
+    purge    the soft-deleted rows aged past the retention and purged
+
+The corpus mixes frame sizes, bit depths (8, 16, -32), frames with NaN
+pixels, multi-extension FITS, XISF files and byte-identical duplicates,
+with the header cards capture software usually writes. It is generated
+from --seed, so two runs with the same options see the same files.
+
+The database is a throwaway database created on a MariaDB server from
+docker/mariadb/init.sql and dropped afterwards (the default), or, with
+--db sqlite, an in-process SQLite stand-in (sqlite_db.py). The SQLite mode
+is a smoke test only: sqlite_db rewrites every statement into another
+dialect, so statement counts and the Python side are realistic but query
+times and plans are not those of MariaDB. Compare MariaDB runs with
+MariaDB baselines.
+
+For each scenario the wall time, files/s, MB/s read, peak RSS of the main
+process and of the worker processes, and the number of database
+statements are reported. --save writes them as JSON; --baseline compares
+against a saved run and exits with status 1 when throughput drops, or
+statements or memory grow, by more than --tolerance.
+
+Usage:
+    python benchmarks/ingest_bench.py --host 127.0.0.1 --user root --password secret --save base.json
+    python benchmarks/ingest_bench.py --host 127.0.0.1 --user root --password secret --baseline base.json
+    python benchmarks/ingest_bench.py --db sqlite --files 50
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from astropy.io import fits
+from xisf import XISF
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+sys.path.insert(0, BENCH_DIR)
+import mysql.connector  # noqa: E402
+from indexer import Indexer  # noqa: E402
+from thumbnail_bench import synthetic_frame  # noqa: E402
+
+INIT_SQL = os.path.join(BENCH_DIR, '..', '..', 'mariadb', 'init.sql')
+
+OBJECTS = ['M31', 'M42', 'NGC 7000', 'IC 1805', 'M101', 'NGC 6960', 'Sh2-129', 'M81']
+FILTERS = ['L', 'R', 'G', 'B', 'Ha', 'OIII', 'SII']
+CALIBRATION = [('DARK', 'Dark Frame'), ('FLAT', 'Flat Field'), ('BIAS', 'Bias Frame')]
+DTYPES = {8: np.uint8, 16: np.uint16, -32: np.float32}
+SETTLE_WAIT = 2.5
+
+# Fields compared against a baseline and the direction that counts as a regression.
+REGRESSIONS = {'files_per_second': 'lower', 'db_statements': 'higher', 'peak_rss_mb': 'higher'}
+
+
+# --- Corpus ---
+def frame_header(rng, i, object_name, filter_name, imgtype, date_obs, exptime, bitpix):
+    """Header cards in the style of NINA / SGP captures."""
+    h = fits.Header()
+    h['IMAGETYP'] = (imgtype, 'Type of exposure')
+    h['EXPOSURE'] = (exptime, '[s] Exposure duration')
+    h['EXPTIME'] = (exptime, '[s] Exposure duration')
+    h['DATE-LOC'] = ((date_obs + timedelta(hours=1)).isoformat(timespec='milliseconds'), 'Time of observation (local)')
+    h['DATE-OBS'] = (date_obs.isoformat(timespec='milliseconds'), 'Time of observation (UTC)')
+    h['XBINNING'] = (1, 'X axis binning factor')
+    h['YBINNING'] = (1, 'Y axis binning factor')
+    h['GAIN'] = (100, 'Sensor gain')
+    h['OFFSET'] = (50, 'Sensor gain offset')
+    h['EGAIN'] = (0.25, '[e-/ADU] Electrons per A/D unit')
+    h['XPIXSZ'] = (3.76, '[um] Pixel X axis size')
+    h['YPIXSZ'] = (3.76, '[um] Pixel Y axis size')
+    h['INSTRUME'] = ('ZWO ASI2600MM Pro', 'Imaging instrument name')
+    h['SET-TEMP'] = (-10.0, '[degC] CCD temperature setpoint')
+    h['CCD-TEMP'] = (round(-10.0 + rng.normal(0, 0.1), 1), '[degC] CCD temperature')
+    h['TELESCOP'] = ('Esprit 100', 'Name of telescope')
+    h['FOCALLEN'] = (550.0, '[mm] Focal length')
+    h['FOCRATIO'] = (5.5, 'Focal ratio')
+    h['RA'] = (float(rng.uniform(0, 360)), '[deg] RA of telescope')
+    h['DEC'] = (float(rng.uniform(-30, 90)), '[deg] Declination of telescope')
+    h['CENTALT'] = (float(rng.uniform(20, 90)), '[deg] Altitude of telescope')
+    h['CENTAZ'] = (float(rng.uniform(0, 360)), '[deg] Azimuth of telescope')
+    h['AIRMASS'] = (float(rng.uniform(1, 2.5)), 'Airmass at frame center (Gueymard 1993)')
+    h['PIERSIDE'] = ('WEST' if i % 2 else 'EAST', 'Telescope pointing state')
+    h['SITEELEV'] = (350.0, '[m] Observation site elevation')
+    h['SITELAT'] = (45.5, '[deg] Observation site latitude')
+    h['SITELONG'] = (9.2, '[deg] Observation site longitude')
+    h['OBJECT'] = (object_name, 'Name of the object of interest')
+    h['FILTER'] = (filter_name, 'Active filter name')
+    h['FOCUSPOS'] = (int(rng.integers(10000, 20000)), '[step] Focuser position')
+    h['FOCTEMP'] = (round(float(rng.normal(8, 2)), 1), '[degC] Focuser temperature')
+    h['ROWORDER'] = ('TOP-DOWN', 'FITS Image Orientation')
+    h['EQUINOX'] = (2000.0, 'Equinox of celestial coordinate system')
+    h['SWCREATE'] = ('N.I.N.A. 3.0.0.1001', 'Software that created this file')
+    for n in range(4):
+        h.add_history(f"Synthetic frame {i}, block {n}, bitpix {bitpix}")
+    return h
+
+
+def xisf_keywords(header):
+    return {card.keyword: [{'value': str(card.value), 'comment': card.comment}]
+            for card in header.cards if card.keyword not in ('HISTORY', 'COMMENT', '')}
+
+
+def write_frame(path, data, header, mef=False):
+    if path.endswith('.xisf'):
+        XISF.write(path, data[..., None], creator_app='ingest_bench', image_metadata={'FITSKeywords': xisf_keywords(header)})
+        return
+    hdus = [fits.PrimaryHDU(data, header=header)]
+    if mef:
+        # A quality mask and a star table after the image, as some
+        # acquisition and calibration tools write them.
+        mask = (np.isnan(data[::8, ::8]) if data.dtype.kind == 'f' else np.zeros(data[::8, ::8].shape, bool)).astype(np.uint8)
+        hdus.append(fits.ImageHDU(mask, name='MASK'))
+        stars = np.arange(200, dtype=np.float32)
+        hdus.append(fits.BinTableHDU.from_columns([
+            fits.Column(name='X', format='E', array=stars * 3.0),
+            fits.Column(name='Y', format='E', array=stars * 2.0),
+            fits.Column(name='FLUX', format='E', array=stars * 100.0),
+        ], name='STARS'))
+    fits.HDUList(hdus).writeto(path, overwrite=True)
+
+
+class Corpus:
+    """Deterministic synthetic image library under root."""
+
+    def __init__(self, root, megapixels, bitpix, seed=0, nan_ratio=0.1, mef_ratio=0.1, xisf_ratio=0.2,
+                 calibration_ratio=0.2):
+        self.root = root
+        self.megapixels = megapixels
+        self.bitpix = bitpix
+        self.seed = seed
+        self.nan_ratio = nan_ratio
+        self.mef_ratio = mef_ratio
+        self.xisf_ratio = xisf_ratio
+        self.calibration_ratio = calibration_ratio
+        self.rng = np.random.default_rng(seed)
+        self._frames = {}
+        self.count = 0
+
+    def _base_frame(self, megapixels, bitpix, with_nan):
+        key = (megapixels, bitpix, with_nan)
+        if key not in self._frames:
+            if bitpix == 8:
+                # 8-bit frames (e.g. planetary cameras) are scaled rather than clipped at 255.
+                frame = synthetic_frame(megapixels, np.dtype(np.float32), 0.0, seed=self.seed) / 256
+                self._frames[key] = np.clip(frame, 0, 255).astype(np.uint8)
+            else:
+                self._frames[key] = synthetic_frame(megapixels, np.dtype(DTYPES[bitpix]), 0.01 if with_nan else 0.0,
+                                                    seed=self.seed)
+        return self._frames[key]
+
+    def add(self, night_offset=0):
+        """Write one more frame and return its path relative to root."""
+        i = self.count
+        self.count += 1
+        rng = self.rng
+        megapixels = self.megapixels[i % len(self.megapixels)]
+        bitpix = self.bitpix[i % len(self.bitpix)]
+        with_nan = bitpix == -32 and rng.random() < self.nan_ratio
+        date_obs = datetime(2024, 1, 1, 20) + timedelta(days=int(i // 40) + night_offset, seconds=int(i % 40) * 300)
+        night = (date_obs - timedelta(hours=12)).strftime('%Y-%m-%d')
+
+        if rng.random() < self.calibration_ratio:
+            imgtype, imgtype_card = CALIBRATION[i % len(CALIBRATION)]
+            filter_name = FILTERS[i % len(FILTERS)]
+            object_name = ''
+            exptime = {'DARK': 300.0, 'FLAT': 1.5, 'BIAS': 0.0}[imgtype]
+            rel_dir = os.path.join('Calibration', night, imgtype)
+        else:
+            imgtype, imgtype_card = 'LIGHT', 'Light Frame'
+            object_name = OBJECTS[(i // 10) % len(OBJECTS)]
+            filter_name = FILTERS[(i // 3) % len(FILTERS)]
+            exptime = 300.0 if filter_name in ('Ha', 'OIII', 'SII') else 120.0
+            rel_dir = os.path.join(object_name, night, filter_name)
+
+        ext = '.xisf' if rng.random() < self.xisf_ratio else '.fits'
+        mef = ext == '.fits' and rng.random() < self.mef_ratio
+        name = f"{object_name or imgtype}_{night}_{filter_name}_{exptime:g}s_{i:05d}{ext}".replace(' ', '_')
+        rel_path = os.path.join(rel_dir, name)
+        os.makedirs(os.path.join(self.root, rel_dir), exist_ok=True)
+
+        # Every frame gets distinct pixels so it gets its own hash.
+        data = self._base_frame(megapixels, bitpix, with_nan).copy()
+        data.flat[i % data.size] = data.flat[(i + 1) % data.size]
+        data[0, :8] = np.arange(i, i + 8) % 200
+        header = frame_header(rng, i, object_name, filter_name, imgtype_card, date_obs, exptime, bitpix)
+        write_frame(os.path.join(self.root, rel_path), data, header, mef=mef)
+        return rel_path
+
+    def generate(self, files, duplicate_ratio):
+        """Write `files` frames, of which duplicate_ratio are copies of earlier ones."""
+        duplicates = int(round(files * duplicate_ratio))
+        originals = [self.add() for _ in range(files - duplicates)]
+        for n in range(duplicates):
+            src = originals[int(self.rng.integers(0, len(originals)))]
+            dest = os.path.join('Backup', f"{n:05d}_{os.path.basename(src)}")
+            os.makedirs(os.path.join(self.root, 'Backup'), exist_ok=True)
+            shutil.copy2(os.path.join(self.root, src), os.path.join(self.root, dest))
+        return originals
+
+
+def corpus_size(root):
+    files, size = 0, 0
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+
+# --- Database ---
+class SqliteDatabase:
+    """Throwaway SQLite file used through the sqlite_db stand-in."""
+
+    def __init__(self, workdir):
+        import sqlite_db
+        mysql.connector.connect = sqlite_db.connect
+        self.params = {'host': 'sqlite', 'database': os.path.join(workdir, 'bench.sqlite')}
+
+    def drop(self):
+        pass
+
+
+class MariaDatabase:
+    """Throwaway database on a MariaDB server, created from init.sql."""
+
+    def __init__(self, host, port, user, password):
+        self.name = f"awi_bench_{os.getpid()}"
+        self.server = {'host': host, 'port': port, 'user': user, 'password': password}
+        conn = mysql.connector.connect(**self.server)
+        cur = conn.cursor()
+        cur.execute(f"CREATE DATABASE `{self.name}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+        cur.execute(f"USE `{self.name}`")
+        with open(INIT_SQL) as f:
+            script = '\n'.join(line for line in f if not line.lstrip().startswith('--'))
+        for statement in script.split(';'):
+            if statement.strip():
+                cur.execute(statement)
+        conn.commit()
+        conn.close()
+        self.params = dict(self.server, database=self.name)
+
+    def drop(self):
+        conn = mysql.connector.connect(**self.server)
+        conn.cursor().execute(f"DROP DATABASE IF EXISTS `{self.name}`")
+        conn.close()
+
+
+def age_deleted_rows(db_params, days):
+    """Backdate soft deletions so the next pass purges them."""
+    conn = mysql.connector.connect(**db_params)
+    cur = conn.cursor()
+    cur.execute("UPDATE files SET deleted_at = NOW() - INTERVAL %s DAY WHERE deleted_at IS NOT NULL", (days,))
+    conn.commit()
+    conn.close()
+
+
+# --- Measurement ---
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter of this process (Linux only)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb(reset_ok):
+    if reset_ok:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scenario(name, make_indexer, prepare=None, **pass_args):
+    if prepare is not None:
+        prepare()
+    # Directories modified within the scanner's settle window are never
+    # trusted by the manifest; wait it out as a real library would.
+    time.sleep(SETTLE_WAIT)
+    indexer = make_indexer()
+    reset_ok = reset_peak_rss()
+    started = time.perf_counter()
+    try:
+        counts = indexer.full_pass(**pass_args)
+    finally:
+        indexer.close()
+    seconds = time.perf_counter() - started
+    counters = indexer.metrics.counters
+    examined = counts['processed'] + counts['skipped'] + counts['moved']
+    return {
+        'scenario': name,
+        'seconds': round(seconds, 3),
+        'files': examined,
+        'processed': counts['processed'],
+        'moved': counts['moved'],
+        'soft_deleted': counts['soft_deleted'],
+        'purged': counts['purged'],
+        'errors': counts['errors'],
+        'files_per_second': round(examined / seconds, 2) if seconds else 0.0,
+        'mb_per_second': round(counters['bytes'] / 1048576 / seconds, 2) if seconds else 0.0,
+        'db_statements': counters['db_statements'],
+        'peak_rss_mb': round(peak_rss_mb(reset_ok), 1),
+        # ru_maxrss of children is the largest worker seen so far, not per scenario.
+        'worker_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a message for each figure that regressed beyond tolerance."""
+    previous = {r['scenario']: r for r in baseline['results']}
+    failures = []
+    for result in results:
+        base = previous.get(result['scenario'])
+        if base is None:
+            continue
+        for field, worse in REGRESSIONS.items():
+            old, new = base[field], result[field]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (worse == 'lower' and change < -tolerance) or (worse == 'higher' and change > tolerance):
+                failures.append(f"{result['scenario']}: {field} {old} -> {new} ({change:+.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest scenarios on a synthetic corpus.")
+    parser.add_argument("--files", type=int, default=200, help="Number of files in the corpus")
+    parser.add_argument("--megapixels", type=float, nargs='+', default=[1, 4, 16], help="Frame sizes, used in turn")
+    parser.add_argument("--bitpix", type=int, nargs='+', choices=sorted(DTYPES), default=[16, -32, 8], help="Bit depths, used in turn")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1, help="Fraction of files that are copies of others")
+    parser.add_argument("--nan-ratio", type=float, default=0.2, help="Fraction of float frames with NaN pixels")
+    parser.add_argument("--mef-ratio", type=float, default=0.1, help="Fraction of FITS files with extra extensions")
+    parser.add_argument("--xisf-ratio", type=float, default=0.2, help="Fraction of XISF files")
+    parser.add_argument("--delta", type=float, default=0.02, help="Fraction of files rewritten and added in the delta scenario")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the corpus generator")
+    parser.add_argument("--workers", type=int, default=1, help="Indexer worker processes")
+    parser.add_argument("--single-pass", action="store_true", help="Index with --single-pass")
+    parser.add_argument("--decode-budget-mb", type=int, default=1024, help="Indexer decode budget per frame")
+    parser.add_argument("--blob-thumbs", action="store_true", help="Store thumbnails as BLOBs instead of static files")
+    parser.add_argument("--no-manifest", action="store_true", help="Index without the scan manifest")
+    parser.add_argument("--workdir", help="Directory for the corpus and database (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory")
+    parser.add_argument("--db", choices=["mariadb", "sqlite"], default="mariadb",
+                        help="Database backend; sqlite is a smoke test whose query times are not representative")
+    parser.add_argument("--host", default=os.getenv("DB_HOST", "127.0.0.1"), help="MariaDB host (--db mariadb)")
+    parser.add_argument("--port", type=int, default=3306, help="MariaDB port (--db mariadb)")
+    parser.add_argument("--user", default=os.getenv("DB_USER", "root"), help="MariaDB user allowed to create databases")
+    parser.add_argument("--password", default=os.getenv("DB_PASS", ""), help="MariaDB password")
+    parser.add_argument("--save", help="Write the results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare with results saved by --save and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the indexer's log")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s [%(levelname)s] %(message)s')
+    workdir = args.workdir or tempfile.mkdtemp(prefix='awi_bench_')
+    root = os.path.join(workdir, 'fits')
+    os.makedirs(root, exist_ok=True)
+    db = None
+    try:
+        started = time.perf_counter()
+        corpus = Corpus(root, args.megapixels, args.bitpix, seed=args.seed, nan_ratio=args.nan_ratio,
+                        mef_ratio=args.mef_ratio, xisf_ratio=args.xisf_ratio)
+        originals = corpus.generate(args.files, args.duplicate_ratio)
+        files, size = corpus_size(root)
+        print(f"Corpus: {files} files, {size / 1048576:.0f} MB in {root} ({time.perf_counter() - started:.1f}s)")
+
+        db = SqliteDatabase(workdir) if args.db == 'sqlite' else MariaDatabase(args.host, args.port, args.user, args.password)
+        manifest = '' if args.no_manifest else os.path.join(workdir, 'manifest.sqlite')
+        thumb_dir = '' if args.blob_thumbs else os.path.join(workdir, 'thumbs')
+
+        def make_indexer():
+            return Indexer(root, db.params, workers=args.workers, single_pass=args.single_pass,
+                           manifest_path=manifest, thumb_dir=thumb_dir, thumb_sizes=(150, 300),
+                           decode_budget_mb=args.decode_budget_mb)
+
+        delta = max(1, int(len(originals) * args.delta))
+        rng = np.random.default_rng(args.seed + 1)
+
+        def change_files():
+            # Rewritten the way capture and processing tools save files:
+            # a new file replaces the old one.
+            for rel_path in rng.choice(originals, delta, replace=False):
+                path = os.path.join(root, rel_path)
+                with open(path, 'rb') as f:
+                    content = bytearray(f.read())
+                content[-16:] = os.urandom(16)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(content)
+                os.replace(path + '.tmp', path)
+            for _ in range(delta):
+                corpus.add(night_offset=365)
+
+        def rename_folder():
+            folder = os.path.join(root, OBJECTS[0])
+            if os.path.isdir(folder):
+                os.rename(folder, folder + ' (reprocessed)')
+
+        def delete_folder():
+            shutil.rmtree(os.path.join(root, OBJECTS[1]), ignore_errors=True)
+
+        results = [
+            run_scenario('cold', make_indexer),
+            run_scenario('rescan', make_indexer),
+            run_scenario('delta', make_indexer, change_files),
+            run_scenario('rename', make_indexer, rename_folder),
+            run_scenario('delete', make_indexer, delete_folder),
+            run_scenario('purge', make_indexer, lambda: age_deleted_rows(db.params, 60)),
+        ]
+    finally:
+        if db is not None:
+            db.drop()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.db == 'sqlite':
+        print("Note: SQLite smoke mode. Statements are rewritten from the MariaDB dialect, so times and "
+              "files/s are not representative of MariaDB; use --db mariadb for real measurements.")
+    print(f"{'scenario':>8} {'time (s)':>9} {'files':>6} {'files/s':>9} {'MB/s':>8} {'statements':>10} "
+          f"{'RSS (MB)':>9} {'workers':>8}  changes")
+    for r in results:
+        changes = ', '.join(f"{r[k]} {k.replace('_', '-')}" for k in ('processed', 'moved', 'soft_deleted', 'purged', 'errors') if r[k])
+        print(f"{r['scenario']:>8} {r['seconds']:>9.2f} {r['files']:>6} {r['files_per_second']:>9.1f} "
+              f"{r['mb_per_second']:>8.1f} {r['db_statements']:>10} {r['peak_rss_mb']:>9.0f} "
+              f"{r['worker_peak_rss_mb']:>8.0f}  {changes}")
+
+    report = {'options': {k: v for k, v in vars(args).items() if k not in ('password', 'save', 'baseline')},
+              'results': results}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        differing = sorted(k for k, v in report['options'].items()
+                           if k not in ('workdir', 'keep', 'verbose', 'tolerance') and baseline['options'].get(k) != v)
+        if differing:
+            print(f"Warning: the baseline was run with different options: {', '.join(differing)}")
+        failures = compare(results, baseline, args.tolerance)
+        if failures:
+            print("Regressions beyond tolerance:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""In-process SQLite stand-in for the parts of mysql.connector the indexer uses.
+
+Statements are rewritten from the MariaDB dialect the indexer speaks
+(%s placeholders, ON DUPLICATE KEY UPDATE, INSERT IGNORE, UPDATE ... JOIN,
+NOW() - INTERVAL n DAY, ...) into SQLite. It is only meant for smoke runs
+of the benchmarks (ingest_bench.py --db sqlite): statement counts and the
+Python side of the pipeline are realistic, query times are not
+representative of MariaDB.
+
+Usage:
+    import mysql.connector, sqlite_db
+    mysql.connector.connect = sqlite_db.connect
+"""
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    directory_id INT NULL,
+    file_hash TEXT NOT NULL,
+    hash_kind TEXT NOT NULL DEFAULT 'xxh64',
+    mtime REAL NOT NULL,
+    file_size INTEGER NOT NULL,
+    object TEXT, date_obs TEXT, exptime REAL, filter TEXT, imgtype TEXT,
+    xbinning INT, ybinning INT, egain REAL, `offset` REAL, xpixsz REAL, ypixsz REAL,
+    instrume TEXT, set_temp REAL, ccd_temp REAL, telescop TEXT, focallen REAL, focratio REAL,
+    ra REAL, `dec` REAL, centalt REAL, centaz REAL, airmass REAL, pierside TEXT,
+    siteelev REAL, sitelat REAL, sitelong REAL, focpos INT,
+    thumb BLOB, thumb_format TEXT NULL, thumb_sizes TEXT NULL, thumb_attempt_mtime REAL NULL,
+    total_duplicate_count INT NOT NULL DEFAULT 1,
+    visible_duplicate_count INT NOT NULL DEFAULT 1,
+    is_hidden INT NOT NULL DEFAULT 0,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    deleted_at TEXT NULL DEFAULT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_file_hash ON files (file_hash);
+CREATE TABLE IF NOT EXISTS directories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    parent_id INT NULL,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    depth INT NOT NULL DEFAULT 0,
+    file_count INT NOT NULL DEFAULT 0,
+    live_count INT NOT NULL DEFAULT 0,
+    total_exposure REAL NOT NULL DEFAULT 0,
+    latest_date_obs TEXT NULL,
+    tree_file_count INT NOT NULL DEFAULT 0,
+    tree_live_count INT NOT NULL DEFAULT 0,
+    tree_exposure REAL NOT NULL DEFAULT 0,
+    tree_latest_date_obs TEXT NULL,
+    stale INT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_dir_parent ON directories (parent_id, name);
+CREATE INDEX IF NOT EXISTS idx_dir_stale ON directories (stale);
+CREATE TABLE IF NOT EXISTS directory_facets (
+    directory_id INT NOT NULL,
+    object TEXT NOT NULL DEFAULT '',
+    filter TEXT NOT NULL DEFAULT '',
+    imgtype TEXT NOT NULL DEFAULT '',
+    file_count INT NOT NULL DEFAULT 0,
+    live_count INT NOT NULL DEFAULT 0,
+    total_exposure REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (directory_id, object, filter, imgtype)
+);
+"""
+
+_UPDATE_JOIN_RE = re.compile(
+    r"\s*UPDATE\s+(\w+)\s+(\w+)\s+JOIN\s+(.*)\s+ON\s+(.*?)\s+SET\s+(.*?)(?:\s+WHERE\s+(.*))?\s*$", re.S)
+
+
+class Error(Exception):
+    pass
+
+
+def translate(sql):
+    """Rewrite one MariaDB statement for SQLite."""
+    s = re.sub(r"%\((\w+)\)s", r":\1", sql).replace("%s", "?")
+    s = s.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+    s = re.sub(r"VALUES\((`?\w+`?)\)", r"excluded.\1", s)
+    s = re.sub(r"NOW\(\)\s*-\s*INTERVAL\s+\?\s+DAY", "datetime('now', 'localtime', '-' || ? || ' days')", s)
+    s = s.replace("NOW()", "datetime('now', 'localtime')")
+    s = re.sub(r"\bIF\(", "IIF(", s)
+    s = re.sub(r"\bGREATEST\(", "MAX(", s)
+    s = s.replace("INSERT IGNORE", "INSERT OR IGNORE")
+    s = s.replace("ADD COLUMN IF NOT EXISTS", "ADD COLUMN")
+    s = re.sub(r"\s+AFTER\s+\w+\s*$", "", s)
+    if s.lstrip().upper().startswith("CREATE INDEX"):
+        s = re.sub(r"(\w+)\(\d+\)(?=\s*[,)])", r"\1", s)
+    # UPDATE t a JOIN (subquery) b ON cond SET ... [WHERE ...] -> UPDATE ... FROM
+    m = _UPDATE_JOIN_RE.match(s)
+    if m:
+        table, alias, joined, cond, sets, where = m.groups()
+        sets = re.sub(r"(^|,)\s*%s\." % alias, r"\1 ", sets)
+        s = f"UPDATE {table} AS {alias} SET {sets} FROM {joined} WHERE {cond}" + (f" AND ({where})" if where else "")
+    return s
+
+
+def _param(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if isinstance(value, datetime) else value
+
+
+class Cursor:
+    def __init__(self, conn, dictionary=False):
+        self._conn = conn
+        self._cur = conn._db.cursor()
+        self.dictionary = dictionary
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, sql, params=()):
+        # The schema is created up front; the MariaDB table definitions in
+        # the migrations do not parse in SQLite.
+        if sql.lstrip().upper().startswith("CREATE TABLE IF NOT EXISTS"):
+            return
+        if isinstance(params, dict):
+            params = {k: _param(v) for k, v in params.items()}
+        else:
+            params = tuple(_param(v) for v in params or ())
+        statement = translate(sql)
+        try:
+            with self._conn._lock:
+                self._cur.execute(statement, params)
+        except sqlite3.OperationalError as e:
+            if "duplicate column" in str(e):
+                return
+            raise Error(f"{e}: {statement}") from e
+        except sqlite3.Error as e:
+            raise Error(f"{e}: {statement}") from e
+        self.rowcount = self._cur.rowcount
+        self.lastrowid = self._cur.lastrowid
+
+    def executemany(self, sql, seq_params):
+        for params in seq_params:
+            self.execute(sql, params)
+
+    def _rows(self, rows):
+        if not self.dictionary:
+            return rows
+        names = [d[0] for d in self._cur.description]
+        return [dict(zip(names, row)) for row in rows]
+
+    def fetchall(self):
+        return self._rows(self._cur.fetchall())
+
+    def fetchmany(self, size=1):
+        return self._rows(self._cur.fetchmany(size))
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return None if row is None else self._rows([row])[0]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+
+class Connection:
+    def __init__(self, database, **_):
+        self._db = sqlite3.connect(database, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._open = True
+
+    def cursor(self, dictionary=False, buffered=None):
+        return Cursor(self, dictionary)
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def is_connected(self):
+        return self._open
+
+    def close(self):
+        self._open = False
+        self._db.close()
+
+
+def connect(database, **params):
+    """Open the SQLite file named by `database`; the other parameters are ignored."""
+    return Connection(database, **params)
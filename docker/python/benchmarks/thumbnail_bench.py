@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for thumbnail generation.
+
+Compares the original full-resolution stretch (kept here as
+legacy_make_thumbnail) against thumbnails.make_thumbnail on synthetic
+frames, reporting per-frame time, peak traced memory and the mean
+absolute pixel difference between the two thumbnails.
+
+Usage:
+    python benchmarks/thumbnail_bench.py --megapixels 16 61 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from thumbnails import make_thumbnail  # noqa: E402
+
+
+def legacy_make_thumbnail(data, size):
+    data = np.nan_to_num(data)
+    p_low, p_high = np.nanpercentile(data, [0.5, 99.5])
+    if p_high <= p_low:
+        stretched = np.zeros_like(data, dtype=float)
+    else:
+        stretched = (data - p_low) / (p_high - p_low)
+    stretched = np.clip(stretched, 0, 1)
+    img = (stretched * 255).astype(np.uint8)
+    image = Image.fromarray(img)
+    image.thumbnail(size)
+    buf = BytesIO()
+    image.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def synthetic_frame(megapixels, dtype, nan_fraction, seed=0):
+    """Sky background with a gradient, noise and a sprinkling of stars."""
+    rng = np.random.default_rng(seed)
+    w = int(np.sqrt(megapixels * 1e6 * 3 / 2))
+    h = int(megapixels * 1e6 // w)
+    frame = rng.normal(1200, 40, (h, w)).astype(np.float32)
+    frame += np.linspace(0, 300, w, dtype=np.float32)[None, :]
+    ys = rng.integers(0, h, 2000)
+    xs = rng.integers(0, w, 2000)
+    frame[ys, xs] += rng.uniform(2000, 60000, 2000).astype(np.float32)
+    if np.issubdtype(dtype, np.integer):
+        frame = np.clip(frame, 0, np.iinfo(dtype).max).astype(dtype)
+    elif nan_fraction:
+        frame[rng.random((h, w)) < nan_fraction] = np.nan
+    return frame
+
+
+def measure(func, data, size, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        png = func(data, size)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(data, size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak, png
+
+
+def decode(png):
+    return np.asarray(Image.open(BytesIO(png)).convert('L'), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark legacy vs decimated thumbnail generation.")
+    parser.add_argument("--megapixels", type=float, nargs='+', default=[16, 61], help="Frame sizes to test")
+    parser.add_argument("--dtype", choices=['uint16', 'float32'], default='uint16', help="Pixel type of the synthetic frames")
+    parser.add_argument("--nan-fraction", type=float, default=0.0, help="Fraction of NaN pixels (float32 only)")
+    parser.add_argument("--thumb-size", type=int, default=300, help="Thumbnail size in pixels")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per implementation (best is reported)")
+    args = parser.parse_args()
+
+    size = (args.thumb_size, args.thumb_size)
+    print(f"{'MP':>6} {'impl':>8} {'time (s)':>10} {'peak (MB)':>10} {'mean |diff|':>12}")
+    for mp in args.megapixels:
+        data = synthetic_frame(mp, np.dtype(args.dtype), args.nan_fraction)
+        legacy_time, legacy_peak, legacy_png = measure(legacy_make_thumbnail, data, size, args.repeat)
+        fast_time, fast_peak, fast_png = measure(make_thumbnail, data, size, args.repeat)
+        a, b = decode(legacy_png), decode(fast_png)
+        diff = np.abs(a - b).mean() if a.shape == b.shape else float('nan')
+        print(f"{mp:>6g} {'legacy':>8} {legacy_time:>10.3f} {legacy_peak / 2**20:>10.1f} {'':>12}")
+        print(f"{mp:>6g} {'fast':>8} {fast_time:>10.3f} {fast_peak / 2**20:>10.1f} {diff:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
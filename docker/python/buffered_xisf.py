@@ -0,0 +1,40 @@
+import xml.etree.ElementTree as ET
+
+from xisf import XISF
+
+# BufferedXISF overrides private methods of xisf.XISF and reads its private
+# attributes. The xisf version is pinned by the external/xisf submodule
+# commit; the Docker build runs is_compatible() so a submodule update that
+# changes these internals fails the build instead of breaking ingest.
+REQUIRED_INTERNALS = ('_signature', '_headerlength_len', '_reserved_len', '_read', '_analyze_header',
+                      '_read_attached_data_block', '_decompress')
+
+
+def is_compatible():
+    """True when the installed xisf still has the internals BufferedXISF relies on."""
+    return all(hasattr(XISF, name) for name in REQUIRED_INTERNALS)
+
+
+class BufferedXISF(XISF):
+    """XISF reader that parses an in-memory copy of the file instead of reopening it."""
+
+    def __init__(self, buf, fname):
+        self._buf = memoryview(buf)
+        super().__init__(fname)
+
+    def _read(self):
+        pos = len(self._signature)
+        if bytes(self._buf[:pos]) != self._signature:
+            raise ValueError("File doesn't have XISF signature")
+        self._headerlength = int.from_bytes(self._buf[pos:pos + self._headerlength_len], byteorder="little")
+        pos += self._headerlength_len + self._reserved_len
+        self._xisf_header = bytes(self._buf[pos:pos + self._headerlength]).rstrip(b"\0")
+        self._xisf_header_xml = ET.fromstring(self._xisf_header)
+        self._analyze_header()
+
+    def _read_attached_data_block(self, elem):
+        method, pos, size = elem["location"]
+        data = self._buf[pos:pos + size]
+        if "compression" in elem:
+            data = XISF._decompress(data, elem)
+        return data
@@ -0,0 +1,225 @@
+import logging
+import os
+
+logger = logging.getLogger('reindex')
+
+
+def parent_dir(rel_dir):
+    """Parent of a relative directory path; the library root is ''."""
+    return os.path.dirname(rel_dir) if rel_dir else None
+
+
+class DirectoryTree:
+    """Maintains the directories table and its per-directory rollups.
+
+    Every directory that ever held an indexed file has a row, linked to its
+    parent, with counts of the live files directly inside it (file_count,
+    live_count, total_exposure, latest_date_obs) and the same figures for
+    the whole subtree (tree_*). file_count, total_exposure and
+    latest_date_obs only cover visible files, the way the listing does;
+    live_count includes hidden duplicates so folder browsing still shows
+    directories whose files are all hidden.
+
+    directory_facets holds, per directory subtree and (object, filter,
+    imgtype) combination, the same counts and exposure sums so the filter
+    dropdowns and filtered totals are lookups too. Both are refreshed in
+    the caller's transaction, before it commits the file changes.
+
+    Directory ids are cached for the lifetime of the instance.
+    """
+
+    def __init__(self):
+        self.ids = {}
+
+    def ensure(self, cur, rel_dir):
+        """Return the id of rel_dir, creating it and any missing ancestors."""
+        dir_id = self.ids.get(rel_dir)
+        if dir_id is not None:
+            return dir_id
+        parent = parent_dir(rel_dir)
+        parent_id = self.ensure(cur, parent) if parent is not None else None
+        cur.execute(
+            "INSERT IGNORE INTO directories (parent_id, path, name, depth) VALUES (%s, %s, %s, %s)",
+            (parent_id, rel_dir, os.path.basename(rel_dir), rel_dir.count('/') + 1 if rel_dir else 0)
+        )
+        cur.execute("SELECT id FROM directories WHERE path = %s", (rel_dir,))
+        dir_id = cur.fetchone()[0]
+        self.ids[rel_dir] = dir_id
+        return dir_id
+
+    def forget(self):
+        self.ids.clear()
+
+    def refresh(self, cur, dir_ids, batch_size=500):
+        """Recompute the rollups of dir_ids and of all their ancestors.
+
+        Direct figures come from one grouped pass over the files of the
+        touched directories. Subtree figures are then rebuilt one depth
+        level at a time, deepest first, from each directory's own figures
+        plus its children's subtree figures; the facet rows are rebuilt the
+        same way.
+        """
+        dir_ids = {d for d in dir_ids if d is not None}
+        if not dir_ids:
+            return
+        for i in range(0, len(dir_ids), batch_size):
+            batch = tuple(list(dir_ids)[i:i + batch_size])
+            placeholders = ','.join(['%s'] * len(batch))
+            cur.execute(f"""
+                UPDATE directories SET
+                    file_count = (SELECT COUNT(*) FROM files WHERE files.directory_id = directories.id AND files.deleted_at IS NULL AND files.is_hidden = 0),
+                    live_count = (SELECT COUNT(*) FROM files WHERE files.directory_id = directories.id AND files.deleted_at IS NULL),
+                    total_exposure = (SELECT COALESCE(SUM(exptime), 0) FROM files WHERE files.directory_id = directories.id AND files.deleted_at IS NULL AND files.is_hidden = 0),
+                    latest_date_obs = (SELECT MAX(date_obs) FROM files WHERE files.directory_id = directories.id AND files.deleted_at IS NULL AND files.is_hidden = 0)
+                WHERE id IN ({placeholders})
+            """, batch)
+
+        # Walk up to the root collecting every ancestor by depth.
+        levels = {}
+        pending = dir_ids
+        while pending:
+            placeholders = ','.join(['%s'] * len(pending))
+            cur.execute(f"SELECT id, parent_id, depth FROM directories WHERE id IN ({placeholders})", tuple(pending))
+            parents = set()
+            for dir_id, parent_id, depth in cur.fetchall():
+                levels.setdefault(depth, set()).add(dir_id)
+                if parent_id is not None:
+                    parents.add(parent_id)
+            seen = set().union(*levels.values())
+            pending = parents - seen
+
+        for depth in sorted(levels, reverse=True):
+            batch = tuple(levels[depth])
+            placeholders = ','.join(['%s'] * len(batch))
+            self._refresh_facets(cur, batch)
+            cur.execute(f"""
+                UPDATE directories SET
+                    tree_file_count = file_count + (SELECT COALESCE(SUM(c.tree_file_count), 0) FROM directories c WHERE c.parent_id = directories.id),
+                    tree_live_count = live_count + (SELECT COALESCE(SUM(c.tree_live_count), 0) FROM directories c WHERE c.parent_id = directories.id),
+                    tree_exposure = total_exposure + (SELECT COALESCE(SUM(c.tree_exposure), 0) FROM directories c WHERE c.parent_id = directories.id),
+                    tree_latest_date_obs = (SELECT MAX(d) FROM (
+                        SELECT latest_date_obs AS d FROM directories s WHERE s.id = directories.id
+                        UNION ALL SELECT c.tree_latest_date_obs FROM directories c WHERE c.parent_id = directories.id
+                    ) AS t)
+                WHERE id IN ({placeholders})
+            """, batch)
+
+    def _refresh_facets(self, cur, dir_ids):
+        """Rebuild the facet rows of dir_ids from their own files and their children's facets."""
+        placeholders = ','.join(['%s'] * len(dir_ids))
+        cur.execute(f"DELETE FROM directory_facets WHERE directory_id IN ({placeholders})", dir_ids)
+        cur.execute(f"""
+            INSERT INTO directory_facets (directory_id, object, filter, imgtype, file_count, live_count, total_exposure)
+            SELECT dir_id, object, filter, imgtype, SUM(file_count), SUM(live_count), SUM(total_exposure)
+            FROM (
+                SELECT directory_id AS dir_id, COALESCE(object, '') AS object, COALESCE(filter, '') AS filter,
+                       COALESCE(imgtype, '') AS imgtype, SUM(is_hidden = 0) AS file_count, COUNT(*) AS live_count,
+                       SUM(IF(is_hidden = 0, COALESCE(exptime, 0), 0)) AS total_exposure
+                FROM files
+                WHERE deleted_at IS NULL AND directory_id IN ({placeholders})
+                GROUP BY directory_id, COALESCE(object, ''), COALESCE(filter, ''), COALESCE(imgtype, '')
+                UNION ALL
+                SELECT c.parent_id, f.object, f.filter, f.imgtype, f.file_count, f.live_count, f.total_exposure
+                FROM directory_facets f JOIN directories c ON c.id = f.directory_id
+                WHERE c.parent_id IN ({placeholders})
+            ) AS x
+            GROUP BY dir_id, object, filter, imgtype
+        """, dir_ids + dir_ids)
+
+    def rebuild(self, conn, cur):
+        """Recompute every rollup and facet row from scratch."""
+        cur.execute("SELECT id FROM directories")
+        dir_ids = {row[0] for row in cur.fetchall()}
+        if dir_ids:
+            logger.info(f"Rebuilding rollups and facets for {len(dir_ids)} directories...")
+            self.refresh(cur, dir_ids)
+            conn.commit()
+
+    def ensure_facets(self, conn, cur):
+        """Build the facet table once for databases that predate it."""
+        cur.execute("SELECT 1 FROM directory_facets LIMIT 1")
+        has_facets = cur.fetchone() is not None
+        cur.execute("SELECT 1 FROM files WHERE deleted_at IS NULL LIMIT 1")
+        if not has_facets and cur.fetchone() is not None:
+            self.rebuild(conn, cur)
+
+    def refresh_stale(self, conn, cur):
+        """Refresh the directories the web app marked stale and commit.
+
+        Hiding or showing files only flags their directories, so the rollup
+        SQL lives here alone. The flags are cleared and committed before the
+        refresh, which then runs in a new transaction: changes committed
+        with a flag are always visible to it, and a directory flagged again
+        meanwhile is picked up by the next call; a failed refresh flags its
+        directories again. Returns the number of directories refreshed.
+        """
+        cur.execute("SELECT id FROM directories WHERE stale = 1")
+        dir_ids = {row[0] for row in cur.fetchall()}
+        if not dir_ids:
+            return 0
+        placeholders = ','.join(['%s'] * len(dir_ids))
+        cur.execute(f"UPDATE directories SET stale = 0 WHERE id IN ({placeholders})", tuple(dir_ids))
+        conn.commit()
+        try:
+            self.refresh(cur, dir_ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            cur.execute(f"UPDATE directories SET stale = 1 WHERE id IN ({placeholders})", tuple(dir_ids))
+            conn.commit()
+            raise
+        return len(dir_ids)
+
+    def refresh_paths(self, cur, rel_paths):
+        """Refresh the directories holding rel_paths (which must already exist)."""
+        dir_ids = {self.ids.get(os.path.dirname(p)) for p in rel_paths}
+        missing = {os.path.dirname(p) for p in rel_paths} - set(self.ids)
+        for rel_dir in missing:
+            cur.execute("SELECT id FROM directories WHERE path = %s", (rel_dir,))
+            row = cur.fetchone()
+            if row is not None:
+                self.ids[rel_dir] = row[0]
+                dir_ids.add(row[0])
+        self.refresh(cur, dir_ids)
+
+    def backfill(self, conn, cur, batch_size=1000):
+        """Link rows indexed before the directories table existed.
+
+        Returns the number of rows that were assigned a directory.
+        """
+        cur.execute("SELECT id, path FROM files WHERE directory_id IS NULL")
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+        logger.info(f"Building directory tree for {len(rows)} existing files...")
+        by_dir = {}
+        for file_id, path in rows:
+            by_dir.setdefault(os.path.dirname(path), []).append(file_id)
+        for rel_dir, file_ids in by_dir.items():
+            dir_id = self.ensure(cur, rel_dir)
+            for i in range(0, len(file_ids), batch_size):
+                batch = tuple(file_ids[i:i + batch_size])
+                placeholders = ','.join(['%s'] * len(batch))
+                cur.execute(f"UPDATE files SET directory_id = %s WHERE id IN ({placeholders})", (dir_id,) + batch)
+        self.refresh(cur, {self.ids[d] for d in by_dir})
+        conn.commit()
+        return len(rows)
+
+    def prune(self, conn, cur):
+        """Delete directory rows that no longer hold any file row, leaves first."""
+        removed = 0
+        while True:
+            cur.execute("""
+                DELETE FROM directories
+                WHERE parent_id IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM files WHERE files.directory_id = directories.id)
+                  AND NOT EXISTS (SELECT 1 FROM (SELECT parent_id FROM directories) AS c WHERE c.parent_id = directories.id)
+            """)
+            if cur.rowcount <= 0:
+                break
+            removed += cur.rowcount
+        if removed:
+            cur.execute("DELETE FROM directory_facets WHERE NOT EXISTS (SELECT 1 FROM directories WHERE directories.id = directory_facets.directory_id)")
+            conn.commit()
+            self.forget()
+        return removed
@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+
+def write_atomic(path, payload):
+    """Write bytes or text to path through a temporary file and a rename.
+
+    Readers (nginx, the node_exporter textfile collector) only ever see the
+    old or the complete new file. The directory is created if needed.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
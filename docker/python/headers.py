@@ -0,0 +1,178 @@
+import os
+import re
+import struct
+import xml.etree.ElementTree as ET
+
+FITS_BLOCK = 2880
+FITS_CARD = 80
+XISF_SIGNATURE = b'XISF0100'
+XISF_PREAMBLE = 16  # signature + header length + reserved
+XISF_NS = {'xisf': 'http://www.pixinsight.com/xisf'}
+
+_ATTACHMENT_RE = re.compile(rb'location="attachment:(\d+):(\d+)"')
+_INT_RE = re.compile(r'[+-]?\d+$')
+_FLOAT_RE = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[EeDd][+-]?\d+)?$')
+
+
+# --- FITS ---
+def read_fits_header_blocks(f, max_blocks=1000):
+    """Read 2880-byte header blocks from the current position up to the END card.
+
+    Returns the raw header bytes, or None when the file ends before an END
+    card is found.
+    """
+    header = bytearray()
+    for _ in range(max_blocks):
+        block = f.read(FITS_BLOCK)
+        if len(block) < FITS_BLOCK:
+            return None
+        header += block
+        for i in range(0, FITS_BLOCK, FITS_CARD):
+            if block[i:i + 8] == b'END     ':
+                return bytes(header)
+    return None
+
+
+def _card_int(header, keyword, default=None):
+    key = keyword.ljust(8).encode('ascii')
+    for i in range(0, len(header), FITS_CARD):
+        if header[i:i + 8] == key and header[i + 8:i + 10] == b'= ':
+            value = header[i + 10:i + FITS_CARD].split(b'/')[0].strip()
+            try:
+                return int(value)
+            except ValueError:
+                return default
+    return default
+
+
+def _card_value(text):
+    """Value of a FITS card from column 11 on, the way astropy reads it.
+
+    Strings lose their quotes and trailing blanks ('' is a quote), T and F
+    become booleans and numbers int or float. Anything else (undefined,
+    complex) is None.
+    """
+    stripped = text.lstrip()
+    if stripped.startswith("'"):
+        chars, i = [], 1
+        while i < len(stripped):
+            c = stripped[i]
+            if c == "'":
+                if stripped[i + 1:i + 2] != "'":
+                    break
+                i += 1
+            chars.append(c)
+            i += 1
+        return ''.join(chars).rstrip()
+    value = stripped.split('/', 1)[0].strip()
+    if value == 'T':
+        return True
+    if value == 'F':
+        return False
+    if _INT_RE.match(value):
+        return int(value)
+    if _FLOAT_RE.match(value):
+        return float(value.replace('D', 'E').replace('d', 'e'))
+    return None
+
+
+def fits_card_values(header, keywords):
+    """Values of the given keywords in a raw FITS header, without building an astropy Header.
+
+    Only the first card of each keyword counts, like astropy's
+    Header.get(); long strings continued over CONTINUE cards are joined.
+    Returns {keyword: value} for the keywords that are present.
+    """
+    wanted = {k.ljust(8).encode('ascii'): k for k in keywords}
+    values = {}
+    for i in range(0, len(header), FITS_CARD):
+        name = wanted.get(header[i:i + 8])
+        if name is None or name in values or header[i + 8:i + 10] != b'= ':
+            continue
+        value = _card_value(header[i + 10:i + FITS_CARD].decode('ascii', 'replace'))
+        j = i + FITS_CARD
+        while isinstance(value, str) and value.endswith('&') and header[j:j + 8] == b'CONTINUE':
+            more = _card_value(header[j + 8:j + FITS_CARD].decode('ascii', 'replace'))
+            value = value[:-1] + (more if isinstance(more, str) else '')
+            j += FITS_CARD
+        values[name] = value
+    return values
+
+
+def fits_data_size(header):
+    """Size in bytes of the data unit described by a raw FITS header."""
+    naxis = _card_int(header, 'NAXIS', 0)
+    if not naxis:
+        return 0
+    bitpix = _card_int(header, 'BITPIX', 8)
+    pixels = 1
+    for n in range(1, naxis + 1):
+        pixels *= _card_int(header, f'NAXIS{n}', 0)
+    pcount = _card_int(header, 'PCOUNT', 0)
+    gcount = _card_int(header, 'GCOUNT', 1)
+    return abs(bitpix) // 8 * gcount * (pcount + pixels)
+
+
+def fits_is_complete(path):
+    """True when the primary HDU's header has an END card and its data is fully on disk."""
+    with open(path, 'rb') as f:
+        header = read_fits_header_blocks(f)
+        if header is None:
+            return False
+        size = os.fstat(f.fileno()).st_size
+    return size >= len(header) + fits_data_size(header)
+
+
+# --- XISF ---
+def read_xisf_header(f):
+    """Read the XML header of an XISF file, or None if it is not all on disk yet."""
+    preamble = f.read(XISF_PREAMBLE)
+    if len(preamble) < XISF_PREAMBLE or preamble[:8] != XISF_SIGNATURE:
+        return None
+    (length,) = struct.unpack('<I', preamble[8:12])
+    xml = f.read(length)
+    if len(xml) < length:
+        return None
+    return xml
+
+
+def xisf_fits_keywords(xml):
+    """FITS keywords of the first image in an XISF header, or None without an image.
+
+    The result has the same shape as the xisf package's 'FITSKeywords'
+    metadata: {name: [{'value': ..., 'comment': ...}, ...]}.
+    """
+    root = ET.fromstring(xml.rstrip(b'\0'))
+    image = root.find('xisf:Image', XISF_NS)
+    if image is None:
+        return None
+    keywords = {}
+    for kw in image.findall('xisf:FITSKeyword', XISF_NS):
+        keywords.setdefault(kw.attrib['name'], []).append({
+            'value': kw.attrib['value'].strip("'").strip(' '),
+            'comment': kw.attrib['comment'],
+        })
+    return keywords
+
+
+def xisf_is_complete(path):
+    """True when the XISF header and every attached data block lie within the file."""
+    with open(path, 'rb') as f:
+        xml = read_xisf_header(f)
+        if xml is None:
+            return False
+        size = os.fstat(f.fileno()).st_size
+    return all(int(pos) + int(length) <= size for pos, length in _ATTACHMENT_RE.findall(xml))
+
+
+def is_complete(path):
+    """Best-effort check that a capture program has finished writing path."""
+    lower = path.lower()
+    try:
+        if lower.endswith(('.fits', '.fit')):
+            return fits_is_complete(path)
+        if lower.endswith('.xisf'):
+            return xisf_is_complete(path)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,1541 @@
+import os
+import heapq
+import itertools
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+import mysql.connector
+import numpy as np
+import xxhash
+
+from manifest import Manifest, db_fingerprint
+from metrics import CountingCursor, Metrics
+from scanner import VALID_EXTS, walk_tree, is_settled
+from directories import DirectoryTree
+from headers import fits_card_values, read_fits_header_blocks, read_xisf_header, xisf_fits_keywords
+from metadata import COLUMNS, KEYWORDS, header_values, normalize, parse_date_obs, xisf_values
+from schema import migrate
+from thumbnails import link_thumbnails, make_thumbnail, supported_format, thumbnails_exist, write_thumbnails
+
+logger = logging.getLogger('reindex')
+
+# --- Lazy imports ---
+# astropy and xisf account for most of the start-up time and are only needed
+# once a file is parsed, so a pass with nothing to index never loads them.
+fits = XISF = BufferedXISF = None
+
+def load_decoders():
+    global fits, XISF, BufferedXISF
+    if fits is None:
+        from astropy.io import fits as _fits
+        from xisf import XISF as _XISF
+        from buffered_xisf import BufferedXISF as _BufferedXISF, is_compatible
+        if not is_compatible():
+            # Never expected in the image, whose build checks it.
+            logger.warning("The installed xisf package changed its internals, XISF files are read from disk")
+            _BufferedXISF = None
+        fits, XISF, BufferedXISF = _fits, _XISF, _BufferedXISF
+
+# --- Hash function ---
+def calculate_hash(filepath, block_size=65536):
+    hasher = xxhash.xxh64()
+    with open(filepath, 'rb') as f:
+        while True:
+            buf = f.read(block_size)
+            if not buf:
+                break
+            hasher.update(buf)
+    return hasher.hexdigest()
+
+# Fingerprints carry this suffix so they can never equal a full hash.
+FINGERPRINT_SUFFIX = '-fp'
+
+def fingerprint_hash(filepath, sample_size=65536, samples=4):
+    """Hash the file size, its first block (the header) and a few fixed samples.
+
+    Returns (hash, kind). kind is 'fp' for a fingerprint and 'xxh64' when
+    the file is small enough to be hashed in full anyway.
+    """
+    size = os.path.getsize(filepath)
+    if size <= sample_size * (samples + 2):
+        return calculate_hash(filepath), 'xxh64'
+    hasher = xxhash.xxh64(str(size).encode('ascii'))
+    offsets = [0] + [size * i // (samples + 1) for i in range(1, samples + 1)] + [size - sample_size]
+    with open(filepath, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            hasher.update(f.read(sample_size))
+    return hasher.hexdigest() + FINGERPRINT_SUFFIX, 'fp'
+
+def hash_file(filepath, kind):
+    """Hash a file the way a row of the given hash_kind was hashed."""
+    if kind == 'fp':
+        return fingerprint_hash(filepath)[0]
+    return calculate_hash(filepath)
+
+def hash_kind(file_hash):
+    return 'fp' if file_hash.endswith(FINGERPRINT_SUFFIX) else 'xxh64'
+
+def read_file(filepath):
+    """Read a whole file in one pass and return (data, xxh64 hex digest).
+
+    The digest is identical to calculate_hash(), so rows indexed in either
+    mode keep grouping as duplicates of each other.
+    """
+    with open(filepath, 'rb') as f:
+        buf = f.read()
+    return buf, xxhash.xxh64(buf).hexdigest()
+
+# --- Rate limiting ---
+class RateLimiter:
+    """Spreads work out to at most `rate` units (rows, bytes) per second; 0 means unlimited.
+
+    spend() books finished work and delay() tells how long to wait before
+    the next piece; pause() does both and sleeps.
+    """
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.next_time = time.monotonic()
+
+    def spend(self, units):
+        if self.rate > 0:
+            self.next_time = max(self.next_time, time.monotonic()) + units / self.rate
+
+    def delay(self):
+        if self.rate <= 0:
+            return 0.0
+        return max(0.0, self.next_time - time.monotonic())
+
+    def pause(self, units):
+        self.spend(units)
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+# --- Database cleanup functions ---
+# Cleanup works in transactions of chunk_rows rows so the row locks it takes
+# never stall the web listing for long; an optional RateLimiter spaces the
+# chunks out further.
+def soft_delete_missing_files(conn, cur, db_files, disk_files, manifest=None, dirs=None, chunk_rows=500, limiter=None):
+    logger.info("Marking missing files as deleted (soft delete)...")
+    db_paths = {p for p, f in db_files.items() if f['deleted_at'] is None}
+    disk_paths = set(disk_files.keys())
+    missing_paths = db_paths - disk_paths
+    
+    if not missing_paths:
+        logger.info("Soft delete complete. No missing files to mark.")
+        return 0
+
+    missing_paths_list = list(missing_paths)
+    update_time = datetime.now()
+
+    for i in range(0, len(missing_paths_list), chunk_rows):
+        batch_paths = tuple(missing_paths_list[i:i+chunk_rows])
+        format_strings = ','.join(['%s'] * len(batch_paths))
+        cur.execute(f"SELECT DISTINCT file_hash, directory_id FROM files WHERE path IN ({format_strings})", batch_paths)
+        hashes_to_update, dirs_to_update = set(), set()
+        for row in cur.fetchall():
+            hashes_to_update.add(row[0])
+            dirs_to_update.add(row[1])
+        cur.execute(f"UPDATE files SET deleted_at = %s WHERE path IN ({format_strings})", (update_time,) + batch_paths)
+        update_duplicate_counts(cur, hashes_to_update)
+        if dirs is not None:
+            dirs.refresh(cur, dirs_to_update)
+        conn.commit()
+        for path in batch_paths:
+            db_files[path]['deleted_at'] = update_time
+        if manifest is not None:
+            manifest.remove_files(batch_paths)
+            manifest.commit()
+        if limiter is not None:
+            limiter.pause(len(batch_paths))
+
+    logger.info(f"Soft delete complete. Marked {len(missing_paths)} files as deleted.")
+    return len(missing_paths)
+
+def purge_chunk(conn, cur, retention_days, chunk_rows=500):
+    """Permanently remove up to chunk_rows rows soft-deleted more than retention_days ago.
+
+    Runs as one transaction and returns the number of rows removed; 0 means
+    nothing is left to purge.
+    """
+    cur.execute("SELECT id, file_hash FROM files WHERE deleted_at < NOW() - INTERVAL %s DAY ORDER BY id LIMIT %s",
+                (retention_days, chunk_rows))
+    rows = cur.fetchall()
+    if not rows:
+        return 0
+    ids = tuple(row[0] for row in rows)
+    cur.execute(f"DELETE FROM files WHERE id IN ({','.join(['%s'] * len(ids))})", ids)
+    update_duplicate_counts(cur, {row[1] for row in rows})
+    conn.commit()
+    return len(ids)
+
+def purge_deleted_files(conn, cur, retention_days, dirs=None, chunk_rows=500, limiter=None):
+    if retention_days <= 0:
+        logger.info("Purge skipped as retention_days is zero or less.")
+        return 0
+        
+    logger.info(f"Purging files deleted more than {retention_days} days ago...")
+    removed_count = 0
+    while True:
+        removed = purge_chunk(conn, cur, retention_days, chunk_rows)
+        if not removed:
+            break
+        removed_count += removed
+        if limiter is not None:
+            limiter.pause(removed)
+
+    if removed_count > 0:
+        logger.info(f"Permanently removed {removed_count} files and updated their duplicate counts.")
+        if dirs is not None:
+            pruned = dirs.prune(conn, cur)
+            if pruned:
+                logger.info(f"Removed {pruned} empty directories from the directory tree.")
+    else:
+        logger.info("Purge complete. No old files to remove.")
+    
+    return removed_count
+
+def update_duplicate_counts(cur, file_hashes, batch_size=500):
+    """Recompute duplicate counts for every row sharing one of file_hashes.
+
+    Each batch of hashes is handled by a single UPDATE joined against a
+    GROUP BY file_hash aggregate, instead of three statements per hash.
+    Returns the number of rows whose counts changed.
+    """
+    hashes = [h for h in set(file_hashes) if h]
+    changed = 0
+    for i in range(0, len(hashes), batch_size):
+        batch = tuple(hashes[i:i+batch_size])
+        format_strings = ','.join(['%s'] * len(batch))
+        try:
+            cur.execute(f"""
+                UPDATE files f
+                JOIN (
+                    SELECT file_hash,
+                           SUM(deleted_at IS NULL) AS total_count,
+                           SUM(deleted_at IS NULL AND is_hidden = 0) AS visible_count
+                    FROM files
+                    WHERE file_hash IN ({format_strings})
+                    GROUP BY file_hash
+                ) c ON f.file_hash = c.file_hash
+                SET f.total_duplicate_count = c.total_count, f.visible_duplicate_count = c.visible_count
+            """, batch)
+            changed += max(cur.rowcount, 0)
+        except mysql.connector.Error as err:
+            logger.error(f"Error updating duplicate counts for {len(batch)} hashes: {err}")
+    return changed
+
+def read_header_only(full_path, buf, file_lower):
+    """Read the schema keywords of a FITS/XISF file from its header, without touching pixel data.
+
+    FITS cards are parsed straight from the header blocks. Returns
+    {keyword: value} like metadata.header_values(), or None when the header
+    cannot be read this way and the file should go through the full readers.
+    """
+    with (BytesIO(buf) if buf is not None else open(full_path, 'rb')) as f:
+        if file_lower.endswith(('.fits', '.fit')):
+            raw = read_fits_header_blocks(f)
+            if raw is None:
+                return None
+            return fits_card_values(raw, KEYWORDS)
+        xml = read_xisf_header(f)
+    if xml is None:
+        return None
+    keywords = xisf_fits_keywords(xml)
+    if keywords is None:
+        return None
+    return xisf_values(keywords)
+
+# --- Read-ahead ---
+def _timed_read(filepath):
+    started = time.perf_counter()
+    buf, file_hash = read_file(filepath)
+    return buf, file_hash, time.perf_counter() - started
+
+def prefetch_files(tasks, max_bytes, threads=4, max_file_bytes=0):
+    """Read whole files ahead of the consumer in a thread pool.
+
+    Yields (task, buf, file_hash, seconds, error) in task order. A read is
+    started only while the bytes in flight stay under max_bytes, except
+    that a single file larger than the cap is still read on its own. Files
+    larger than max_file_bytes (when set) are not read; they are yielded
+    with buf None for the consumer to read from disk.
+    """
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        in_flight = deque()
+        in_bytes = 0
+        for task in tasks:
+            size = task[4] if not max_file_bytes or task[4] <= max_file_bytes else 0
+            while in_flight and (in_bytes + size > max_bytes or len(in_flight) >= threads * 2):
+                done, future, done_size = in_flight.popleft()
+                in_bytes -= done_size
+                yield _prefetched(done, future)
+            in_flight.append((task, pool.submit(_timed_read, task[0]) if size else None, size))
+            in_bytes += size
+        while in_flight:
+            done, future, _ = in_flight.popleft()
+            yield _prefetched(done, future)
+
+def _prefetched(task, future):
+    if future is None:
+        return task, None, None, 0.0, None
+    try:
+        buf, file_hash, seconds = future.result()
+        return task, buf, file_hash, seconds, None
+    except Exception as e:
+        return task, None, None, 0.0, e
+
+# --- Bounded decoding ---
+def within_budget(nbytes, budget):
+    """True when nbytes may be held in memory under a decode budget (0 = unlimited)."""
+    return not budget or nbytes <= budget
+
+def map_xisf_image(full_path, meta):
+    """Memory-map an uncompressed, attached XISF image the way XISF.read_image() returns it.
+
+    Returns None when the image is compressed or not stored as an
+    attachment, in which case it has to be decoded into memory.
+    """
+    location = meta['location']
+    if location[0] != 'attachment' or 'compression' in meta:
+        return None
+    w, h, channels = meta['geometry']
+    planes = np.memmap(full_path, dtype=meta['dtype'], mode='r', offset=location[1], shape=(channels, h, w))
+    return np.transpose(planes, (1, 2, 0))
+
+# --- File extraction (runs in worker processes) ---
+def file_metadata(values, rel_path):
+    """The files columns for the header values of the file at rel_path, DATE-OBS parsed."""
+    meta = normalize(values)
+    if meta['date_obs'] is not None:
+        date_obs_str, meta['date_obs'] = meta['date_obs'], None
+        try:
+            meta['date_obs'] = parse_date_obs(date_obs_str)
+        except ValueError:
+            logger.warning(f"Unparsable DATE-OBS: '{date_obs_str}' in {rel_path}")
+    return meta
+
+def extract_file(task, options, prefetched=None):
+    """Hash, decode and thumbnail a single file.
+
+    Returns the parameters for the files upsert, or None when the file has no
+    usable image. This function does not touch the database so it can run in a
+    worker process.
+
+    In header-only mode the pixel data is skipped whenever a thumbnail can be
+    reused: static thumbnails already rendered for the hash, or, without a
+    thumbnail directory, the BLOB of another row with the same hash. The
+    latter is flagged with needs_thumb for the writer to resolve.
+
+    prefetched is an already read (buffer, hash) pair from prefetch_files().
+
+    Pixel data read from disk is memory-mapped and FITS scaling is applied
+    after binning, so decoding a frame holds little more than a strip of it
+    in memory. A frame that would have to be decoded into memory (a
+    compressed XISF image) beyond decode_budget_mb is indexed from its
+    header only, without a thumbnail; files are only read into a buffer
+    (single_pass, prefetch) when twice their size fits the budget.
+    The time spent hashing, opening, thumbnailing and reading the header is
+    returned in 'timings' for the writer's metrics.
+    """
+    load_decoders()
+    full_path, rel_path, file, mtime, file_size = task
+    file_lower = file.lower()
+    timings = {}
+    started = time.perf_counter()
+
+    # In single-pass mode the file is read once and the same buffer feeds the
+    # hasher and the FITS/XISF parser; otherwise both read from disk.
+    buf = None
+    kind = 'xxh64'
+    budget = options['decode_budget_mb'] * 1024 * 1024
+    if prefetched is not None:
+        buf, file_hash = prefetched
+    elif options['single_pass'] and within_budget(2 * file_size, budget):
+        buf, file_hash = read_file(full_path)
+    elif options['fingerprint']:
+        file_hash, kind = fingerprint_hash(full_path)
+    else:
+        file_hash = calculate_hash(full_path)
+    values, data = {}, None
+    timings['hash'] = time.perf_counter() - started
+    started = time.perf_counter()
+
+    # Static thumbnails are keyed by content hash: when a duplicate frame
+    # already produced them the pixel data does not need to be decoded.
+    thumb_dir = options['thumb_dir']
+    thumb_sizes = options['thumb_sizes']
+    thumb_format = options['thumb_format']
+    have_thumbs = bool(thumb_dir) and thumbnails_exist(thumb_dir, file_hash, thumb_sizes, thumb_format)
+
+    parsed = None
+    bscale, bzero = 1.0, 0.0
+    if options['header_only'] and (have_thumbs or not thumb_dir):
+        parsed = read_header_only(full_path, buf, file_lower)
+    if parsed is not None:
+        values = parsed
+    elif file_lower.endswith(('.fits', '.fit')):
+        with fits.open(BytesIO(buf) if buf is not None else full_path, ignore_missing_end=True,
+                       memmap=True, do_not_scale_image_data=True) as hdul:
+            header = hdul[0].header
+            values = header_values(header)
+            if not have_thumbs:
+                data = hdul[0].data
+                bscale, bzero = header.get('BSCALE', 1.0), header.get('BZERO', 0.0)
+    elif file_lower.endswith('.xisf'):
+        xisf_file = BufferedXISF(buf, full_path) if buf is not None and BufferedXISF is not None else XISF(full_path)
+        images_meta = xisf_file.get_images_metadata()
+        if not images_meta:
+            logger.warning(f"No image metadata in XISF file: {rel_path}")
+            return None
+        values = xisf_values(images_meta[0].get('FITSKeywords', {}))
+        if not have_thumbs:
+            data = map_xisf_image(full_path, images_meta[0]) if buf is None else None
+            if data is None:
+                w, h, channels = images_meta[0]['geometry']
+                pixel_bytes = w * h * channels * images_meta[0]['dtype'].itemsize
+                if within_budget(file_size + pixel_bytes, budget):
+                    data = xisf_file.read_image(0)
+                else:
+                    logger.warning(f"{rel_path}: decoding {pixel_bytes / 1048576:.0f} MB of pixel data exceeds "
+                                   f"the decode budget, indexing its header only")
+    timings['open'] = time.perf_counter() - started
+    started = time.perf_counter()
+
+    thumb = None
+    if data is not None:
+        data = np.squeeze(data)
+        if data.ndim > 2 and data.shape[0] < 5:
+            data = data[0]
+        if data.ndim >= 2:
+            if thumb_dir:
+                have_thumbs = write_thumbnails(thumb_dir, file_hash, data, thumb_sizes, thumb_format, bscale, bzero)
+            else:
+                thumb = make_thumbnail(data, options['thumb_size'], bscale, bzero)
+        timings['thumbnail'] = time.perf_counter() - started
+    started = time.perf_counter()
+
+    meta = file_metadata(values, rel_path)
+    params = {
+        'path': rel_path, 'file_hash': file_hash, 'hash_kind': kind, 'name': file, 'mtime': mtime, 'file_size': file_size,
+        **meta,
+        'thumb': thumb,
+        'thumb_format': thumb_format if have_thumbs else None,
+        'thumb_sizes': ','.join(str(size) for size in sorted(thumb_sizes)) if have_thumbs else None,
+        'needs_thumb': parsed is not None and not have_thumbs,
+        'timings': timings
+    }
+    timings['header'] = time.perf_counter() - started
+    return params
+
+def extract_files(tasks, options, workers):
+    """Yield (task, params, error) for each task, in submission order.
+
+    With more than one worker the extraction runs in a process pool. At most
+    two tasks per worker are in flight so memory stays bounded while the
+    single writer in the main process keeps the pool busy. A single process
+    can instead read ahead in threads (prefetch_mb), so the next files are
+    fetched while the current one is decoded and written.
+    """
+    prefetch = options['prefetch_mb'] > 0 and not options['header_only'] and not options['fingerprint']
+    if workers <= 1 and prefetch:
+        max_file_bytes = options['decode_budget_mb'] * 1024 * 1024 // 2
+        for task, buf, file_hash, seconds, error in prefetch_files(tasks, options['prefetch_mb'] * 1024 * 1024,
+                                                                   options['prefetch_threads'], max_file_bytes):
+            if error is not None:
+                yield task, None, error
+                continue
+            try:
+                params = extract_file(task, options, (buf, file_hash) if buf is not None else None)
+                if params is not None:
+                    params['timings']['hash'] = seconds
+                yield task, params, None
+            except Exception as e:
+                yield task, None, e
+        return
+    if workers <= 1:
+        for task in tasks:
+            try:
+                yield task, extract_file(task, options), None
+            except Exception as e:
+                yield task, None, e
+        return
+
+    # 'spawn' keeps the workers from inheriting the parent's database socket.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        in_flight = deque()
+        max_in_flight = workers * 2
+        for task in tasks:
+            in_flight.append((task, pool.submit(extract_file, task, options)))
+            while len(in_flight) >= max_in_flight:
+                yield _collect(*in_flight.popleft())
+        while in_flight:
+            yield _collect(*in_flight.popleft())
+
+def _collect(task, future):
+    try:
+        return task, future.result(), None
+    except Exception as e:
+        return task, None, e
+
+# --- Ingest queue ---
+# Priority tiers: paths the watcher reported while a pass was running, files
+# modified within RECENT_DAYS, and the cold backfill of everything older.
+URGENT, RECENT, BACKFILL = 0, 1, 2
+RECENT_DAYS = 2
+
+class IngestQueue:
+    """Hands out extraction tasks by priority instead of in walk order.
+
+    Within a tier the most recently modified file comes first, so tonight's
+    frames are searchable before the archive is backfilled. feed, when
+    given, is called at most once per feed_interval seconds while tasks are
+    handed out and returns new tasks, which go first. A path queued again
+    with a newer mtime or size supersedes its older task.
+    """
+
+    def __init__(self, tasks=(), feed=None, feed_interval=1.0):
+        self.heap = []
+        self.order = itertools.count()
+        self.latest = {}
+        self.recent_since = time.time() - RECENT_DAYS * 86400
+        self.feed = feed
+        self.feed_interval = feed_interval
+        self.last_feed = time.monotonic()
+        for task in tasks:
+            self.push(task)
+
+    def push(self, task, tier=None):
+        if tier is None:
+            tier = RECENT if task[3] >= self.recent_since else BACKFILL
+        self.latest[task[1]] = (task[3], task[4])
+        heapq.heappush(self.heap, (tier, -task[3], next(self.order), task))
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        handed = {}
+        while True:
+            if self.feed is not None and time.monotonic() - self.last_feed >= self.feed_interval:
+                self.last_feed = time.monotonic()
+                for task in self.feed():
+                    self.push(task, URGENT)
+            if not self.heap:
+                return
+            task = heapq.heappop(self.heap)[3]
+            key = (task[3], task[4])
+            if self.latest.get(task[1]) != key or handed.get(task[1]) == key:
+                continue
+            handed[task[1]] = key
+            yield task
+
+class ScanCheckpoint:
+    """Saves the progress of a full pass in the manifest while files are still being written.
+
+    A directory is recorded with the mtime seen by the walk once every file
+    queued from it has been written, so a pass that is killed resumes from
+    the manifest without listing or stating those directories again.
+    Directories with pending files, errors or rows whose file is gone are
+    stored without an mtime until then, and the fingerprint is updated with
+    each save so the manifest stays trusted.
+    """
+
+    def __init__(self, manifest, cur, dir_mtimes, scan_start, interval=30.0):
+        self.manifest = manifest
+        self.cur = cur
+        self.dir_mtimes = dir_mtimes
+        self.scan_start = scan_start
+        self.interval = interval
+        self.pending = {}
+        self.dirty = set()
+        self.finished = set()
+        self.last_save = time.monotonic()
+
+    def start(self, tasks, dirty_dirs):
+        for task in tasks:
+            self.expect(task[1])
+        self.dirty.update(dirty_dirs)
+        self.manifest.replace_dirs({d: mtime_ns if self._complete(d) else None for d, mtime_ns in self.dir_mtimes.items()})
+        self._save()
+
+    def expect(self, rel_path):
+        self.pending.setdefault(os.path.dirname(rel_path), set()).add(rel_path)
+
+    def done(self, rel_path, ok=True):
+        rel_dir = os.path.dirname(rel_path)
+        if not ok:
+            self.dirty.add(rel_dir)
+        paths = self.pending.get(rel_dir)
+        if paths is None:
+            return
+        paths.discard(rel_path)
+        if not paths:
+            del self.pending[rel_dir]
+            self.finished.add(rel_dir)
+
+    def maybe_save(self, writer):
+        if time.monotonic() - self.last_save < self.interval:
+            return
+        # Only rows that are committed may be vouched for.
+        writer.flush()
+        self.dirty.update(os.path.dirname(p) for p in writer.failed)
+        self.manifest.put_dirs({d: self.dir_mtimes[d] for d in self.finished if d in self.dir_mtimes and self._complete(d)})
+        self.finished.clear()
+        self._save()
+
+    def _complete(self, rel_dir):
+        return (rel_dir not in self.pending and rel_dir not in self.dirty
+                and is_settled(self.dir_mtimes[rel_dir], self.scan_start))
+
+    def _save(self):
+        self.manifest.set_meta('fingerprint', db_fingerprint(self.cur))
+        self.manifest.commit()
+        self.last_save = time.monotonic()
+
+# --- Database write ---
+def has_thumbnail(cur, file_hash):
+    """True when some row with this content hash holds a BLOB thumbnail."""
+    cur.execute("SELECT 1 FROM files WHERE file_hash = %s AND thumb IS NOT NULL LIMIT 1", (file_hash,))
+    return cur.fetchone() is not None
+
+def copy_thumbnails(cur, rel_paths, batch_size=500):
+    """Give the rows at rel_paths the BLOB thumbnail of another row with the same hash."""
+    for i in range(0, len(rel_paths), batch_size):
+        batch = tuple(rel_paths[i:i + batch_size])
+        placeholders = ','.join(['%s'] * len(batch))
+        cur.execute(f"""
+            UPDATE files f JOIN files s ON s.file_hash = f.file_hash AND s.id <> f.id AND s.thumb IS NOT NULL
+            SET f.thumb = s.thumb
+            WHERE f.path IN ({placeholders})
+        """, batch)
+
+UPSERT_COLUMNS = [
+    'path', 'file_hash', 'hash_kind', 'name', 'mtime', 'file_size', 'object', 'date_obs', 'exptime', 'filter', 'imgtype',
+    'xbinning', 'ybinning', 'egain', 'offset', 'xpixsz', 'ypixsz', 'instrume',
+    'set_temp', 'ccd_temp', 'telescop', 'focallen', 'focratio', 'ra', 'dec',
+    'centalt', 'centaz', 'airmass', 'pierside', 'siteelev', 'sitelat', 'sitelong',
+    'focpos', 'thumb', 'thumb_format', 'thumb_sizes', 'directory_id'
+]
+
+UPSERT_SQL = '''
+    INSERT INTO files (
+        path, file_hash, hash_kind, name, mtime, file_size, object, date_obs, exptime, filter, imgtype,
+        xbinning, ybinning, egain, `offset`, xpixsz, ypixsz, instrume,
+        set_temp, ccd_temp, telescop, focallen, focratio, ra, `dec`,
+        centalt, centaz, airmass, pierside, siteelev, sitelat, sitelong,
+        focpos, thumb, thumb_format, thumb_sizes, directory_id, deleted_at, is_hidden
+    ) VALUES {values}
+    ON DUPLICATE KEY UPDATE
+        file_hash=VALUES(file_hash), hash_kind=VALUES(hash_kind), mtime=VALUES(mtime), file_size=VALUES(file_size),
+        name=VALUES(name), object=VALUES(object), date_obs=VALUES(date_obs),
+        exptime=VALUES(exptime), filter=VALUES(filter), imgtype=VALUES(imgtype),
+        xbinning=VALUES(xbinning), ybinning=VALUES(ybinning), egain=VALUES(egain),
+        `offset`=VALUES(`offset`), xpixsz=VALUES(xpixsz), ypixsz=VALUES(ypixsz),
+        instrume=VALUES(instrume), set_temp=VALUES(set_temp), ccd_temp=VALUES(ccd_temp),
+        telescop=VALUES(telescop), focallen=VALUES(focallen), focratio=VALUES(focratio),
+        ra=VALUES(ra), `dec`=VALUES(`dec`), centalt=VALUES(centalt), centaz=VALUES(centaz),
+        airmass=VALUES(airmass), pierside=VALUES(pierside), siteelev=VALUES(siteelev),
+        sitelat=VALUES(sitelat), sitelong=VALUES(sitelong), focpos=VALUES(focpos),
+        thumb=CASE WHEN VALUES(thumb_format) IS NOT NULL THEN NULL ELSE COALESCE(VALUES(thumb), thumb) END,
+        thumb_format=CASE WHEN VALUES(thumb) IS NOT NULL THEN NULL ELSE COALESCE(VALUES(thumb_format), thumb_format) END,
+        thumb_sizes=CASE WHEN VALUES(thumb) IS NOT NULL THEN NULL ELSE COALESCE(VALUES(thumb_sizes), thumb_sizes) END,
+        directory_id=VALUES(directory_id), deleted_at=NULL, is_hidden=is_hidden
+'''
+
+UPSERT_ROW = '(' + ', '.join(['%s'] * len(UPSERT_COLUMNS)) + ', NULL, 0)'
+
+class BatchWriter:
+    """Buffers file upserts and writes them as multi-row statements.
+
+    Each flush sends one INSERT ... ON DUPLICATE KEY UPDATE for the whole
+    batch, recomputes the duplicate counts of every hash the batch touched
+    (including hashes a path moved away from), refreshes the rollups of the
+    directories it touched and commits.
+    """
+
+    def __init__(self, conn, cur, db_files, db_hashes, batch_size=50, manifest=None, dirs=None):
+        self.conn = conn
+        self.cur = cur
+        self.db_files = db_files
+        self.db_hashes = db_hashes
+        self.batch_size = max(1, batch_size)
+        self.rows = []
+        self.hashes = set()
+        self.manifest = manifest
+        self.dirs = dirs
+        self.written = 0
+        self.failed = []
+
+    def add(self, params):
+        rel_path = params['path']
+        file_hash = params['file_hash']
+        self.rows.append(params)
+        self.hashes.add(file_hash)
+        if rel_path in self.db_files and self.db_files[rel_path]['hash'] != file_hash:
+            self.hashes.add(self.db_files[rel_path]['hash'])
+
+        self.db_files[rel_path] = {'hash': file_hash, 'mtime': params['mtime'], 'size': params['file_size'], 'deleted_at': None}
+        self.db_hashes.setdefault(file_hash, []).append(rel_path)
+
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        # Directory rows are committed first so a rolled-back batch cannot
+        # leave stale ids in the DirectoryTree cache.
+        dir_ids = set()
+        for params in rows:
+            params['directory_id'] = self.dirs.ensure(self.cur, os.path.dirname(params['path'])) if self.dirs else None
+            dir_ids.add(params['directory_id'])
+        self.conn.commit()
+        try:
+            self._upsert(rows)
+            self.written += len(rows)
+            written_rows = rows
+        except mysql.connector.Error as err:
+            # Fall back to one row per statement so a single bad record
+            # is reported against its own path and does not drop the batch.
+            logger.debug(f"Batch upsert of {len(rows)} rows failed ({err}), retrying row by row")
+            self.conn.rollback()
+            written_rows = []
+            for params in rows:
+                try:
+                    self._upsert([params])
+                    self.written += 1
+                    written_rows.append(params)
+                except Exception as e:
+                    logger.error(f"Error processing {params['path']}: {e}")
+                    self.failed.append(params['path'])
+        reuse = [p['path'] for p in written_rows if p.get('needs_thumb')]
+        if reuse:
+            copy_thumbnails(self.cur, reuse)
+        update_duplicate_counts(self.cur, self.hashes)
+        self.hashes.clear()
+        if self.dirs is not None:
+            self.dirs.refresh(self.cur, dir_ids)
+        self.conn.commit()
+        if self.manifest is not None:
+            self.manifest.put_files((p['path'], p['file_hash'], p['mtime'], p['file_size']) for p in written_rows)
+            self.manifest.commit()
+
+    def _upsert(self, rows):
+        sql = UPSERT_SQL.format(values=', '.join([UPSERT_ROW] * len(rows)))
+        values = tuple(params[col] for params in rows for col in UPSERT_COLUMNS)
+        self.cur.execute(sql, values)
+
+# --- Move detection ---
+def match_moved_files(tasks, candidates):
+    """Pair new files with rows whose file has disappeared.
+
+    candidates maps rel_path -> record (as in db_files) for rows missing
+    from disk. A task matches a candidate with the same size and mtime (to
+    the second) once its content hash confirms it; a candidate with the same
+    file name is preferred. Returns (moves, remaining) where moves holds
+    (old_path, new_path, mtime) tuples and remaining the unmatched tasks.
+    """
+    by_key = {}
+    for path, rec in candidates.items():
+        if rec['mtime'] is not None:
+            by_key.setdefault((rec['size'], int(float(rec['mtime']))), []).append((path, rec))
+    moves, remaining = [], []
+    for task in tasks:
+        full_path, rel_path, file, mtime, file_size = task
+        pool = by_key.get((file_size, int(mtime)))
+        if pool:
+            hashes = {}
+            try:
+                for kind in {hash_kind(c[1]['hash']) for c in pool}:
+                    hashes[kind] = hash_file(full_path, kind)
+            except OSError:
+                pass
+            matches = [c for c in pool if hashes.get(hash_kind(c[1]['hash'])) == c[1]['hash']]
+            if matches:
+                match = next((c for c in matches if os.path.basename(c[0]) == file), matches[0])
+                pool.remove(match)
+                moves.append((match[0], rel_path, mtime))
+                continue
+        remaining.append(task)
+    return moves, remaining
+
+def relink_moved_files(conn, cur, moves, db_files, manifest=None, dirs=None, batch_size=500):
+    """Point the rows of moved files at their new path.
+
+    The rows keep their id, hash, visibility and thumbnail; a soft-deleted
+    row is brought back to life. moves holds (old_path, new_path, mtime)
+    tuples. Returns the number of rows relinked.
+    """
+    if not moves:
+        return 0
+    relinked = 0
+    revived_hashes = set()
+    for i in range(0, len(moves), batch_size):
+        batch = moves[i:i + batch_size]
+        params = []
+        for old_path, new_path, mtime in batch:
+            dir_id = dirs.ensure(cur, os.path.dirname(new_path)) if dirs else None
+            params.extend((old_path, new_path, os.path.basename(new_path), mtime, dir_id))
+            if db_files[old_path]['deleted_at'] is not None:
+                revived_hashes.add(db_files[old_path]['hash'])
+        conn.commit()
+        # A soft-deleted row left at the destination would collide on path.
+        new_paths = tuple(m[1] for m in batch)
+        placeholders = ','.join(['%s'] * len(new_paths))
+        cur.execute(f"DELETE FROM files WHERE deleted_at IS NOT NULL AND path IN ({placeholders})", new_paths)
+        mapping = ' UNION ALL '.join(
+            ['SELECT %s AS old_path, %s AS new_path, %s AS new_name, %s AS new_mtime, %s AS new_directory_id'] * len(batch))
+        cur.execute(f"""
+            UPDATE files f
+            JOIN ({mapping}) m ON f.path = m.old_path
+            SET f.path = m.new_path, f.name = m.new_name, f.mtime = m.new_mtime,
+                f.directory_id = m.new_directory_id, f.deleted_at = NULL
+        """, tuple(params))
+        relinked += cur.rowcount
+    if revived_hashes:
+        update_duplicate_counts(cur, revived_hashes)
+    if dirs is not None:
+        dirs.refresh_paths(cur, [m[0] for m in moves] + [m[1] for m in moves])
+    conn.commit()
+
+    for old_path, new_path, mtime in moves:
+        rec = db_files.pop(old_path)
+        db_files[new_path] = {'hash': rec['hash'], 'mtime': mtime, 'size': rec['size'], 'deleted_at': None}
+    if manifest is not None:
+        manifest.remove_files([m[0] for m in moves])
+        manifest.put_files((new_path, db_files[new_path]['hash'], mtime, db_files[new_path]['size'])
+                           for _, new_path, mtime in moves)
+        manifest.commit()
+    logger.info(f"Relinked {relinked} moved files.")
+    return relinked
+
+# --- Hash confirmation ---
+def confirm_full_hashes(conn, cur, fits_root, rel_paths, db_files=None, manifest=None, thumb_dir='',
+                        bytes_per_sec=0, batch_size=50):
+    """Replace the fingerprints of the rows at rel_paths with full content hashes.
+
+    Static thumbnails are linked under the new hash. bytes_per_sec > 0 caps
+    the read rate. Returns the number of rows confirmed.
+    """
+    confirmed = 0
+    started, read_bytes = time.monotonic(), 0
+    for i in range(0, len(rel_paths), batch_size):
+        batch = tuple(rel_paths[i:i + batch_size])
+        placeholders = ','.join(['%s'] * len(batch))
+        cur.execute(f"""
+            SELECT path, file_hash, mtime, file_size, thumb_format, thumb_sizes FROM files
+            WHERE path IN ({placeholders}) AND hash_kind = 'fp'
+        """, batch)
+        hashes, groups, manifest_rows = set(), {}, []
+        for path, old_hash, mtime, file_size, thumb_format, thumb_sizes in cur.fetchall():
+            try:
+                new_hash = calculate_hash(os.path.join(fits_root, path))
+            except OSError as e:
+                logger.warning(f"Cannot confirm hash of {path}: {e}")
+                continue
+            read_bytes += file_size
+            if thumb_dir and thumb_format and thumb_sizes:
+                link_thumbnails(thumb_dir, old_hash, new_hash, [int(s) for s in thumb_sizes.split(',')], thumb_format)
+            cur.execute("UPDATE files SET file_hash = %s, hash_kind = 'xxh64' WHERE path = %s AND file_hash = %s",
+                        (new_hash, path, old_hash))
+            hashes.update((old_hash, new_hash))
+            groups.setdefault(old_hash, set()).add(new_hash)
+            manifest_rows.append((path, new_hash, mtime, file_size))
+            if db_files is not None and path in db_files:
+                db_files[path]['hash'] = new_hash
+            confirmed += 1
+            if bytes_per_sec > 0:
+                delay = read_bytes / bytes_per_sec - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        for old_hash, new_hashes in groups.items():
+            if len(new_hashes) > 1:
+                logger.warning(f"Fingerprint {old_hash} covered {len(new_hashes)} different files")
+        update_duplicate_counts(cur, hashes)
+        conn.commit()
+        if manifest is not None:
+            manifest.put_files(manifest_rows)
+            manifest.commit()
+    return confirmed
+
+# --- Metadata refresh ---
+REFRESH_KEYS = ('id', 'file_hash')
+
+# Matched on id and hash, so a row purged or re-indexed since it was read
+# is left alone instead of being written back.
+REFRESH_SQL = (
+    'UPDATE files f JOIN ({values}) m ON f.id = m.id AND f.file_hash = m.file_hash\n'
+    'SET ' + ', '.join(f'f.`{col}` = m.`{col}`' for col in COLUMNS)
+)
+
+REFRESH_ROW = 'SELECT ' + ', '.join(f'%s AS `{col}`' for col in REFRESH_KEYS + COLUMNS)
+
+def read_metadata(full_path):
+    """{keyword: value} of the schema keywords of a file, read without decoding pixel data."""
+    file_lower = full_path.lower()
+    values = read_header_only(full_path, None, file_lower)
+    if values is not None:
+        return values
+    load_decoders()
+    if file_lower.endswith(('.fits', '.fit')):
+        with fits.open(full_path, ignore_missing_end=True, memmap=True, do_not_scale_image_data=True) as hdul:
+            return header_values(hdul[0].header)
+    images_meta = XISF(full_path).get_images_metadata()
+    return xisf_values(images_meta[0].get('FITSKeywords', {})) if images_meta else {}
+
+def refresh_file(task):
+    """Re-read the header of one (row, full_path) task.
+
+    Returns (row, meta, error); meta is None when the file was changed or
+    removed since it was indexed, which leaves the row to the next pass.
+    """
+    row, full_path = task
+    try:
+        st = os.stat(full_path)
+        if int(st.st_mtime) != int(float(row['mtime'])) or st.st_size != row['file_size']:
+            return row, None, None
+        return row, file_metadata(read_metadata(full_path), row['path']), None
+    except Exception as e:
+        return row, None, e
+
+def refresh_files(tasks, workers):
+    """Yield refresh_file() for each task, in a process pool with more than one worker."""
+    if workers <= 1:
+        yield from map(refresh_file, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield from pool.map(refresh_file, tasks, chunksize=16)
+
+# --- Indexing API ---
+def is_unchanged(db_entry, mtime, file_size):
+    """True when a live database row still matches the file's mtime and size."""
+    mtime_match = False
+    if db_entry['mtime'] is not None:
+        mtime_match = int(float(db_entry['mtime'])) == int(mtime)
+    size_match = db_entry['size'] == file_size
+    is_deleted = db_entry['deleted_at'] is not None
+    return not is_deleted and mtime_match and size_match
+
+class Indexer:
+    """Indexes FITS/XISF files under fits_root into the files table.
+
+    full_pass() walks the whole tree, the way reindex.py always has.
+    index_paths() handles an explicit set of created, modified or deleted
+    paths and only reads the database rows for those paths, which is what
+    the watcher uses between full passes. Both relink rows of files that
+    were moved instead of indexing them again; relink_moves() does the same
+    for moves the filesystem reported. The instance keeps its database
+    connection open between calls.
+    """
+
+    def __init__(self, fits_root, db_params, thumb_size=300, workers=1, single_pass=False,
+                 batch_size=50, manifest_path='', retention_days=30, thumb_dir='', thumb_format='webp',
+                 thumb_sizes=(), header_only=False, fingerprint=False, prefetch_mb=0, prefetch_threads=4,
+                 decode_budget_mb=0, cache_files=False, chunk_rows=500, rows_per_sec=0):
+        self.fits_root = fits_root
+        self.db_params = db_params
+        self.options = {
+            'thumb_size': (thumb_size, thumb_size),
+            'single_pass': single_pass,
+            'thumb_dir': thumb_dir,
+            'thumb_format': supported_format(thumb_format) if thumb_dir else None,
+            'thumb_sizes': tuple(sorted(set(thumb_sizes) or {thumb_size})),
+            'header_only': header_only,
+            'fingerprint': fingerprint,
+            'prefetch_mb': prefetch_mb,
+            'prefetch_threads': max(1, prefetch_threads),
+            'decode_budget_mb': decode_budget_mb,
+        }
+        self.workers = workers
+        self.batch_size = batch_size
+        self.manifest_path = manifest_path
+        self.retention_days = retention_days
+        # Cleanup and maintenance write in chunks of chunk_rows rows, at most
+        # rows_per_sec rows per second across all of them.
+        self.chunk_rows = max(1, chunk_rows)
+        self.limiter = RateLimiter(rows_per_sec)
+        self.conn = None
+        self.cur = None
+        self.dirs = DirectoryTree()
+        self.metrics = Metrics()
+        # With cache_files the live rows' (hash, mtime, size) stay in memory
+        # between calls, tagged with the db_fingerprint they match.
+        self.cache_files = cache_files
+        self.files_cache = None
+        self.files_fingerprint = None
+
+    def connect(self):
+        if self.conn is None:
+            logger.info(f"Connecting to database {self.db_params['database']} on {self.db_params['host']}")
+            self.conn = mysql.connector.connect(**self.db_params)
+            self.cur = CountingCursor(self.conn.cursor(), self.metrics)
+            migrate(self.conn, self.cur)
+            self.dirs.backfill(self.conn, self.cur)
+            self.dirs.ensure_facets(self.conn, self.cur)
+        else:
+            self.conn.ping(reconnect=True, attempts=3, delay=2)
+        self.cur = CountingCursor(self.conn.cursor(), self.metrics)
+
+    def close(self):
+        if self.conn is not None and self.conn.is_connected():
+            self.conn.close()
+        self.conn = None
+        self.cur = None
+        # Ids created in a transaction that never committed must not survive.
+        self.dirs.forget()
+
+    def open_manifest(self, verify=False, rebuild=False):
+        """Open the scan manifest and make sure it matches the database.
+
+        Returns (manifest, trusted). An untrusted manifest has just been
+        rebuilt from the database, so its directory mtimes are empty and the
+        next scan lists everything.
+        """
+        manifest = Manifest(self.manifest_path)
+        if verify:
+            missing, extra, changed = manifest.verify(self.cur)
+            logger.info(f"Manifest check: {len(missing)} missing, {len(extra)} extra, {len(changed)} changed entries.")
+            if missing or extra or changed:
+                manifest.rebuild(self.cur, self.fits_root)
+                return manifest, False
+        if rebuild or not manifest.is_current(self.fits_root, db_fingerprint(self.cur)):
+            manifest.rebuild(self.cur, self.fits_root)
+            return manifest, False
+        return manifest, True
+
+    def _write(self, tasks, db_files, db_hashes, manifest, counts, dirty_dirs, workers, checkpoint=None):
+        """Extract every task and write the results through a BatchWriter.
+
+        tasks may be an IngestQueue that grows while it is consumed.
+        checkpoint, when given, is told about every finished task.
+        """
+        writer = BatchWriter(self.conn, self.cur, db_files, db_hashes, batch_size=self.batch_size, manifest=manifest,
+                             dirs=self.dirs)
+        # Header-only results whose thumbnail cannot be borrowed from
+        # another row are decoded in full afterwards.
+        decode = []
+        fingerprints = set()
+        # Extraction stages are timed in the workers and summed here; 'wait'
+        # is the time the writer sat idle for results.
+        metrics = self.metrics
+
+        def write(results):
+            results = iter(results)
+            while True:
+                waited = time.perf_counter()
+                try:
+                    task, params, error = next(results)
+                except StopIteration:
+                    break
+                metrics.record('wait', time.perf_counter() - waited)
+                rel_path = task[1]
+                if error is not None:
+                    logger.error(f'Error processing {rel_path}: {error}')
+                    counts['errors'] += 1
+                    dirty_dirs.add(os.path.dirname(rel_path))
+                    if checkpoint is not None:
+                        checkpoint.done(rel_path, ok=False)
+                    continue
+                if params is None:
+                    if checkpoint is not None:
+                        checkpoint.done(rel_path)
+                    continue
+                if params['needs_thumb'] and not has_thumbnail(self.cur, params['file_hash']):
+                    decode.append(task)
+                    continue
+
+                if params['hash_kind'] == 'fp':
+                    fingerprints.add(params['file_hash'])
+                metrics.count('files')
+                metrics.count('bytes', params['file_size'])
+                for stage, seconds in params.pop('timings').items():
+                    metrics.record(stage, seconds)
+
+                written = writer.written
+                with metrics.time('write'):
+                    writer.add(params)
+                if writer.written != written:
+                    logger.info(f"Progress: {counts['processed'] + writer.written} files processed, {counts['skipped']} skipped.")
+                if checkpoint is not None:
+                    checkpoint.done(rel_path)
+                    checkpoint.maybe_save(writer)
+
+        write(extract_files(tasks, self.options, workers))
+        if decode:
+            logger.info(f"Decoding {len(decode)} files with no thumbnail to reuse...")
+            write(extract_files(decode, dict(self.options, header_only=False), workers))
+
+        with metrics.time('write'):
+            writer.flush()
+        if fingerprints:
+            self._confirm_duplicates(fingerprints, db_files, manifest)
+        counts['processed'] += writer.written
+        counts['errors'] += len(writer.failed)
+        dirty_dirs.update(os.path.dirname(p) for p in writer.failed)
+
+    def full_pass(self, force=False, full_scan=False, skip_cleanup=False, verify_manifest=False, rebuild_manifest=False,
+                  defer_paths=(), purge=True, urgent=None):
+        """Walk the whole tree, index new or changed files and clean up missing ones.
+
+        Files are indexed newest first (see IngestQueue). Paths in
+        defer_paths (files still being written) are treated as present but
+        not indexed, and their directories are re-listed on the next pass.
+        urgent, when given, is polled during the pass for paths (such as
+        those the watcher saw settle) to index ahead of the rest. With a
+        manifest, progress is checkpointed so an interrupted pass resumes
+        where it stopped. purge=False leaves purging old soft-deleted rows
+        to a maintenance job.
+        """
+        self.connect()
+        manifest = None
+        try:
+            trusted = False
+            if self.manifest_path:
+                manifest, trusted = self.open_manifest(verify=verify_manifest, rebuild=rebuild_manifest)
+            db_files = self._take_cache()
+            if db_files is not None:
+                logger.info("Using the file data kept from the previous pass...")
+            elif manifest is not None:
+                logger.info(f"Loading existing file data from manifest {self.manifest_path}...")
+                db_files = manifest.load_files()
+            else:
+                logger.info("Loading existing file data from database...")
+                self.cur.execute("SELECT path, file_hash, mtime, file_size, deleted_at FROM files")
+                db_files = {row[0]: {'hash': row[1], 'mtime': row[2], 'size': row[3], 'deleted_at': row[4]} for row in self.cur.fetchall()}
+            db_hashes = {}
+            for path, rec in db_files.items():
+                db_hashes.setdefault(rec['hash'], []).append(path)
+            logger.info(f"Loaded {len(db_files)} records.")
+
+            if self.workers > 1:
+                logger.info(f"Starting file indexing with {self.workers} worker processes...")
+            else:
+                logger.info("Starting file indexing...")
+            start_time = datetime.now()
+            counts = {'processed': 0, 'skipped': 0, 'errors': 0, 'moved': 0, 'soft_deleted': 0, 'purged': 0}
+            disk_files = {}
+            # Directory mtimes seen during this scan, and directories that must be
+            # re-listed next time because something in them was not indexed.
+            dir_mtimes = {}
+            dirty_dirs = set()
+            scan_cache = manifest if trusted and not force and not full_scan else None
+
+            def discover():
+                """Walk the tree and yield extraction tasks for new or changed files."""
+                for listing in walk_tree(self.fits_root, cache=scan_cache):
+                    dir_mtimes[listing.rel_dir] = listing.mtime_ns
+                    root = os.path.join(self.fits_root, listing.rel_dir)
+                    for file, stat in listing.files.items():
+                        full_path = os.path.join(root, file)
+                        rel_path = os.path.join(listing.rel_dir, file)
+                        disk_files[rel_path] = True
+
+                        if rel_path in defer_paths:
+                            dirty_dirs.add(listing.rel_dir)
+                            continue
+                        if listing.cached:
+                            counts['skipped'] += 1
+                            continue
+                        if isinstance(stat, OSError):
+                            logger.error(f'Error processing {rel_path}: {stat}')
+                            counts['errors'] += 1
+                            dirty_dirs.add(listing.rel_dir)
+                            continue
+
+                        if not force and rel_path in db_files and is_unchanged(db_files[rel_path], stat.st_mtime, stat.st_size):
+                            counts['skipped'] += 1
+                            continue
+
+                        yield (full_path, rel_path, file, stat.st_mtime, stat.st_size)
+
+            # The whole tree is walked before extraction starts so files that
+            # disappeared can be matched against new ones as moves.
+            with self.metrics.time('scan'):
+                tasks = list(discover())
+            candidates = {p: rec for p, rec in db_files.items() if p not in disk_files and p not in defer_paths}
+            with self.metrics.time('moves'):
+                tasks = self._relink_moves(tasks, candidates, db_files, manifest, counts)
+
+            checkpoint = None
+            if manifest is not None:
+                checkpoint = ScanCheckpoint(manifest, self.cur, dir_mtimes, start_time.timestamp())
+                # Directories of rows whose file is gone stay unchecked until
+                # the cleanup below has soft-deleted those rows.
+                checkpoint.start(tasks, dirty_dirs | {os.path.dirname(p) for p, f in db_files.items()
+                                                      if f['deleted_at'] is None and p not in disk_files})
+
+            def feed():
+                """Turn the urgent paths that exist and changed into tasks."""
+                fed = []
+                for rel_path in urgent():
+                    full_path = os.path.join(self.fits_root, rel_path)
+                    try:
+                        stat = os.stat(full_path)
+                    except OSError:
+                        # Gone again: the cleanup below (or the next pass) handles it.
+                        disk_files.pop(rel_path, None)
+                        continue
+                    disk_files[rel_path] = True
+                    if rel_path in db_files and is_unchanged(db_files[rel_path], stat.st_mtime, stat.st_size):
+                        continue
+                    fed.append((full_path, rel_path, os.path.basename(rel_path), stat.st_mtime, stat.st_size))
+                    if checkpoint is not None:
+                        checkpoint.expect(rel_path)
+                if fed:
+                    logger.info(f"Indexing {len(fed)} reported paths ahead of the pass")
+                return fed
+
+            queue = IngestQueue(tasks, feed=feed if urgent is not None else None)
+            self._write(queue, db_files, db_hashes, manifest, counts, dirty_dirs, self.workers, checkpoint)
+
+            if not skip_cleanup:
+                with self.metrics.time('cleanup'):
+                    counts['soft_deleted'] = soft_delete_missing_files(self.conn, self.cur, db_files, disk_files, manifest, dirs=self.dirs,
+                                                                       chunk_rows=self.chunk_rows, limiter=self.limiter)
+                    if purge:
+                        counts['purged'] = purge_deleted_files(self.conn, self.cur, self.retention_days, dirs=self.dirs,
+                                                               chunk_rows=self.chunk_rows, limiter=self.limiter)
+            else:
+                # Missing files stay live in the database, so their directories
+                # must not be trusted until a run with cleanup has seen them.
+                dirty_dirs.update(os.path.dirname(p) for p, f in db_files.items()
+                                  if f['deleted_at'] is None and p not in disk_files)
+
+            self.dirs.refresh_stale(self.conn, self.cur)
+
+            if manifest is not None:
+                scan_start = start_time.timestamp()
+                manifest.replace_dirs({
+                    d: (mtime_ns if d not in dirty_dirs and is_settled(mtime_ns, scan_start) else None)
+                    for d, mtime_ns in dir_mtimes.items()
+                })
+                manifest.set_meta('fingerprint', db_fingerprint(self.cur))
+                manifest.commit()
+            self._keep_cache(None, db_files)
+
+            duration = datetime.now() - start_time
+            logger.info("=== Indexing Complete ===")
+            logger.info(f"Duration: {duration}")
+            logger.info(f"Files processed: {counts['processed']}")
+            logger.info(f"Files skipped: {counts['skipped']}")
+            logger.info(f"Files moved: {counts['moved']}")
+            logger.info(f"Files soft-deleted: {counts['soft_deleted']}")
+            logger.info(f"Files purged: {counts['purged']}")
+            logger.info(f"Errors encountered: {counts['errors']}")
+            self.metrics.log_summary()
+            return counts
+        finally:
+            if manifest is not None:
+                manifest.close()
+
+    def index_paths(self, rel_paths, force=False):
+        """Index or soft-delete an explicit set of paths relative to fits_root.
+
+        Paths that exist are indexed when new or changed (or always, with
+        force); live rows whose file is gone are soft-deleted. Only the rows
+        for these paths are read from the database.
+        """
+        rel_paths = sorted({os.path.normpath(p) for p in rel_paths if p.lower().endswith(VALID_EXTS)})
+        counts = {'processed': 0, 'skipped': 0, 'errors': 0, 'moved': 0, 'soft_deleted': 0, 'purged': 0}
+        if not rel_paths:
+            return counts
+
+        self.connect()
+        manifest = None
+        try:
+            cache = self._take_cache()
+            db_files = self._load_rows(rel_paths)
+            db_hashes = {}
+
+            # Keep the manifest in step so the next full pass can still trust it.
+            trusted = False
+            if self.manifest_path:
+                manifest = Manifest(self.manifest_path)
+                trusted = manifest.is_current(self.fits_root, db_fingerprint(self.cur))
+
+            disk_files = {}
+            tasks = []
+            for rel_path in rel_paths:
+                full_path = os.path.join(self.fits_root, rel_path)
+                try:
+                    stat = os.stat(full_path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.error(f'Error processing {rel_path}: {e}')
+                    counts['errors'] += 1
+                    continue
+                disk_files[rel_path] = True
+                if not force and rel_path in db_files and is_unchanged(db_files[rel_path], stat.st_mtime, stat.st_size):
+                    counts['skipped'] += 1
+                    continue
+                tasks.append((full_path, rel_path, os.path.basename(rel_path), stat.st_mtime, stat.st_size))
+
+            # New files may be moves of rows that vanished in this batch or
+            # were already soft-deleted by an earlier one.
+            candidates = {p: rec for p, rec in db_files.items() if rec['deleted_at'] is None and p not in disk_files}
+            sizes = tuple({t[4] for t in tasks if t[1] not in db_files or db_files[t[1]]['deleted_at'] is not None})
+            for i in range(0, len(sizes), 500):
+                batch = sizes[i:i+500]
+                format_strings = ','.join(['%s'] * len(batch))
+                self.cur.execute(f"SELECT path, file_hash, mtime, file_size, deleted_at FROM files WHERE deleted_at IS NOT NULL AND file_size IN ({format_strings})", batch)
+                for row in self.cur.fetchall():
+                    if row[0] not in disk_files:
+                        db_files[row[0]] = candidates[row[0]] = {'hash': row[1], 'mtime': row[2], 'size': row[3], 'deleted_at': row[4]}
+            touched = set(db_files)
+            with self.metrics.time('moves'):
+                tasks = self._relink_moves(tasks, candidates, db_files, manifest, counts)
+
+            workers = self.workers if len(tasks) > self.workers else 1
+            self._write(IngestQueue(tasks), db_files, db_hashes, manifest, counts, set(), workers)
+            if any(f['deleted_at'] is None and p not in disk_files for p, f in db_files.items()):
+                counts['soft_deleted'] = soft_delete_missing_files(self.conn, self.cur, db_files, disk_files, manifest, dirs=self.dirs,
+                                                                   chunk_rows=self.chunk_rows, limiter=self.limiter)
+
+            if manifest is not None and trusted:
+                manifest.set_meta('fingerprint', db_fingerprint(self.cur))
+                manifest.commit()
+            self._keep_cache(cache, db_files, touched)
+
+            logger.info(f"Indexed {len(rel_paths)} changed paths: {counts['processed']} processed, "
+                        f"{counts['skipped']} unchanged, {counts['moved']} moved, {counts['soft_deleted']} soft-deleted, "
+                        f"{counts['errors']} errors.")
+            return counts
+        finally:
+            if manifest is not None:
+                manifest.close()
+
+    def relink_moves(self, pairs):
+        """Apply file moves reported by the filesystem as (old_path, new_path) pairs.
+
+        A pair is relinked when the old path has a row and the new file has
+        the same size and mtime; no hashing is needed since the filesystem
+        reported the move. Returns the paths of pairs that could not be
+        relinked, which should go through index_paths().
+        """
+        moves_by_src = {}
+        leftover = []
+        for old_path, new_path in pairs:
+            old_path, new_path = os.path.normpath(old_path), os.path.normpath(new_path)
+            if new_path.lower().endswith(VALID_EXTS):
+                moves_by_src[old_path] = new_path
+            elif old_path.lower().endswith(VALID_EXTS):
+                leftover.append(old_path)
+        if not moves_by_src:
+            return leftover
+
+        self.connect()
+        manifest = None
+        try:
+            cache = self._take_cache()
+            db_files = self._load_rows(list(moves_by_src) + list(moves_by_src.values()))
+            touched = set(db_files)
+            moves = []
+            for old_path, new_path in moves_by_src.items():
+                rec, dest = db_files.get(old_path), db_files.get(new_path)
+                try:
+                    stat = os.stat(os.path.join(self.fits_root, new_path))
+                except OSError:
+                    stat = None
+                if (stat is None or rec is None or rec['mtime'] is None
+                        or (dest is not None and dest['deleted_at'] is None)
+                        or rec['size'] != stat.st_size or int(float(rec['mtime'])) != int(stat.st_mtime)):
+                    leftover.extend((old_path, new_path))
+                    continue
+                moves.append((old_path, new_path, stat.st_mtime))
+
+            trusted = False
+            if self.manifest_path:
+                manifest = Manifest(self.manifest_path)
+                trusted = manifest.is_current(self.fits_root, db_fingerprint(self.cur))
+            relink_moved_files(self.conn, self.cur, moves, db_files, manifest, dirs=self.dirs)
+            if manifest is not None and trusted:
+                manifest.set_meta('fingerprint', db_fingerprint(self.cur))
+                manifest.commit()
+            self._keep_cache(cache, db_files, touched)
+            return leftover
+        finally:
+            if manifest is not None:
+                manifest.close()
+
+    def refresh_stale_directories(self):
+        """Refresh the rollups of directories the web app marked stale (see DirectoryTree.refresh_stale)."""
+        self.connect()
+        refreshed = self.dirs.refresh_stale(self.conn, self.cur)
+        if refreshed:
+            logger.info(f"Refreshed the rollups of {refreshed} directories changed by the web app.")
+        return refreshed
+
+    def confirm_hashes(self, limit=0, bytes_per_sec=0, rel_paths=None):
+        """Replace stored fingerprints with full content hashes, oldest rows first.
+
+        Meant to run at low priority after indexing; limit bounds the number
+        of files per call (0 = all). rel_paths, when given, are confirmed
+        instead of the oldest fingerprinted rows. Returns the number of rows
+        confirmed.
+        """
+        self.connect()
+        if rel_paths is None:
+            sql = "SELECT path FROM files WHERE hash_kind = 'fp' AND deleted_at IS NULL ORDER BY id"
+            self.cur.execute(sql + (f" LIMIT {int(limit)}" if limit else ""))
+            rel_paths = [row[0] for row in self.cur.fetchall()]
+        if not rel_paths:
+            return 0
+        logger.info(f"Confirming full content hashes of {len(rel_paths)} fingerprinted files...")
+        manifest = None
+        try:
+            cache = self._take_cache()
+            trusted = False
+            if self.manifest_path:
+                manifest = Manifest(self.manifest_path)
+                trusted = manifest.is_current(self.fits_root, db_fingerprint(self.cur))
+            confirmed = confirm_full_hashes(self.conn, self.cur, self.fits_root, rel_paths, db_files=cache,
+                                            manifest=manifest if trusted else None,
+                                            thumb_dir=self.options['thumb_dir'], bytes_per_sec=bytes_per_sec)
+            self._keep_cache(cache, {}, set())
+            logger.info(f"Confirmed {confirmed} full content hashes.")
+            return confirmed
+        finally:
+            if manifest is not None:
+                manifest.close()
+
+    def refresh_metadata(self):
+        """Re-extract the header columns of every live row from its file's header.
+
+        Pixel data, hashes and thumbnails are left alone, so this is how a
+        change to the header schema (a new column or keyword alias) reaches
+        rows that were indexed before it. Rows are read and written in
+        chunks of chunk_rows, one multi-row statement and commit per chunk,
+        within the rows-per-second limit. Files changed since they were
+        indexed, and rows purged or re-indexed meanwhile, are skipped; the
+        next pass indexes them in full. Returns the number of rows refreshed.
+        """
+        self.connect()
+        logger.info("Refreshing header metadata of all indexed files...")
+        last_id, refreshed, skipped, failed = 0, 0, 0, 0
+        started = time.time()
+        while True:
+            self.connect()
+            self.cur.execute("SELECT id, path, file_hash, mtime, file_size, directory_id FROM files "
+                             "WHERE id > %s AND deleted_at IS NULL ORDER BY id LIMIT %s", (last_id, self.chunk_rows))
+            rows = [dict(zip(('id', 'path', 'file_hash', 'mtime', 'file_size', 'directory_id'), row))
+                    for row in self.cur.fetchall()]
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            tasks = [(row, os.path.join(self.fits_root, row['path'])) for row in rows]
+            workers = self.workers if len(tasks) > self.workers else 1
+            values, dir_ids = [], set()
+            with self.metrics.time('refresh'):
+                for row, meta, error in refresh_files(tasks, workers):
+                    if error is not None:
+                        logger.error(f"Error reading header of {row['path']}: {error}")
+                        failed += 1
+                    elif meta is None:
+                        skipped += 1
+                    else:
+                        values.extend(row[col] for col in REFRESH_KEYS)
+                        values.extend(meta[col] for col in COLUMNS)
+                        dir_ids.add(row['directory_id'])
+            if values:
+                count = len(values) // (len(REFRESH_KEYS) + len(COLUMNS))
+                with self.metrics.time('write'):
+                    self.cur.execute(REFRESH_SQL.format(values=' UNION ALL '.join([REFRESH_ROW] * count)), tuple(values))
+                    self.dirs.refresh(self.cur, dir_ids)
+                    self.conn.commit()
+                refreshed += count
+            logger.info(f"Refreshed {refreshed} rows so far, up to id {last_id}")
+            self.limiter.pause(len(rows))
+        logger.info(f"Metadata refresh complete: {refreshed} refreshed, {skipped} changed on disk (skipped), "
+                    f"{failed} failed in {time.time() - started:.1f}s.")
+        return refreshed
+
+    def _confirm_duplicates(self, fingerprints, db_files, manifest):
+        """Full-hash every live row of the fingerprints shared by more than one file."""
+        fingerprints = list(fingerprints)
+        rel_paths = []
+        for i in range(0, len(fingerprints), 500):
+            batch = tuple(fingerprints[i:i+500])
+            format_strings = ','.join(['%s'] * len(batch))
+            self.cur.execute(f"""
+                SELECT f.path FROM files f JOIN (
+                    SELECT file_hash FROM files WHERE file_hash IN ({format_strings}) AND deleted_at IS NULL
+                    GROUP BY file_hash HAVING COUNT(*) > 1
+                ) d ON f.file_hash = d.file_hash
+                WHERE f.deleted_at IS NULL
+            """, batch)
+            rel_paths.extend(row[0] for row in self.cur.fetchall())
+        if rel_paths:
+            logger.info(f"Confirming {len(rel_paths)} candidate duplicates with full content hashes...")
+            confirm_full_hashes(self.conn, self.cur, self.fits_root, rel_paths, db_files, manifest,
+                                thumb_dir=self.options['thumb_dir'])
+
+    def _take_cache(self):
+        """Hand over the file data kept by the previous call, if the files table still matches it.
+
+        The cache is detached while a call works on it, so a call that fails
+        halfway leaves none behind.
+        """
+        cache, self.files_cache = self.files_cache, None
+        if cache is not None and self.files_fingerprint != db_fingerprint(self.cur):
+            logger.info("The files table was changed by something else, reloading the file data.")
+            cache = None
+        return cache
+
+    def _keep_cache(self, cache, db_files, touched=None):
+        """Keep the live rows for the next call.
+
+        Without touched, db_files holds every row and replaces the cache;
+        otherwise only the paths a call loaded (touched) or wrote are merged
+        into it.
+        """
+        if not self.cache_files:
+            return
+        if touched is None:
+            cache = db_files
+            for path in [p for p, rec in cache.items() if rec['deleted_at'] is not None]:
+                del cache[path]
+        elif cache is None:
+            return
+        else:
+            for path in touched | set(db_files):
+                rec = db_files.get(path)
+                if rec is not None and rec['deleted_at'] is None:
+                    cache[path] = rec
+                else:
+                    cache.pop(path, None)
+        self.files_cache = cache
+        self.files_fingerprint = db_fingerprint(self.cur)
+
+    def _load_rows(self, rel_paths):
+        """Return {path: record} for the rows at rel_paths, live or soft-deleted."""
+        rel_paths = list(rel_paths)
+        db_files = {}
+        for i in range(0, len(rel_paths), 500):
+            batch = tuple(rel_paths[i:i+500])
+            format_strings = ','.join(['%s'] * len(batch))
+            self.cur.execute(f"SELECT path, file_hash, mtime, file_size, deleted_at FROM files WHERE path IN ({format_strings})", batch)
+            for row in self.cur.fetchall():
+                db_files[row[0]] = {'hash': row[1], 'mtime': row[2], 'size': row[3], 'deleted_at': row[4]}
+        return db_files
+
+    def _relink_moves(self, tasks, candidates, db_files, manifest, counts):
+        """Relink the tasks that turn out to be moves of a candidate row and return the rest."""
+        fresh = [t for t in tasks if t[1] not in db_files or db_files[t[1]]['deleted_at'] is not None]
+        if not candidates or not fresh:
+            return tasks
+        moves, _ = match_moved_files(fresh, candidates)
+        if not moves:
+            return tasks
+        counts['moved'] += relink_moved_files(self.conn, self.cur, moves, db_files, manifest, dirs=self.dirs)
+        moved = {m[1] for m in moves}
+        return [t for t in tasks if t[1] not in moved]
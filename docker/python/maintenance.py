@@ -0,0 +1,260 @@
+import logging
+import os
+import time
+
+from indexer import purge_chunk, update_duplicate_counts
+from manifest import Manifest, db_fingerprint
+
+logger = logging.getLogger('reindex')
+
+# Seconds after start-up before the first maintenance run, and before a
+# job that failed is tried again.
+STARTUP_DELAY = 300
+RETRY_DELAY = 300
+
+
+def _missing_paths(fits_root, paths, manifest):
+    """The paths whose file is gone.
+
+    With a trusted manifest, a directory whose mtime still matches it has
+    the listing the last pass saw (the rule scanner.walk_tree trusts), so
+    its files are looked up there and only the directory is stat'ed.
+    A path wrongly reported missing is harmless: index_paths() checks the
+    file again before soft-deleting its row.
+    """
+    by_dir = {}
+    for path in paths:
+        by_dir.setdefault(os.path.dirname(path), []).append(path)
+    missing = []
+    for rel_dir, dir_paths in by_dir.items():
+        cached = manifest.lookup(rel_dir) if manifest is not None else None
+        if cached is not None:
+            try:
+                mtime_ns = os.stat(os.path.join(fits_root, rel_dir)).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            if mtime_ns == cached[0]:
+                names = set(cached[2])
+                missing.extend(p for p in dir_paths if os.path.basename(p) not in names)
+                continue
+        missing.extend(p for p in dir_paths if not os.path.exists(os.path.join(fits_root, p)))
+    return missing
+
+
+# --- Jobs ---
+# Each job is a generator over an Indexer that does one chunk of work per
+# step, in its own transaction, and yields the number of rows it handled.
+# Nothing is held open between steps, so the indexer can be used for other
+# work (or reconnect) in between.
+def cleanup_job(indexer):
+    """Soft-delete live rows whose file is gone, the full pass's cleanup without the walk.
+
+    With a trusted scan manifest only the files of directories changed
+    since the last pass are stat'ed.
+    """
+    trusted = False
+    if indexer.manifest_path:
+        indexer.connect()
+        manifest = Manifest(indexer.manifest_path)
+        trusted = manifest.is_current(indexer.fits_root, db_fingerprint(indexer.cur))
+        manifest.close()
+    last_id = 0
+    while True:
+        if not os.path.isdir(indexer.fits_root):
+            # An unmounted share must not look like every file was deleted.
+            logger.warning(f"Cleanup stopped, {indexer.fits_root} is not available")
+            return
+        indexer.connect()
+        indexer.cur.execute("SELECT id, path FROM files WHERE id > %s AND deleted_at IS NULL ORDER BY id LIMIT %s",
+                            (last_id, indexer.chunk_rows))
+        rows = indexer.cur.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        manifest = Manifest(indexer.manifest_path) if trusted else None
+        try:
+            missing = _missing_paths(indexer.fits_root, [path for _, path in rows], manifest)
+        finally:
+            if manifest is not None:
+                manifest.close()
+        if missing:
+            indexer.index_paths(missing)
+        yield len(rows)
+
+
+def purge_job(indexer):
+    """Permanently remove rows soft-deleted more than retention_days ago."""
+    if indexer.retention_days <= 0:
+        return
+    while True:
+        indexer.connect()
+        removed = purge_chunk(indexer.conn, indexer.cur, indexer.retention_days, indexer.chunk_rows)
+        if not removed:
+            break
+        yield removed
+    indexer.connect()
+    pruned = indexer.dirs.prune(indexer.conn, indexer.cur)
+    if pruned:
+        logger.info(f"Removed {pruned} empty directories from the directory tree.")
+    yield pruned
+
+
+def duplicates_job(indexer):
+    """Recompute the duplicate counts of every row, to repair counts that drifted."""
+    last_id, fixed = 0, 0
+    while True:
+        indexer.connect()
+        indexer.cur.execute("SELECT id, file_hash FROM files WHERE id > %s ORDER BY id LIMIT %s",
+                            (last_id, indexer.chunk_rows))
+        rows = indexer.cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        fixed += update_duplicate_counts(indexer.cur, {row[1] for row in rows})
+        indexer.conn.commit()
+        yield len(rows)
+    if fixed:
+        logger.info(f"Corrected the duplicate counts of {fixed} rows.")
+
+
+def thumbnails_job(indexer):
+    """Render thumbnails for live rows that have none.
+
+    With static thumbnails this includes rows that still hold an inline
+    BLOB from before they were enabled. Rows are re-indexed in batches of
+    the indexer's batch_size, since each one is decoded. A row that still
+    has no thumbnail afterwards (over the decode budget, no image data)
+    gets its mtime recorded in thumb_attempt_mtime and is not tried again
+    until its file changes.
+    """
+    if indexer.options['thumb_dir']:
+        missing = "thumb_format IS NULL"
+    else:
+        missing = "thumb IS NULL"
+    untried = "(thumb_attempt_mtime IS NULL OR thumb_attempt_mtime <> mtime)"
+    last_id = 0
+    while True:
+        indexer.connect()
+        indexer.cur.execute(f"SELECT id, path FROM files WHERE id > %s AND deleted_at IS NULL AND {missing} "
+                            f"AND {untried} ORDER BY id LIMIT %s", (last_id, indexer.batch_size))
+        rows = indexer.cur.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        indexer.index_paths([path for _, path in rows], force=True)
+        indexer.connect()
+        ids = tuple(row[0] for row in rows)
+        placeholders = ','.join(['%s'] * len(ids))
+        indexer.cur.execute(f"UPDATE files SET thumb_attempt_mtime = mtime WHERE id IN ({placeholders}) AND {missing}", ids)
+        indexer.conn.commit()
+        yield len(rows)
+
+
+def hashes_job(indexer):
+    """Replace stored fingerprints with full content hashes (see --confirm-hashes).
+
+    Rows whose file cannot be read keep their fingerprint; the id cursor
+    makes sure each row is tried once per run.
+    """
+    last_id = 0
+    while True:
+        indexer.connect()
+        indexer.cur.execute("SELECT id, path FROM files WHERE id > %s AND hash_kind = 'fp' AND deleted_at IS NULL "
+                            "ORDER BY id LIMIT %s", (last_id, indexer.chunk_rows))
+        rows = indexer.cur.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        indexer.confirm_hashes(rel_paths=[path for _, path in rows])
+        yield len(rows)
+
+
+JOBS = {
+    'cleanup': cleanup_job,
+    'purge': purge_job,
+    'duplicates': duplicates_job,
+    'thumbnails': thumbnails_job,
+    'hashes': hashes_job,
+}
+
+
+def parse_schedule(value):
+    """Parse "job=seconds,..." into {job: seconds}; jobs with 0 seconds are left out."""
+    schedule = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, seconds = item.partition('=')
+        name = name.strip()
+        if name not in JOBS:
+            raise ValueError(f"unknown maintenance job {name!r} (known: {', '.join(JOBS)})")
+        if float(seconds) > 0:
+            schedule[name] = float(seconds)
+    return schedule
+
+
+class MaintenanceScheduler:
+    """Runs maintenance jobs on their own intervals, a chunk at a time.
+
+    run() is called from the watcher's loop whenever it is idle. It works
+    on one job at a time for at most `budget` seconds per call, and all
+    jobs together stay within the indexer's rows-per-second limit, so
+    maintenance never competes with indexing or with the web listing for
+    long.
+    """
+
+    def __init__(self, indexer, schedule, budget=0.5):
+        self.indexer = indexer
+        self.budget = float(budget)
+        first_run = time.time() + STARTUP_DELAY
+        self.next_run = {name: first_run for name in schedule}
+        self.intervals = dict(schedule)
+        self.current = None  # (name, generator, started, rows)
+
+    def has(self, name):
+        return name in self.intervals
+
+    def run(self):
+        """Advance the current job, or start the next due one, for up to budget seconds."""
+        limiter = self.indexer.limiter
+        if limiter.delay() > 0:
+            return
+        if self.current is None:
+            now = time.time()
+            due = [name for name, at in sorted(self.next_run.items(), key=lambda item: item[1]) if at <= now]
+            if not due:
+                return
+            logger.info(f"Starting maintenance job {due[0]}")
+            self.current = (due[0], JOBS[due[0]](self.indexer), time.time(), 0)
+        name, job, started, rows = self.current
+        deadline = time.monotonic() + self.budget
+        try:
+            while time.monotonic() < deadline and limiter.delay() == 0:
+                with self.indexer.metrics.time(f"maintenance_{name}"):
+                    handled = next(job)
+                rows += handled
+                limiter.spend(max(handled, 1))
+        except StopIteration:
+            logger.info(f"Maintenance job {name} finished: {rows} rows in {time.time() - started:.1f}s")
+            self.next_run[name] = time.time() + self.intervals[name]
+            self.current = None
+            return
+        except Exception as e:
+            logger.error(f"Maintenance job {name} failed: {e}")
+            self.indexer.close()
+            self.next_run[name] = time.time() + min(RETRY_DELAY, self.intervals[name])
+            self.current = None
+            return
+        self.current = (name, job, started, rows)
+
+
+def run_job(indexer, name):
+    """Run one maintenance job to completion, sleeping to honour the rows-per-second limit."""
+    logger.info(f"Running maintenance job {name}...")
+    started, rows = time.time(), 0
+    for handled in JOBS[name](indexer):
+        rows += handled
+        indexer.limiter.pause(max(handled, 1))
+    logger.info(f"Maintenance job {name} finished: {rows} rows in {time.time() - started:.1f}s")
+    return rows
@@ -0,0 +1,150 @@
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger('reindex')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir);
+CREATE INDEX IF NOT EXISTS idx_files_hash ON files (hash);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs (parent);
+'''
+
+
+def db_fingerprint(cur):
+    """Cheap summary of the live rows in the files table.
+
+    Any insert, soft delete or purge done outside this indexer changes it,
+    which invalidates the manifest.
+    """
+    cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM files WHERE deleted_at IS NULL")
+    count, max_id = cur.fetchone()
+    return f"{int(count)}:{int(max_id)}"
+
+
+class Manifest:
+    """Local SQLite mirror of the live files rows plus per-directory mtimes.
+
+    It lets reindex.py skip the full table load and avoid stating files in
+    directories whose listing has not changed since the previous run. The
+    manifest is only trusted when its stored fingerprint matches the
+    database; otherwise it is rebuilt from the files table.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    def get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_current(self, fits_root, fingerprint):
+        return (self.get_meta('fits_root') == os.path.abspath(fits_root)
+                and self.get_meta('fingerprint') == fingerprint)
+
+    def rebuild(self, cur, fits_root):
+        """Reload every live row from the database and forget directory mtimes."""
+        logger.info(f"Rebuilding scan manifest {self.path} from the database...")
+        self.db.execute("DELETE FROM files")
+        self.db.execute("DELETE FROM dirs")
+        cur.execute("SELECT path, file_hash, mtime, file_size FROM files WHERE deleted_at IS NULL")
+        self.put_files(cur.fetchall())
+        self.set_meta('fits_root', os.path.abspath(fits_root))
+        self.set_meta('fingerprint', db_fingerprint(cur))
+        self.commit()
+
+    def load_files(self):
+        """Return {path: record} in the same shape reindex.py builds from the database."""
+        return {
+            path: {'hash': file_hash, 'mtime': mtime, 'size': size, 'deleted_at': None}
+            for path, file_hash, mtime, size in self.db.execute("SELECT path, hash, mtime, size FROM files")
+        }
+
+    def put_files(self, rows):
+        """Insert or replace (path, hash, mtime, size) rows."""
+        self.db.executemany(
+            "INSERT OR REPLACE INTO files (path, dir, hash, mtime, size) VALUES (?, ?, ?, ?, ?)",
+            ((path, os.path.dirname(path), file_hash, float(mtime), size) for path, file_hash, mtime, size in rows)
+        )
+
+    def remove_files(self, paths):
+        self.db.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in paths))
+
+    def lookup(self, rel_dir):
+        """Directory cache hook for scanner.walk_tree()."""
+        row = self.db.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (rel_dir,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        subdirs = [os.path.basename(r[0]) for r in self.db.execute("SELECT path FROM dirs WHERE parent = ? ORDER BY path", (rel_dir,))]
+        files = [os.path.basename(r[0]) for r in self.db.execute("SELECT path FROM files WHERE dir = ?", (rel_dir,))]
+        return row[0], subdirs, files
+
+    def replace_dirs(self, dirs):
+        """Replace the directory table with {rel_dir: mtime_ns or None}.
+
+        A None mtime keeps the directory known (so its parent's cached
+        listing still descends into it) but forces it to be re-listed.
+        """
+        self.db.execute("DELETE FROM dirs")
+        self.db.executemany(
+            "INSERT INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+            ((d, os.path.dirname(d) if d else None, mtime_ns) for d, mtime_ns in dirs.items())
+        )
+
+    def put_dirs(self, dirs):
+        """Insert or update {rel_dir: mtime_ns or None} without touching other directories."""
+        self.db.executemany(
+            "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+            ((d, os.path.dirname(d) if d else None, mtime_ns) for d, mtime_ns in dirs.items())
+        )
+
+    def verify(self, cur):
+        """Compare the manifest with the live database rows.
+
+        Returns (missing, extra, changed): paths live in the database but
+        absent from the manifest, paths only in the manifest, and paths whose
+        hash, size or mtime differ.
+        """
+        cur.execute("SELECT path, file_hash, mtime, file_size FROM files WHERE deleted_at IS NULL")
+        db_rows = {row[0]: row[1:] for row in cur.fetchall()}
+        local = self.load_files()
+        missing = [p for p in db_rows if p not in local]
+        extra = [p for p in local if p not in db_rows]
+        changed = []
+        for path, (file_hash, mtime, size) in db_rows.items():
+            rec = local.get(path)
+            if rec is None:
+                continue
+            if rec['hash'] != file_hash or rec['size'] != size or int(float(rec['mtime'])) != int(float(mtime)):
+                changed.append(path)
+        return missing, extra, changed
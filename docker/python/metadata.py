@@ -0,0 +1,118 @@
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# --- Header schema ---
+# Each files column is filled from the first of its keywords that is present,
+# not blank and converts with `convert`; otherwise it gets `default`.
+Field = namedtuple('Field', 'column keywords convert default')
+
+def _upper(value):
+    return str(value).upper()
+
+def _stripped(value):
+    return str(value).strip()
+
+FIELDS = (
+    Field('object', ('OBJECT',), _stripped, 'Unknown'),
+    Field('date_obs', ('DATE-OBS',), str, None),
+    Field('exptime', ('EXPTIME',), float, 0.0),
+    Field('filter', ('FILTER',), str, ''),
+    Field('imgtype', ('IMAGETYP',), _upper, 'UNKNOWN'),
+    Field('xbinning', ('XBINNING',), int, None),
+    Field('ybinning', ('YBINNING',), int, None),
+    Field('egain', ('EGAIN',), float, None),
+    Field('offset', ('OFFSET',), float, None),
+    Field('xpixsz', ('XPIXSZ',), float, None),
+    Field('ypixsz', ('YPIXSZ',), float, None),
+    Field('instrume', ('INSTRUME',), str, None),
+    Field('set_temp', ('SET-TEMP',), float, None),
+    Field('ccd_temp', ('CCD-TEMP',), float, None),
+    Field('telescop', ('TELESCOP',), str, None),
+    Field('focallen', ('FOCALLEN',), float, None),
+    Field('focratio', ('FOCRATIO',), float, None),
+    Field('ra', ('RA',), float, None),
+    Field('dec', ('DEC',), float, None),
+    Field('centalt', ('CENTALT',), float, None),
+    Field('centaz', ('CENTAZ',), float, None),
+    Field('airmass', ('AIRMASS',), float, None),
+    Field('pierside', ('PIERSIDE',), str, None),
+    Field('siteelev', ('SITEELEV',), float, None),
+    Field('sitelat', ('SITELAT',), float, None),
+    Field('sitelong', ('SITELONG',), float, None),
+    Field('focpos', ('FOCPOS', 'FOCUSPOS'), int, None),
+)
+
+COLUMNS = tuple(field.column for field in FIELDS)
+KEYWORDS = tuple(dict.fromkeys(kw for field in FIELDS for kw in field.keywords))
+
+
+def header_values(header):
+    """{keyword: value} of the schema keywords in an astropy Header."""
+    values = {}
+    for keyword in KEYWORDS:
+        value = header.get(keyword)
+        if value is not None:
+            values[keyword] = value
+    return values
+
+
+def xisf_values(keywords):
+    """{keyword: value} of the schema keywords in XISF FITSKeywords metadata."""
+    values = {}
+    for keyword in KEYWORDS:
+        entries = keywords.get(keyword)
+        if entries:
+            values[keyword] = entries[0].get('value')
+    return values
+
+
+def normalize(values):
+    """Map raw keyword values onto the files columns following FIELDS.
+
+    date_obs is returned as found; see parse_date_obs().
+    """
+    row = {}
+    for column, keywords, convert, default in FIELDS:
+        result = default
+        for keyword in keywords:
+            value = values.get(keyword)
+            if value is None or value == '':
+                continue
+            try:
+                result = convert(value)
+                break
+            except (ValueError, TypeError):
+                continue
+        row[column] = result
+    return row
+
+
+# --- DATE-OBS ---
+_ISO_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})(?:([T ])(\d{2}):(\d{2})(?::(\d{2})(?:\.(\d*))?)?)?$')
+
+def parse_date_obs(value):
+    """Parse an ISO-8601 DATE-OBS ('/' accepted as date separator) into a naive UTC datetime.
+
+    Covers what capture software writes without building an astropy Time;
+    anything else, leap seconds included, goes through Time as before.
+    Fractions of a second are rounded to microseconds. Raises ValueError
+    when the value cannot be parsed.
+    """
+    text = value.strip().replace('/', '-')
+    m = _ISO_RE.match(text)
+    if m is not None:
+        year, month, day, _, hour, minute, second, fraction = m.groups()
+        try:
+            parsed = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+        except ValueError:
+            parsed = None
+        if parsed is not None:
+            if fraction:
+                parsed += timedelta(microseconds=round(float('0.' + fraction) * 1e6))
+            return parsed
+    from astropy.time import Time
+    try:
+        return Time(text, format='isot' if 'T' in text else 'iso').to_datetime()
+    except Exception as e:
+        raise ValueError(str(e)) from e
@@ -0,0 +1,144 @@
+import json
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from fsutil import write_atomic
+
+logger = logging.getLogger('reindex')
+
+
+class Metrics:
+    """Per-stage timings and counters for an indexing process.
+
+    Every stage keeps a cumulative count and total plus the most recent
+    `samples` durations, from which the percentiles are computed. Counters
+    hold files, bytes read and database statements. A summary can be
+    logged, written as JSON, or exported in the Prometheus text format.
+    """
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, samples=10000):
+        self.samples = samples
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {'files': 0, 'bytes': 0, 'db_statements': 0}
+
+    def record(self, stage, seconds):
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = {'count': 0, 'total': 0.0, 'max': 0.0, 'recent': deque(maxlen=self.samples)}
+        entry['count'] += 1
+        entry['total'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        entry['recent'].append(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        """Return the metrics as a JSON-serialisable dict."""
+        elapsed = max(time.time() - self.started, 1e-9)
+        files = self.counters['files']
+        stages = {}
+        for stage, entry in self.stages.items():
+            recent = sorted(entry['recent'])
+            stages[stage] = {
+                'count': entry['count'],
+                'total_seconds': round(entry['total'], 6),
+                'mean_seconds': round(entry['total'] / entry['count'], 6) if entry['count'] else 0.0,
+                'max_seconds': round(entry['max'], 6),
+                **{f"p{int(q * 100)}_seconds": round(_percentile(recent, q), 6) for q in self.QUANTILES},
+            }
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'counters': dict(self.counters),
+            'files_per_second': round(files / elapsed, 3),
+            'mb_per_second': round(self.counters['bytes'] / 1048576 / elapsed, 3),
+            'db_statements_per_file': round(self.counters['db_statements'] / files, 2) if files else None,
+            'stages': stages,
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        stages = summary['stages']
+        if not stages:
+            return
+        # Reading and hashing wait on the disk; opening, thumbnailing and
+        # header parsing are mostly decoding work.
+        io = stages.get('hash', {}).get('total_seconds', 0)
+        cpu = sum(stages.get(s, {}).get('total_seconds', 0) for s in ('open', 'thumbnail', 'header'))
+        logger.info(f"Throughput: {summary['files_per_second']} files/s, {summary['mb_per_second']} MB/s, "
+                    f"{summary['db_statements_per_file']} DB statements per file "
+                    f"(mostly {'I/O' if io > cpu else 'CPU'}-bound)")
+        for stage, s in sorted(summary['stages'].items(), key=lambda item: -item[1]['total_seconds']):
+            logger.info(f"Stage {stage}: {s['count']} x, total {s['total_seconds']:.2f}s, "
+                        f"p50 {s['p50_seconds'] * 1000:.1f}ms, p90 {s['p90_seconds'] * 1000:.1f}ms, "
+                        f"p99 {s['p99_seconds'] * 1000:.1f}ms")
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.summary(), indent=2) + '\n')
+
+    def prometheus_text(self, prefix='awi'):
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per indexing stage.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, entry in sorted(self.stages.items()):
+            recent = sorted(entry['recent'])
+            for q in self.QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {_percentile(recent, q):.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {entry["total"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        lines.append(f"# TYPE {prefix}_uptime_seconds gauge")
+        lines.append(f"{prefix}_uptime_seconds {time.time() - self.started:.3f}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write the metrics for the node_exporter textfile collector."""
+        write_atomic(path, self.prometheus_text())
+
+
+class CountingCursor:
+    """Cursor proxy that counts and times every statement."""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def execute(self, *args, **kwargs):
+        self._metrics.count('db_statements')
+        with self._metrics.time('db'):
+            return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._metrics.count('db_statements')
+        with self._metrics.time('db'):
+            return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def _percentile(values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
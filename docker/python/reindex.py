@@ -1,16 +1,12 @@
 import os
 import sys
-import mysql.connector
-import xxhash
-from astropy.io import fits
-from astropy.time import Time
-from xisf import XISF
-import numpy as np
-from PIL import Image
 import argparse
-from io import BytesIO
+import cProfile
 import logging
-from datetime import datetime
+import socket
+
+import service
+from thumbnails import parse_sizes
 
 # Configure logging
 logging.basicConfig(
@@ -21,363 +17,176 @@ logging.basicConfig(
 logger = logging.getLogger('reindex')
 
 # --- Parameter parser ---
+commit_interval = 50
 thumb_size_default = int(os.getenv("THUMB_SIZE", 300))
+workers_default = int(os.getenv("REINDEX_WORKERS", 1))
+single_pass_default = os.getenv("SINGLE_PASS_READ", "false").lower() in ("true", "1")
+fingerprint_default = os.getenv("FINGERPRINT_HASH", "false").lower() in ("true", "1")
+prefetch_mb_default = int(os.getenv("PREFETCH_MB", 0))
+prefetch_threads_default = int(os.getenv("PREFETCH_THREADS", 4))
+decode_budget_default = int(os.getenv("DECODE_BUDGET_MB", 1024))
+manifest_default = os.getenv("MANIFEST_PATH", "")
+thumb_dir_default = os.getenv("THUMB_DIR", "")
+thumb_format_default = os.getenv("THUMB_FORMAT", "webp")
+thumb_sizes_default = os.getenv("THUMB_SIZES", "")
+metrics_json_default = os.getenv("METRICS_JSON", "")
+control_socket_default = os.getenv("CONTROL_SOCKET", "")
+service_timeout_default = float(os.getenv("SERVICE_TIMEOUT", 43200))
+chunk_rows_default = int(os.getenv("MAINTENANCE_CHUNK_ROWS", 200))
+rows_per_sec_default = float(os.getenv("MAINTENANCE_ROWS_PER_SEC", 1000))
+
+# Options a running watcher service can honour for a requested pass; with
+# any other option changed the pass runs in this process.
+SERVICE_OPTIONS = {
+    'fits_root', 'force', 'skip_cleanup', 'full_scan', 'verify_manifest', 'rebuild_manifest',
+    'confirm_hashes', 'confirm_rate', 'control_socket', 'service_timeout', 'local', 'debug',
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Reindex FITS/XISF files in MariaDB and generate thumbnails."
+    )
+    parser.add_argument("fits_root", help="Root directory containing image files")
+    parser.add_argument("--host", default=os.getenv("DB_HOST", "mariadb"), help="MariaDB host")
+    parser.add_argument("--user", default=os.getenv("DB_USER", "awi_user"), help="Database username")
+    parser.add_argument("--password", default=os.getenv("DB_PASS", "awi_password"), help="Database password")
+    parser.add_argument("--database", default=os.getenv("DB_NAME", "awi_db"), help="Database name")
+    parser.add_argument("--force", action="store_true", help="Force reindexing of existing files")
+    parser.add_argument("--thumb-size", type=int, default=thumb_size_default, help="Thumbnail size in pixels (e.g., 300)")
+    parser.add_argument("--thumb-dir", default=thumb_dir_default, help="Write thumbnails as static files under this directory instead of database BLOBs")
+    parser.add_argument("--thumb-format", choices=["webp", "avif", "png"], default=thumb_format_default, help="Image format of static thumbnails")
+    parser.add_argument("--thumb-sizes", type=parse_sizes, default=parse_sizes(thumb_sizes_default), help="Comma-separated static thumbnail sizes (default: --thumb-size)")
+    parser.add_argument("--skip-cleanup", action="store_true", help="Skip removal of non-existing files")
+    parser.add_argument("--retention-days", type=int, default=os.getenv("RETENTION_DAYS", 30), help="Days to keep soft-deleted files before permanent removal")
+    parser.add_argument("--batch-size", type=int, default=commit_interval, help="Number of rows written per multi-row upsert and commit")
+    parser.add_argument("--workers", type=int, default=workers_default, help="Number of worker processes for hashing, decoding and thumbnails (1 = single process)")
+    parser.add_argument("--single-pass", action="store_true", default=single_pass_default, help="Read each file once and share the buffer between hashing and FITS/XISF parsing")
+    parser.add_argument("--header-only", action="store_true", help="Parse only file headers and reuse existing thumbnails of known hashes instead of decoding pixel data")
+    parser.add_argument("--prefetch-mb", type=int, default=prefetch_mb_default, help="Read files ahead in threads with up to this many MB in flight (0 = off, single process only)")
+    parser.add_argument("--prefetch-threads", type=int, default=prefetch_threads_default, help="Threads used by --prefetch-mb")
+    parser.add_argument("--decode-budget-mb", type=int, default=decode_budget_default, help="Pixel data a worker may hold in memory per frame; larger frames that cannot be memory-mapped are indexed from their header only (0 = unlimited)")
+    parser.add_argument("--fingerprint", action="store_true", default=fingerprint_default, help="Hash only the size, header and a few samples of large files; duplicates are confirmed with a full hash")
+    parser.add_argument("--confirm-hashes", action="store_true", help="After indexing, replace stored fingerprints with full content hashes at low priority")
+    parser.add_argument("--confirm-rate", type=float, default=0, help="Read rate limit in MB/s for --confirm-hashes (0 = unlimited)")
+    parser.add_argument("--refresh-metadata", action="store_true", help="Instead of indexing, re-read the headers of all indexed files and update their metadata columns, without touching pixel data or thumbnails")
+    parser.add_argument("--run-job", action="append", default=[], choices=["cleanup", "purge", "duplicates", "thumbnails", "hashes"], help="After indexing, run this maintenance job to completion (may be repeated)")
+    parser.add_argument("--chunk-rows", type=int, default=chunk_rows_default, help="Rows deleted or updated per transaction by cleanup, purge, maintenance jobs and --refresh-metadata")
+    parser.add_argument("--rows-per-sec", type=float, default=rows_per_sec_default, help="Rate limit in rows per second for cleanup, purge, maintenance jobs and --refresh-metadata (0 = unlimited)")
+    parser.add_argument("--manifest", default=manifest_default, help="Path of the local scan manifest (SQLite); empty to disable")
+    parser.add_argument("--full-scan", action="store_true", help="Stat every file even in directories the manifest reports unchanged")
+    parser.add_argument("--verify-manifest", action="store_true", help="Compare the manifest with the database and rebuild it on mismatch")
+    parser.add_argument("--rebuild-manifest", action="store_true", help="Rebuild the manifest from the database before scanning")
+    parser.add_argument("--metrics-json", default=metrics_json_default, help="Write a JSON summary of per-stage timings, throughput and DB statements to this path")
+    parser.add_argument("--profile", default="", help="Write cProfile statistics of the main process to this path (use --workers 1 to include extraction)")
+    parser.add_argument("--control-socket", default=control_socket_default, help="Hand the pass to the watcher service listening on this unix socket when it is running")
+    parser.add_argument("--service-timeout", type=float, default=service_timeout_default, help="Seconds to wait for the watcher service to finish a handed-over pass before giving up (0 = wait forever)")
+    parser.add_argument("--local", action="store_true", help="Always run the pass in this process, even when the watcher service is running")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+    return parser.parse_args(argv)
+
+def use_service(args):
+    """True when the pass can be handed to a running watcher service."""
+    if args.local or not args.control_socket or not os.path.exists(args.control_socket):
+        return False
+    defaults = vars(parse_args([args.fits_root]))
+    changed = sorted(k for k, v in vars(args).items() if k not in SERVICE_OPTIONS and v != defaults[k])
+    if changed:
+        logger.info(f"Running locally, the service cannot apply: {', '.join('--' + k.replace('_', '-') for k in changed)}")
+        return False
+    return True
+
+def run_in_service(args):
+    """Send the pass to the watcher service and wait for it to finish."""
+    logger.info(f"Handing the pass to the indexing service on {args.control_socket}...")
+    timeout = args.service_timeout or None
+    reply = service.request(args.control_socket, 'full_pass', {
+        'force': args.force, 'full_scan': args.full_scan, 'skip_cleanup': args.skip_cleanup,
+        'verify_manifest': args.verify_manifest, 'rebuild_manifest': args.rebuild_manifest,
+    }, timeout=timeout)
+    if reply['ok']:
+        logger.info("Indexing complete: " + ', '.join(f"{k} {v}" for k, v in reply['result'].items()))
+        if args.confirm_hashes:
+            reply = service.request(args.control_socket, 'confirm_hashes',
+                                    {'bytes_per_sec': args.confirm_rate * 1024 * 1024}, timeout=timeout)
+            if reply['ok']:
+                logger.info(f"Confirmed {reply['result']} full content hashes.")
+    if not reply['ok']:
+        logger.error(f"Indexing service error: {reply['error']}")
+        sys.exit(1)
 
-parser = argparse.ArgumentParser(
-    description="Reindex FITS/XISF files in MariaDB and generate thumbnails."
-)
-parser.add_argument("fits_root", help="Root directory containing image files")
-parser.add_argument("--host", default=os.getenv("DB_HOST", "mariadb"), help="MariaDB host")
-parser.add_argument("--user", default=os.getenv("DB_USER", "awi_user"), help="Database username")
-parser.add_argument("--password", default=os.getenv("DB_PASS", "awi_password"), help="Database password")
-parser.add_argument("--database", default=os.getenv("DB_NAME", "awi_db"), help="Database name")
-parser.add_argument("--force", action="store_true", help="Force reindexing of existing files")
-parser.add_argument("--thumb-size", type=int, default=thumb_size_default, help="Thumbnail size in pixels (e.g., 300)")
-parser.add_argument("--skip-cleanup", action="store_true", help="Skip removal of non-existing files")
-parser.add_argument("--retention-days", type=int, default=os.getenv("RETENTION_DAYS", 30), help="Days to keep soft-deleted files before permanent removal")
-parser.add_argument("--debug", action="store_true", help="Enable debug logging")
-args = parser.parse_args()
-
-if args.debug:
-    logger.setLevel(logging.DEBUG)
-
-fits_root = args.fits_root
-force_reindex = args.force
-thumb_size = (args.thumb_size, args.thumb_size)
-
-if not os.path.isdir(fits_root):
-    logger.error(f"Error: directory {fits_root} does not exist")
-    sys.exit(1)
+# --- Main execution ---
+def main(argv=None):
+    args = parse_args(argv)
 
-commit_interval = 50
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
 
-# --- Hash function ---
-def calculate_hash(filepath, block_size=65536):
-    hasher = xxhash.xxh64()
-    with open(filepath, 'rb') as f:
-        while True:
-            buf = f.read(block_size)
-            if not buf:
-                break
-            hasher.update(buf)
-    return hasher.hexdigest()
+    if not os.path.isdir(args.fits_root):
+        logger.error(f"Error: directory {args.fits_root} does not exist")
+        sys.exit(1)
 
-# --- Thumbnail function ---
-def make_thumbnail(data, size):
+    if use_service(args):
+        try:
+            run_in_service(args)
+            return
+        except socket.timeout:
+            # The service took the pass, so running it here as well could
+            # index the same files twice at once.
+            logger.error(f"The indexing service did not finish within {args.service_timeout:.0f}s; "
+                         f"check the watcher or rerun with --local")
+            sys.exit(1)
+        except OSError as e:
+            logger.warning(f"Indexing service not reachable ({e}), running locally")
+
+    # The indexer and its decoders are only imported for a local pass.
+    import mysql.connector
+    from indexer import Indexer
+
+    indexer = Indexer(
+        args.fits_root,
+        {'host': args.host, 'user': args.user, 'password': args.password, 'database': args.database},
+        thumb_size=args.thumb_size, workers=args.workers, single_pass=args.single_pass,
+        batch_size=args.batch_size, manifest_path=args.manifest, retention_days=args.retention_days,
+        thumb_dir=args.thumb_dir, thumb_format=args.thumb_format, thumb_sizes=args.thumb_sizes,
+        header_only=args.header_only, fingerprint=args.fingerprint,
+        prefetch_mb=args.prefetch_mb, prefetch_threads=args.prefetch_threads,
+        decode_budget_mb=args.decode_budget_mb,
+        chunk_rows=args.chunk_rows, rows_per_sec=args.rows_per_sec
+    )
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
     try:
-        data = np.nan_to_num(data)
-        p_low, p_high = np.nanpercentile(data, [0.5, 99.5])
-        if p_high <= p_low:
-            stretched = np.zeros_like(data, dtype=float)
+        if args.refresh_metadata:
+            indexer.refresh_metadata()
         else:
-            stretched = (data - p_low) / (p_high - p_low)
-        stretched = np.clip(stretched, 0, 1)
-        img = (stretched * 255).astype(np.uint8)
-        image = Image.fromarray(img)
-        image.thumbnail(size)
-        buf = BytesIO()
-        image.save(buf, format='PNG')
-        return buf.getvalue()
-    except Exception as e:
-        logger.warning(f"Thumbnail generation failed: {e}")
-        return None
-
-# --- Database cleanup functions ---
-def soft_delete_missing_files(conn, cur, db_files, disk_files):
-    logger.info("Marking missing files as deleted (soft delete)...")
-    db_paths = {p for p, f in db_files.items() if f['deleted_at'] is None}
-    disk_paths = set(disk_files.keys())
-    missing_paths = db_paths - disk_paths
-    
-    if not missing_paths:
-        logger.info("Soft delete complete. No missing files to mark.")
-        return 0
-
-    batch_size = 500
-    missing_paths_list = list(missing_paths)
-    update_time = datetime.now()
-    hashes_to_update = set()
-
-    for i in range(0, len(missing_paths_list), batch_size):
-        batch_paths = missing_paths_list[i:i+batch_size]
-        format_strings = ','.join(['%s'] * len(batch_paths))
-        cur.execute(f"SELECT file_hash FROM files WHERE path IN ({format_strings})", tuple(batch_paths))
-        for row in cur.fetchall():
-            hashes_to_update.add(row[0])
-
-    for i in range(0, len(missing_paths_list), batch_size):
-        batch = [(update_time, path) for path in missing_paths_list[i:i+batch_size]]
-        cur.executemany("UPDATE files SET deleted_at = %s WHERE path = %s", batch)
-
-    if hashes_to_update:
-        logger.info(f"Updating duplicate counts for {len(hashes_to_update)} unique hashes...")
-        for file_hash in hashes_to_update:
-            update_duplicate_counts(conn, cur, file_hash)
-
-    conn.commit()
-    logger.info(f"Soft delete complete. Marked {len(missing_paths)} files as deleted.")
-    return len(missing_paths)
-
-def purge_deleted_files(conn, cur, retention_days):
-    if retention_days <= 0:
-        logger.info("Purge skipped as retention_days is zero or less.")
-        return 0
-        
-    logger.info(f"Purging files deleted more than {retention_days} days ago...")
-    cur.execute("SELECT DISTINCT file_hash FROM files WHERE deleted_at < NOW() - INTERVAL %s DAY", (retention_days,))
-    hashes_to_update = [row[0] for row in cur.fetchall()]
-
-    if not hashes_to_update:
-        logger.info("Purge complete. No old files to remove.")
-        return 0
-
-    cur.execute("DELETE FROM files WHERE deleted_at < NOW() - INTERVAL %s DAY", (retention_days,))
-    removed_count = cur.rowcount
-    
-    if removed_count > 0:
-        logger.info(f"Permanently removed {removed_count} files. Updating duplicate counts...")
-        for file_hash in hashes_to_update:
-            update_duplicate_counts(conn, cur, file_hash)
-        conn.commit()
-        logger.info(f"Duplicate counts updated for {len(hashes_to_update)} unique hashes.")
-    else:
-        logger.info("Purge complete. No old files to remove.")
-    
-    return removed_count
-
-def update_duplicate_counts(conn, cur, file_hash):
-    if not file_hash:
-        return
-    try:
-        cur.execute("SELECT COUNT(*) FROM files WHERE file_hash = %s AND deleted_at IS NULL", (file_hash,))
-        total_count = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM files WHERE file_hash = %s AND deleted_at IS NULL AND is_hidden = 0", (file_hash,))
-        visible_count = cur.fetchone()[0]
-        cur.execute("UPDATE files SET total_duplicate_count = %s, visible_duplicate_count = %s WHERE file_hash = %s", (total_count, visible_count, file_hash))
+            indexer.full_pass(
+                force=args.force, full_scan=args.full_scan, skip_cleanup=args.skip_cleanup,
+                verify_manifest=args.verify_manifest, rebuild_manifest=args.rebuild_manifest
+            )
+        if args.confirm_hashes:
+            # Linux derives the I/O priority of a process from its nice value.
+            os.nice(10)
+            indexer.confirm_hashes(bytes_per_sec=args.confirm_rate * 1024 * 1024)
+        if args.run_job:
+            from maintenance import run_job
+            for name in args.run_job:
+                run_job(indexer, name)
     except mysql.connector.Error as err:
-        logger.error(f"Error updating duplicate count for hash {file_hash}: {err}")
-
-def get_header_value(header, key, default=None, type_func=None):
-    val = header.get(key, default)
-    if val is None or val == '':
-        return default
-    if type_func:
-        try:
-            return type_func(val)
-        except (ValueError, TypeError):
-            return default
-    return val
-
-def get_xisf_header_value(header, key, default=None, type_func=None):
-    if key in header and header[key]:
-        val = header[key][0].get('value', default)
-    else:
-        val = default
-    if val is None or val == '':
-        return default
-    if type_func:
-        try:
-            if type_func == bool and isinstance(val, str):
-                if val.lower() == 'true': return True
-                if val.lower() == 'false': return False
-            return type_func(val)
-        except (ValueError, TypeError):
-            return default
-    return val
-
-# --- Main execution ---
-try:
-    logger.info(f"Connecting to database {args.database} on {args.host}")
-    conn = mysql.connector.connect(host=args.host, user=args.user, password=args.password, database=args.database)
-    cur = conn.cursor()
-
-    logger.info("Loading existing file data from database...")
-    cur.execute("SELECT path, file_hash, mtime, file_size, deleted_at FROM files")
-    db_files = {row[0]: {'hash': row[1], 'mtime': row[2], 'size': row[3], 'deleted_at': row[4]} for row in cur.fetchall()}
-    db_hashes = {}
-    for path, rec in db_files.items():
-        db_hashes.setdefault(rec['hash'], []).append(path)
-    logger.info(f"Loaded {len(db_files)} records from the database.")
-
-    logger.info("Starting file indexing...")
-    start_time = datetime.now()
-    processed_count = 0
-    error_count = 0
-    skipped_count = 0
-    soft_deleted_count = 0
-    purged_count = 0
-    disk_files = {}
-
-    for root, dirs, files in os.walk(fits_root):
-        for file in files:
-            file_lower = file.lower()
-            if not file_lower.endswith(('.fits', '.fit', '.xisf')):
-                continue
-
-            full_path = os.path.join(root, file)
-            rel_path = os.path.relpath(full_path, fits_root)
-            disk_files[rel_path] = True
-
-            try:
-                stat = os.stat(full_path)
-                mtime = stat.st_mtime
-                file_size = stat.st_size
-
-                if not force_reindex and rel_path in db_files:
-                    db_entry = db_files[rel_path]
-                    mtime_match = False
-                    if db_entry['mtime'] is not None:
-                        mtime_match = int(float(db_entry['mtime'])) == int(mtime)
-                    size_match = db_entry['size'] == file_size
-                    is_deleted = db_entry['deleted_at'] is not None
-                    if not is_deleted and mtime_match and size_match:
-                        skipped_count += 1
-                        continue
-
-                file_hash = calculate_hash(full_path)
-                header, data, get_value = {}, None, None
-
-                if file_lower.endswith(('.fits', '.fit')):
-                    with fits.open(full_path, ignore_missing_end=True) as hdul:
-                        header = hdul[0].header
-                        data = hdul[0].data
-                        get_value = get_header_value
-                elif file_lower.endswith('.xisf'):
-                    xisf_file = XISF(full_path)
-                    images_meta = xisf_file.get_images_metadata()
-                    if not images_meta:
-                        logger.warning(f"No image metadata in XISF file: {rel_path}")
-                        continue
-                    header = images_meta[0].get('FITSKeywords', {})
-                    data = xisf_file.read_image(0)
-                    get_value = get_xisf_header_value
-                
-                thumb = None
-                if data is not None:
-                    data = np.squeeze(data)
-                    if data.ndim > 2 and data.shape[0] < 5:
-                        data = data[0]
-                    if data.ndim >= 2:
-                        thumb = make_thumbnail(data, thumb_size)
-
-                object_name = get_value(header, 'OBJECT', 'Unknown', str).strip()
-                date_obs_str = get_value(header, 'DATE-OBS', None, str)
-                date_obs = None
-                if date_obs_str:
-                    try:
-                        normalized_date_str = date_obs_str.replace('/', '-')
-                        date_obs = Time(normalized_date_str, format='isot' if 'T' in normalized_date_str else 'iso').to_datetime()
-                    except Exception:
-                        logger.warning(f"Unparsable DATE-OBS: '{date_obs_str}' in {rel_path}")
-
-                exptime = get_value(header, 'EXPTIME', 0, float)
-                filt = get_value(header, 'FILTER', '', str)
-                imgtype = get_value(header, 'IMAGETYP', 'UNKNOWN', str).upper()
-                xbinning = get_value(header, 'XBINNING', None, int)
-                ybinning = get_value(header, 'YBINNING', None, int)
-                egain = get_value(header, 'EGAIN', None, float)
-                offset = get_value(header, 'OFFSET', None, float)
-                xpixsz = get_value(header, 'XPIXSZ', None, float)
-                ypixsz = get_value(header, 'YPIXSZ', None, float)
-                instrume = get_value(header, 'INSTRUME', None, str)
-                set_temp = get_value(header, 'SET-TEMP', None, float)
-                ccd_temp = get_value(header, 'CCD-TEMP', None, float)
-                telescop = get_value(header, 'TELESCOP', None, str)
-                focallen = get_value(header, 'FOCALLEN', None, float)
-                focratio = get_value(header, 'FOCRATIO', None, float)
-                ra = get_value(header, 'RA', None, float)
-                dec = get_value(header, 'DEC', None, float)
-                centalt = get_value(header, 'CENTALT', None, float)
-                centaz = get_value(header, 'CENTAZ', None, float)
-                airmass = get_value(header, 'AIRMASS', None, float)
-                pierside = get_value(header, 'PIERSIDE', None, str)
-                siteelev = get_value(header, 'SITEELEV', None, float)
-                sitelat = get_value(header, 'SITELAT', None, float)
-                sitelong = get_value(header, 'SITELONG', None, float)
-                focpos = get_value(header, 'FOCPOS', None, int)
-                if focpos is None:
-                    focpos = get_value(header, 'FOCUSPOS', None, int)
-
-                sql = '''
-                    INSERT INTO files (
-                        path, file_hash, name, mtime, file_size, object, date_obs, exptime, filter, imgtype,
-                        xbinning, ybinning, egain, `offset`, xpixsz, ypixsz, instrume,
-                        set_temp, ccd_temp, telescop, focallen, focratio, ra, `dec`,
-                        centalt, centaz, airmass, pierside, siteelev, sitelat, sitelong,
-                        focpos, thumb, deleted_at, is_hidden
-                    ) VALUES (
-                        %(path)s, %(file_hash)s, %(name)s, %(mtime)s, %(file_size)s, %(object)s, %(date_obs)s, %(exptime)s, %(filter)s, %(imgtype)s,
-                        %(xbinning)s, %(ybinning)s, %(egain)s, %(offset)s, %(xpixsz)s, %(ypixsz)s, %(instrume)s,
-                        %(set_temp)s, %(ccd_temp)s, %(telescop)s, %(focallen)s, %(focratio)s, %(ra)s, %(dec)s,
-                        %(centalt)s, %(centaz)s, %(airmass)s, %(pierside)s, %(siteelev)s, %(sitelat)s, %(sitelong)s,
-                        %(focpos)s, %(thumb)s, NULL, 0
-                    )
-                    ON DUPLICATE KEY UPDATE
-                        file_hash=VALUES(file_hash), mtime=VALUES(mtime), file_size=VALUES(file_size),
-                        name=VALUES(name), object=VALUES(object), date_obs=VALUES(date_obs),
-                        exptime=VALUES(exptime), filter=VALUES(filter), imgtype=VALUES(imgtype),
-                        xbinning=VALUES(xbinning), ybinning=VALUES(ybinning), egain=VALUES(egain),
-                        `offset`=VALUES(`offset`), xpixsz=VALUES(xpixsz), ypixsz=VALUES(ypixsz),
-                        instrume=VALUES(instrume), set_temp=VALUES(set_temp), ccd_temp=VALUES(ccd_temp),
-                        telescop=VALUES(telescop), focallen=VALUES(focallen), focratio=VALUES(focratio),
-                        ra=VALUES(ra), `dec`=VALUES(`dec`), centalt=VALUES(centalt), centaz=VALUES(centaz),
-                        airmass=VALUES(airmass), pierside=VALUES(pierside), siteelev=VALUES(siteelev),
-                        sitelat=VALUES(sitelat), sitelong=VALUES(sitelong), focpos=VALUES(focpos),
-                        thumb=COALESCE(VALUES(thumb), thumb),
-                        deleted_at=NULL, is_hidden=is_hidden
-                '''
-                params = {
-                    'path': rel_path, 'file_hash': file_hash, 'name': file, 'mtime': mtime, 'file_size': file_size,
-                    'object': object_name, 'date_obs': date_obs, 'exptime': exptime, 'filter': filt, 'imgtype': imgtype,
-                    'xbinning': xbinning, 'ybinning': ybinning, 'egain': egain, 'offset': offset,
-                    'xpixsz': xpixsz, 'ypixsz': ypixsz, 'instrume': instrume, 'set_temp': set_temp,
-                    'ccd_temp': ccd_temp, 'telescop': telescop, 'focallen': focallen,
-                    'focratio': focratio, 'ra': ra, 'dec': dec, 'centalt': centalt,
-                    'centaz': centaz, 'airmass': airmass, 'pierside': pierside,
-                    'siteelev': siteelev, 'sitelat': sitelat, 'sitelong': sitelong,
-                    'focpos': focpos, 'thumb': thumb
-                }
-                cur.execute(sql, params)
-                update_duplicate_counts(conn, cur, file_hash)
-
-                if rel_path in db_files and db_files[rel_path]['hash'] != file_hash:
-                    old_hash = db_files[rel_path]['hash']
-                    update_duplicate_counts(conn, cur, old_hash)
-
-                db_files[rel_path] = {'hash': file_hash, 'mtime': mtime, 'size': file_size, 'deleted_at': None}
-                db_hashes.setdefault(file_hash, []).append(rel_path)
-                
-                processed_count += 1
-                if processed_count % commit_interval == 0:
-                    conn.commit()
-                    logger.info(f'Progress: {processed_count} files processed, {skipped_count} skipped.')
-
-            except Exception as e:
-                logger.error(f'Error processing {rel_path}: {e}')
-                error_count += 1
-    
-    conn.commit()
-
-    if not args.skip_cleanup:
-        soft_deleted_count = soft_delete_missing_files(conn, cur, db_files, disk_files)
-        purged_count = purge_deleted_files(conn, cur, args.retention_days)
-
-    duration = datetime.now() - start_time
-    logger.info("=== Indexing Complete ===")
-    logger.info(f"Duration: {duration}")
-    logger.info(f"Files processed: {processed_count}")
-    logger.info(f"Files skipped: {skipped_count}")
-    logger.info(f"Files soft-deleted: {soft_deleted_count}")
-    logger.info(f"Files purged: {purged_count}")
-    logger.info(f"Errors encountered: {error_count}")
-
-except mysql.connector.Error as err:
-    logger.error(f"Database error: {err}")
-    sys.exit(1)
-except Exception as e:
-    logger.error(f"Unexpected error: {e}")
-    sys.exit(1)
-finally:
-    if 'conn' in locals() and conn.is_connected():
-        conn.close()
-
+        logger.error(f"Database error: {err}")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        sys.exit(1)
+    finally:
+        indexer.close()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logger.info(f"Profile written to {args.profile}")
+        if args.metrics_json:
+            indexer.metrics.write_json(args.metrics_json)
+            logger.info(f"Metrics written to {args.metrics_json}")
+
+if __name__ == "__main__":
+    main()
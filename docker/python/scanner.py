@@ -0,0 +1,139 @@
+import os
+import time
+
+VALID_EXTS = ('.fits', '.fit', '.xisf')
+
+
+class DirListing:
+    """One directory visited by walk_tree().
+
+    files maps each image file name to its os.stat_result, or to the
+    OSError raised while stating it. When the listing came from the cache
+    (cached is True) the files were not stated and every value is None.
+    """
+    __slots__ = ('rel_dir', 'mtime_ns', 'subdirs', 'files', 'cached')
+
+    def __init__(self, rel_dir, mtime_ns, subdirs, files, cached):
+        self.rel_dir = rel_dir
+        self.mtime_ns = mtime_ns
+        self.subdirs = subdirs
+        self.files = files
+        self.cached = cached
+
+
+def list_directory(full_dir):
+    """List a directory with os.scandir, returning (subdirs, {file: stat or error}).
+
+    Like os.walk, symlinked directories are not descended into, and anything
+    that is not a directory is treated as a file.
+    """
+    subdirs, files = [], {}
+    with os.scandir(full_dir) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if not entry.is_symlink():
+                    subdirs.append(entry.name)
+                continue
+            if not entry.name.lower().endswith(VALID_EXTS):
+                continue
+            try:
+                files[entry.name] = entry.stat()
+            except OSError as e:
+                files[entry.name] = e
+    subdirs.sort()
+    return subdirs, files
+
+
+def walk_tree(root, cache=None):
+    """Walk root top-down and yield a DirListing per directory.
+
+    cache, when given, must provide lookup(rel_dir) returning
+    (mtime_ns, subdirs, file_names) or None. A directory whose mtime still
+    matches the cached value is not re-listed and its files are not stated:
+    adding, removing or renaming entries always bumps the directory mtime.
+    """
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        full_dir = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            mtime_ns = os.stat(full_dir).st_mtime_ns
+        except OSError:
+            continue
+
+        cached = cache.lookup(rel_dir) if cache is not None else None
+        if cached is not None and cached[0] == mtime_ns:
+            listing = DirListing(rel_dir, mtime_ns, cached[1], dict.fromkeys(cached[2]), True)
+        else:
+            try:
+                subdirs, files = list_directory(full_dir)
+            except OSError:
+                continue
+            listing = DirListing(rel_dir, mtime_ns, subdirs, files, False)
+
+        yield listing
+        stack.extend(os.path.join(rel_dir, d) if rel_dir else d for d in reversed(listing.subdirs))
+
+
+def is_settled(mtime_ns, scan_start, window=2.0):
+    """True when a directory mtime is old enough to be trusted on the next scan.
+
+    Entries created within the same timestamp tick as the scan would not
+    change the mtime we recorded, so recent directories are not cached.
+    """
+    return mtime_ns < (scan_start - window) * 1e9
+
+
+class DirCache:
+    """In-memory directory cache for repeated walks of the same tree.
+
+    scan() re-lists only directories whose mtime changed since the previous
+    call, and diffs just those listings against what it saw last time, so
+    the cost of a cycle scales with churn rather than with library size.
+    """
+
+    def __init__(self):
+        # rel_dir -> (mtime_ns or None, subdirs, file_names)
+        self.dirs = {}
+
+    def lookup(self, rel_dir):
+        return self.dirs.get(rel_dir)
+
+    def files(self):
+        return {os.path.join(d, name) if d else name for d, (_, _, names) in self.dirs.items() for name in names}
+
+    def scan(self, root, window=2.0):
+        """Walk root and return (created, deleted, stats) since the previous scan.
+
+        created and deleted are sets of paths relative to root. stats has the
+        number of directories visited and re-listed, the entries read from
+        those listings, and the duration in seconds.
+        """
+        start = time.time()
+        seen = {}
+        created, deleted = set(), set()
+        stats = {'dirs': 0, 'listed': 0, 'entries': 0}
+        for listing in walk_tree(root, cache=self):
+            rel_dir = listing.rel_dir
+            stats['dirs'] += 1
+            names = list(listing.files)
+            if not listing.cached:
+                stats['listed'] += 1
+                stats['entries'] += len(names) + len(listing.subdirs)
+                previous = self.dirs.get(rel_dir)
+                before = set(previous[2]) if previous else set()
+                after = set(names)
+                created.update(os.path.join(rel_dir, n) if rel_dir else n for n in after - before)
+                deleted.update(os.path.join(rel_dir, n) if rel_dir else n for n in before - after)
+            mtime_ns = listing.mtime_ns if is_settled(listing.mtime_ns, start, window) else None
+            seen[rel_dir] = (mtime_ns, listing.subdirs, names)
+        for rel_dir, (_, _, names) in self.dirs.items():
+            if rel_dir not in seen:
+                deleted.update(os.path.join(rel_dir, n) if rel_dir else n for n in names)
+        self.dirs = seen
+        stats['seconds'] = time.time() - start
+        return created, deleted, stats
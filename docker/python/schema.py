@@ -0,0 +1,58 @@
+import logging
+
+logger = logging.getLogger('reindex')
+
+# Statements that bring a database created from an older init.sql up to
+# date. Every statement must be idempotent: they run on each indexer start.
+MIGRATIONS = [
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS thumb_format VARCHAR(8) NULL AFTER thumb",
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS thumb_sizes VARCHAR(64) NULL AFTER thumb_format",
+    "CREATE INDEX IF NOT EXISTS idx_live_path ON files (deleted_at, is_hidden, path(255))",
+    "CREATE INDEX IF NOT EXISTS idx_live_name ON files (deleted_at, is_hidden, name)",
+    "CREATE INDEX IF NOT EXISTS idx_live_date_obs ON files (deleted_at, is_hidden, date_obs)",
+    "CREATE INDEX IF NOT EXISTS idx_live_object ON files (deleted_at, is_hidden, object, date_obs)",
+    "CREATE INDEX IF NOT EXISTS idx_live_filter ON files (deleted_at, is_hidden, filter, date_obs)",
+    "CREATE INDEX IF NOT EXISTS idx_live_imgtype ON files (deleted_at, is_hidden, imgtype, date_obs)",
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS directory_id INT NULL AFTER path",
+    "CREATE INDEX IF NOT EXISTS idx_live_directory ON files (directory_id, deleted_at, is_hidden)",
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS hash_kind VARCHAR(8) NOT NULL DEFAULT 'xxh64' AFTER file_hash",
+    "CREATE INDEX IF NOT EXISTS idx_hash_kind ON files (hash_kind, file_hash)",
+    """CREATE TABLE IF NOT EXISTS directories (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        parent_id INT NULL,
+        path VARCHAR(1024) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        depth INT NOT NULL DEFAULT 0,
+        file_count INT NOT NULL DEFAULT 0,
+        live_count INT NOT NULL DEFAULT 0,
+        total_exposure DOUBLE NOT NULL DEFAULT 0,
+        latest_date_obs DATETIME NULL,
+        tree_file_count INT NOT NULL DEFAULT 0,
+        tree_live_count INT NOT NULL DEFAULT 0,
+        tree_exposure DOUBLE NOT NULL DEFAULT 0,
+        tree_latest_date_obs DATETIME NULL,
+        UNIQUE INDEX idx_dir_path (path),
+        INDEX idx_dir_parent (parent_id, name)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+    "ALTER TABLE directories ADD COLUMN IF NOT EXISTS stale TINYINT(1) NOT NULL DEFAULT 0 AFTER tree_latest_date_obs",
+    "CREATE INDEX IF NOT EXISTS idx_dir_stale ON directories (stale)",
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS thumb_attempt_mtime DECIMAL(16, 6) NULL AFTER thumb_sizes",
+    """CREATE TABLE IF NOT EXISTS directory_facets (
+        directory_id INT NOT NULL,
+        object VARCHAR(255) NOT NULL DEFAULT '',
+        filter VARCHAR(50) NOT NULL DEFAULT '',
+        imgtype VARCHAR(50) NOT NULL DEFAULT '',
+        file_count INT NOT NULL DEFAULT 0,
+        live_count INT NOT NULL DEFAULT 0,
+        total_exposure DOUBLE NOT NULL DEFAULT 0,
+        PRIMARY KEY (directory_id, object, filter, imgtype)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+]
+
+
+def migrate(conn, cur):
+    """Apply the schema migrations in order and commit."""
+    for statement in MIGRATIONS:
+        logger.debug(f"Schema migration: {statement}")
+        cur.execute(statement)
+    conn.commit()
@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+
+logger = logging.getLogger('reindex')
+
+# Requests the service accepts and the keyword arguments each one takes.
+COMMANDS = {
+    'full_pass': ('force', 'full_scan', 'skip_cleanup', 'verify_manifest', 'rebuild_manifest'),
+    'confirm_hashes': ('limit', 'bytes_per_sec'),
+}
+
+
+class ControlServer:
+    """Accepts indexing requests on a unix socket for a long-lived indexer.
+
+    Each connection sends one JSON object per line, e.g.
+    {"command": "full_pass", "args": {"force": true}}, and gets one JSON
+    reply per line: {"ok": true, "result": ...} or {"ok": false, "error": ...}.
+    Requests are not run on the socket threads: they are queued for the
+    thread that owns the Indexer, which calls run_pending() between its
+    other work, so the indexer is never used from two threads at once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.requests = queue.Queue()
+        self.queued = threading.Event()
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            # A socket left behind by a previous container run.
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        control = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    reply = control.submit(line)
+                    self.wfile.write(json.dumps(reply, default=str).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads = True
+        os.chmod(self.path, 0o600)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='control', daemon=True)
+        self.thread.start()
+        logger.info(f"Accepting indexing requests on {self.path}")
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def submit(self, line):
+        """Parse one request line, queue it and wait for its reply."""
+        try:
+            request = json.loads(line)
+            command = request['command']
+            args = request.get('args') or {}
+        except (ValueError, TypeError, KeyError) as e:
+            return {'ok': False, 'error': f"malformed request: {e}"}
+        if command not in COMMANDS:
+            return {'ok': False, 'error': f"unknown command {command!r}"}
+        unknown = set(args) - set(COMMANDS[command])
+        if unknown:
+            return {'ok': False, 'error': f"unknown arguments for {command}: {', '.join(sorted(unknown))}"}
+        reply = queue.Queue(maxsize=1)
+        self.requests.put((command, args, reply))
+        self.queued.set()
+        return reply.get()
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds, returning early when a request arrives."""
+        self.queued.wait(timeout)
+
+    def run_pending(self, handlers):
+        """Run the queued requests with handlers[command](**args) and answer them.
+
+        Returns the number of requests run.
+        """
+        self.queued.clear()
+        ran = 0
+        while True:
+            try:
+                command, args, reply = self.requests.get_nowait()
+            except queue.Empty:
+                return ran
+            logger.info(f"Running {command} requested on {self.path}")
+            try:
+                reply.put({'ok': True, 'result': handlers[command](**args)})
+            except Exception as e:
+                logger.error(f"Requested {command} failed: {e}")
+                reply.put({'ok': False, 'error': str(e)})
+            ran += 1
+
+
+def request(path, command, args=None, timeout=None, connect_timeout=10):
+    """Send one request to the ControlServer at path and return its reply dict.
+
+    Connecting gives up after connect_timeout seconds and waiting for the
+    reply after timeout seconds (None waits forever); both raise OSError
+    (socket.timeout for the reply).
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(connect_timeout)
+        sock.connect(path)
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps({'command': command, 'args': args or {}}).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"{path} closed the connection without a reply")
+    return json.loads(line)
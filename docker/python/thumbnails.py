@@ -0,0 +1,192 @@
+import logging
+import mmap
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, features
+
+from fsutil import write_atomic
+
+logger = logging.getLogger('reindex')
+
+# Number of full-resolution pixels sampled to estimate the stretch clip points.
+CLIP_SAMPLE_PIXELS = 1_000_000
+# Full-resolution pixels binned per strip, which bounds the temporaries.
+STRIP_PIXELS = 4_000_000
+
+# --- Decimation helpers ---
+def bin_factor(shape, size):
+    """Integer binning factor that brings the frame to about twice the thumbnail size.
+
+    Keeping 2x oversampling leaves Pillow's final antialiased resize enough
+    detail for a result that matches a full-resolution downscale.
+    """
+    return max(1, max(shape[:2]) // (2 * max(size)))
+
+def _mapping(data):
+    """The mmap a (memory-mapped) array is a view of, or None."""
+    base = data
+    while base is not None and not isinstance(base, mmap.mmap):
+        base = getattr(base, 'base', None)
+    return base
+
+def release_pages(data):
+    """Drop the pages of a memory-mapped frame that have been read so far.
+
+    Mapped file pages count towards the process RSS until the mapping is
+    closed; releasing them after each strip keeps the RSS bounded. They are
+    read from the file (or page cache) again if touched later.
+    """
+    mapping = _mapping(data)
+    if mapping is not None and hasattr(mmap, 'MADV_DONTNEED'):
+        mapping.madvise(mmap.MADV_DONTNEED)
+
+def bin_image(data, factor):
+    """Block-average a 2D array by factor in both axes, as float32.
+
+    A trailing channel axis, as in (h, w, 3) colour frames, is kept and each
+    channel binned on its own. Non-finite pixels count as zero, the same way np.nan_to_num treated them
+    in the full-resolution path. Edge rows/columns that do not fill a whole
+    block are dropped. The frame is binned in row strips, so a memory-mapped
+    frame is paged in a strip at a time and the temporaries stay small.
+    """
+    if factor <= 1:
+        return np.nan_to_num(np.asarray(data, dtype=np.float32))
+    h = data.shape[0] // factor
+    w = data.shape[1] // factor
+    channels = data.shape[2:]
+    binned = np.empty((h, w) + channels, dtype=np.float32)
+    rows = max(1, STRIP_PIXELS // (w * factor * factor * int(np.prod(channels))))
+    floating = np.issubdtype(data.dtype, np.floating)
+    for y in range(0, h, rows):
+        n = min(rows, h - y)
+        blocks = data[y * factor:(y + n) * factor, :w * factor].reshape((n, factor, w, factor) + channels)
+        if floating:
+            np.add.reduce(blocks, axis=(1, 3), dtype=np.float32, where=np.isfinite(blocks), out=binned[y:y + n])
+        else:
+            np.add.reduce(blocks, axis=(1, 3), dtype=np.float32, out=binned[y:y + n])
+        release_pages(data)
+    binned /= factor * factor
+    return binned
+
+def clip_points(data, low=0.5, high=99.5):
+    """Estimate the stretch percentiles from a strided sample of the frame.
+
+    The channels of a colour frame share one pair of clip points, so the
+    stretch keeps their balance.
+    """
+    step = max(1, int(np.sqrt(data.shape[0] * data.shape[1] / CLIP_SAMPLE_PIXELS)))
+    rows = data[::step, ::step]
+    sample = np.empty(rows.shape, dtype=np.float32)
+    chunk = max(1, STRIP_PIXELS // (data.shape[1] * step * int(np.prod(data.shape[2:]))))
+    for y in range(0, rows.shape[0], chunk):
+        sample[y:y + chunk] = rows[y:y + chunk]
+        release_pages(data)
+    return np.percentile(np.nan_to_num(sample, copy=False), [low, high])
+
+# --- Thumbnail function ---
+def stretch_image(data, size, bscale=1.0, bzero=0.0):
+    """Autostretch a 2D frame into an 8-bit PIL image no larger than size.
+
+    A channels-last (h, w, 3) frame becomes an RGB image.
+
+    The frame is block-averaged down to near the target size before any
+    stretching, so no full-resolution temporaries are allocated and the
+    percentiles are computed on a sample rather than by sorting every pixel.
+
+    bscale and bzero are the FITS scaling of raw, unscaled pixel values;
+    binning and percentiles are linear, so they are applied afterwards.
+    """
+    p_low, p_high = sorted(clip_points(data) * bscale + bzero)
+    img = bin_image(data, bin_factor(data.shape, size))
+    if bscale != 1.0 or bzero != 0.0:
+        img *= bscale
+        img += bzero
+    if p_high <= p_low:
+        img = np.zeros(img.shape, dtype=np.uint8)
+    else:
+        img -= p_low
+        img *= 255.0 / (p_high - p_low)
+        np.clip(img, 0, 255, out=img)
+        img = img.astype(np.uint8)
+    image = Image.fromarray(img)
+    image.thumbnail(size)
+    return image
+
+def encode_image(image, fmt='png'):
+    buf = BytesIO()
+    if fmt == 'png':
+        image.save(buf, format='PNG')
+    else:
+        image.save(buf, format=fmt.upper(), quality=80)
+    return buf.getvalue()
+
+def make_thumbnail(data, size, bscale=1.0, bzero=0.0):
+    """Render a 2D frame as an autostretched PNG thumbnail no larger than size."""
+    try:
+        return encode_image(stretch_image(data, size, bscale, bzero))
+    except Exception as e:
+        logger.warning(f"Thumbnail generation failed: {e}")
+        return None
+
+# --- Static thumbnail files ---
+THUMB_FORMATS = ('webp', 'avif', 'png')
+
+def parse_sizes(value):
+    """Parse a comma-separated list of thumbnail sizes such as '150,300,600'."""
+    return [int(v) for v in str(value).split(',') if v.strip()]
+
+def supported_format(fmt):
+    """Return fmt if this Pillow build can encode it, otherwise fall back to png."""
+    fmt = fmt.lower()
+    if fmt not in THUMB_FORMATS:
+        logger.warning(f"Unknown thumbnail format '{fmt}', using png")
+        return 'png'
+    if fmt != 'png' and not features.check(fmt):
+        logger.warning(f"Pillow was built without {fmt} support, using png thumbnails")
+        return 'png'
+    return fmt
+
+def thumbnail_path(thumb_dir, file_hash, size, fmt):
+    """Content-addressed location of one thumbnail: <dir>/<ab>/<hash>_<size>.<fmt>."""
+    return os.path.join(thumb_dir, file_hash[:2], f"{file_hash}_{size}.{fmt}")
+
+def thumbnails_exist(thumb_dir, file_hash, sizes, fmt):
+    return all(os.path.exists(thumbnail_path(thumb_dir, file_hash, size, fmt)) for size in sizes)
+
+def link_thumbnails(thumb_dir, old_hash, new_hash, sizes, fmt):
+    """Make the thumbnails of old_hash available under new_hash as well."""
+    for size in sizes:
+        src = thumbnail_path(thumb_dir, old_hash, size, fmt)
+        dst = thumbnail_path(thumb_dir, new_hash, size, fmt)
+        if os.path.exists(dst) or not os.path.exists(src):
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            os.link(src, dst)
+        except FileExistsError:
+            pass
+        except OSError:
+            with open(src, 'rb') as f:
+                write_atomic(dst, f.read())
+
+def write_thumbnails(thumb_dir, file_hash, data, sizes, fmt, bscale=1.0, bzero=0.0):
+    """Render data once at the largest size and write every size as a file.
+
+    Files are keyed by the content hash, so identical frames share them and
+    an existing set is never rewritten. Returns True when all sizes exist.
+    """
+    try:
+        image = stretch_image(data, (max(sizes), max(sizes)), bscale, bzero)
+        for size in sorted(sizes, reverse=True):
+            path = thumbnail_path(thumb_dir, file_hash, size, fmt)
+            if os.path.exists(path):
+                continue
+            resized = image.copy()
+            resized.thumbnail((size, size))
+            write_atomic(path, encode_image(resized, fmt))
+        return True
+    except Exception as e:
+        logger.warning(f"Thumbnail generation failed: {e}")
+        return False
@@ -4,8 +4,7 @@ import sys
 import os
 import argparse
 import logging
-import subprocess
-import platform
+import threading
 from pathlib import Path
 from watchdog.observers import Observer
 try:
@@ -14,6 +13,13 @@ except ImportError:
     PollingObserver = None
 from watchdog.events import FileSystemEventHandler, FileSystemEvent
 
+from headers import is_complete
+from indexer import Indexer
+from thumbnails import parse_sizes
+from scanner import VALID_EXTS, DirCache
+from service import ControlServer
+from maintenance import MaintenanceScheduler, parse_schedule
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, # Changed default level to INFO for better feedback
@@ -21,24 +27,105 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-VALID_EXTS = {".fits", ".fit", ".xisf"}
+class SettleTracker:
+    """Holds changed paths until the capture software has finished writing them.
+
+    A path is released once its size and mtime have been stable for
+    `window` seconds and, with check_complete, its FITS END card and data
+    (or XISF header and data blocks) are all on disk. Paths that no longer
+    exist are released at once so the deletion gets indexed. A file that
+    never looks complete is released after max_wait so the indexer can
+    report the error.
+    """
+    def __init__(self, root, window=5.0, check_complete=True, max_wait=600.0):
+        self.root = root
+        self.window = float(window)
+        self.check_complete = check_complete
+        self.max_wait = float(max_wait)
+        self.lock = threading.Lock()
+        # rel_path -> [size, mtime_ns, stable_since, first_seen]
+        self.pending = {}
+
+    def touch(self, rel_paths):
+        now = time.time()
+        with self.lock:
+            for rel_path in rel_paths:
+                entry = self.pending.get(rel_path)
+                if entry is None:
+                    self.pending[rel_path] = [None, None, now, now]
+                else:
+                    entry[2] = now
+
+    def pending_paths(self):
+        with self.lock:
+            return set(self.pending)
+
+    def poll(self):
+        """Return the paths that are ready to be indexed and stop tracking them."""
+        now = time.time()
+        with self.lock:
+            items = list(self.pending.items())
+        ready = []
+        for rel_path, entry in items:
+            full_path = os.path.join(self.root, rel_path)
+            try:
+                st = os.stat(full_path)
+            except FileNotFoundError:
+                ready.append(rel_path)
+                continue
+            except OSError:
+                continue
+            if (st.st_size, st.st_mtime_ns) != (entry[0], entry[1]):
+                entry[0], entry[1], entry[2] = st.st_size, st.st_mtime_ns, now
+                continue
+            if now - entry[2] < self.window:
+                continue
+            if self.check_complete and not is_complete(full_path):
+                if now - entry[3] < self.max_wait:
+                    logging.debug(f"Waiting for {rel_path} to be completely written")
+                    continue
+                logging.warning(f"{rel_path} still looks incomplete after {self.max_wait:.0f}s, indexing anyway")
+            ready.append(rel_path)
+        with self.lock:
+            for rel_path in ready:
+                entry = self.pending.get(rel_path)
+                # Leave paths that saw new activity while we were polling.
+                if entry is not None and entry[2] <= now:
+                    del self.pending[rel_path]
+        return ready
 
 class FitsHandler(FileSystemEventHandler):
-    def __init__(self, fits_dir, reindex_script, db_params, rescan_interval=5, debug=False, retention_days=30, thumb_size=300):
+    def __init__(self, fits_dir, indexer, rescan_interval=5, full_pass_interval=21600, settle_seconds=5, check_complete=True,
+                 metrics_file='', metrics_interval=60, control=None, maintenance=None, full_scan=False):
         self.fits_dir = Path(fits_dir)
-        self.reindex_script = Path(reindex_script)
-        self.db_params = db_params
-        self.debug = debug
-        self.retention_days = retention_days
-        self.thumb_size = thumb_size
-        self.pending_reindex = False
+        self.indexer = indexer
+        self.control = control
+        self.maintenance = maintenance
+        self.metrics_file = metrics_file
+        self.metrics_interval = float(metrics_interval)
+        self.last_metrics = 0.0
+        self.lock = threading.Lock()
+        self.settle = SettleTracker(fits_dir, window=settle_seconds, check_complete=check_complete)
+        # old rel_path -> new rel_path for moves reported by the observer
+        self.moves = {}
+        self.pending_full_pass = False
+        # The next full pass stats every file instead of trusting the
+        # manifest for directories whose mtime is unchanged. With full_scan
+        # every pass does, for when no observer reports in-place rewrites.
+        self.pending_full_scan = False
+        self.full_scan = full_scan
         self.last_reindex = 0
         self.cooldown = 10  # Reduced cooldown
         self.reindex_reason = "startup"
+        # reindex.py or --initial-pass runs a full pass when the watcher starts
+        self.last_full_pass = time.time()
+        self.full_pass_interval = float(full_pass_interval)
         self.rescan_interval = float(rescan_interval)
         self.last_scan = 0.0
-        self.known_files = self._initial_scan()
-        logging.info(f"Initial known files count: {len(self.known_files)}")
+        self.resolved_dir = Path(self._normalize_path(self.fits_dir))
+        self.dir_cache = DirCache()
+        self.dir_cache.scan(str(self.fits_dir))
+        logging.info(f"Initial known files count: {len(self.dir_cache.files())}")
 
     def _normalize_path(self, p):
         try:
@@ -47,25 +134,20 @@ class FitsHandler(FileSystemEventHandler):
             rp = Path(p).absolute()
         return os.path.normcase(str(rp))
 
+    def _rel_path(self, path):
+        for base in (self.fits_dir, self.resolved_dir):
+            try:
+                return str(Path(path).relative_to(base))
+            except ValueError:
+                continue
+        return None
+
     def _is_valid_file(self, path):
         try:
             return Path(path).suffix.lower() in VALID_EXTS
         except Exception:
             return False
 
-    def _initial_scan(self):
-        result = set()
-        try:
-            for p in self.fits_dir.rglob("*"):
-                try:
-                    if p.is_file() and p.suffix.lower() in VALID_EXTS:
-                        result.add(self._normalize_path(p))
-                except Exception:
-                    continue
-        except Exception as e:
-            logging.error(f"Initial scan error: {e}")
-        return result
-
     def dispatch(self, event):
         if not isinstance(event, FileSystemEvent):
             logging.warning(f"Unexpected event type: {type(event)}")
@@ -73,18 +155,17 @@ class FitsHandler(FileSystemEventHandler):
         logging.debug(f"DISPATCH: {event.event_type} | is_dir={event.is_directory} | src={event.src_path}")
         super().dispatch(event)
 
-    def _log_and_schedule(self, src_path, reason):
+    def _log_and_schedule(self, src_path, reason, *extra_paths):
         try:
             rel_path = Path(src_path).relative_to(self.fits_dir)
         except Exception:
             rel_path = src_path
         logging.info(f"{reason}: {rel_path}")
-        self.schedule_reindex(reason)
+        self.schedule_reindex(reason, [src_path, *extra_paths])
 
     def on_created(self, event):
         if event.is_directory: return
         if self._is_valid_file(event.src_path):
-            self.known_files.add(self._normalize_path(event.src_path))
             self._log_and_schedule(event.src_path, "file creation")
 
     def on_modified(self, event):
@@ -93,19 +174,30 @@ class FitsHandler(FileSystemEventHandler):
             self._log_and_schedule(event.src_path, "file modification")
 
     def on_moved(self, event):
-        if event.is_directory: return
-        src_norm = self._normalize_path(event.src_path)
-        dest_norm = self._normalize_path(event.dest_path)
-        if self._is_valid_file(src_norm):
-            self.known_files.discard(src_norm)
-        if self._is_valid_file(dest_norm):
-            self.known_files.add(dest_norm)
-        self._log_and_schedule(event.dest_path, "file move")
+        src_rel, dest_rel = self._rel_path(event.src_path), self._rel_path(event.dest_path)
+        if event.is_directory:
+            if src_rel is None or dest_rel is None:
+                self.schedule_full_pass(f"directory move: {event.src_path} -> {event.dest_path}")
+                return
+            pairs = []
+            for root, _, files in os.walk(event.dest_path):
+                for file in files:
+                    if self._is_valid_file(file):
+                        rel = os.path.relpath(os.path.join(root, file), event.dest_path)
+                        pairs.append((os.path.join(src_rel, rel), os.path.join(dest_rel, rel)))
+            self.schedule_moves(f"directory move: {src_rel} -> {dest_rel}", pairs)
+            return
+        if src_rel is None or dest_rel is None:
+            self._log_and_schedule(event.dest_path, "file move", event.src_path)
+            return
+        if self._is_valid_file(event.src_path) or self._is_valid_file(event.dest_path):
+            self.schedule_moves(f"file move: {src_rel} -> {dest_rel}", [(src_rel, dest_rel)])
 
     def on_deleted(self, event):
-        if event.is_directory: return
+        if event.is_directory:
+            self.schedule_full_pass(f"directory deletion: {event.src_path}")
+            return
         if self._is_valid_file(event.src_path):
-            self.known_files.discard(self._normalize_path(event.src_path))
             self._log_and_schedule(event.src_path, "file deletion")
 
     def scan_and_detect(self):
@@ -113,105 +205,286 @@ class FitsHandler(FileSystemEventHandler):
         if now - self.last_scan < self.rescan_interval:
             return
         self.last_scan = now
+        if not os.path.isdir(self.fits_dir):
+            # An unmounted share must not look like every file was deleted.
+            logging.warning(f"Rescan skipped, {self.fits_dir} is not available")
+            return
         try:
-            current = set()
-            for p in self.fits_dir.rglob("*"):
-                try:
-                    if p.is_file() and p.suffix.lower() in VALID_EXTS:
-                        current.add(self._normalize_path(p))
-                except Exception:
-                    continue
-            created = current - self.known_files
-            deleted = self.known_files - current
+            created, deleted, stats = self.dir_cache.scan(str(self.fits_dir))
+            level = logging.INFO if stats['seconds'] >= 1.0 else logging.DEBUG
+            logging.log(level, f"Rescan visited {stats['dirs']} directories, re-listed {stats['listed']} "
+                               f"({stats['entries']} entries) in {stats['seconds']:.3f}s")
+            self.indexer.metrics.record('rescan', stats['seconds'])
             if created:
                 logging.info(f"Scan detected {len(created)} created file(s)")
-                self.known_files.update(created)
-                self.schedule_reindex("scan creation")
+                self.schedule_reindex("scan creation", [self.fits_dir / p for p in created])
             if deleted:
                 logging.info(f"Scan detected {len(deleted)} deleted file(s)")
-                for p in deleted: self.known_files.discard(p)
-                self.schedule_reindex("scan deletion")
+                self.schedule_reindex("scan deletion", [self.fits_dir / p for p in deleted])
         except Exception as e:
             logging.error(f"Rescan error: {e}")
 
-    def schedule_reindex(self, reason="unknown"):
-        self.pending_reindex = True
-        self.reindex_reason = reason
+    def schedule_reindex(self, reason="unknown", paths=()):
+        rel_paths = [r for r in (self._rel_path(p) for p in paths) if r is not None]
+        if rel_paths:
+            self.settle.touch(rel_paths)
+        else:
+            with self.lock:
+                self.pending_full_pass = True
+        with self.lock:
+            self.reindex_reason = reason
         logging.info(f"Reindex scheduled due to {reason}.")
 
-    def check_and_reindex(self):
-        if not self.pending_reindex:
+    def schedule_moves(self, reason, pairs):
+        """Queue moves so the rows are relinked instead of reindexed."""
+        with self.lock:
+            self.moves.update(pairs)
+            self.reindex_reason = reason
+        logging.info(f"Relink of {len(pairs)} moved file(s) scheduled due to {reason}.")
+
+    def schedule_full_pass(self, reason, full_scan=False):
+        with self.lock:
+            self.pending_full_pass = True
+            self.pending_full_scan = self.pending_full_scan or full_scan
+            self.reindex_reason = reason
+        logging.info(f"Full reindex pass scheduled due to {reason}.")
+
+    def write_metrics(self, force=False):
+        """Export the indexer metrics after work was done, or at least every metrics_interval."""
+        if not self.metrics_file:
+            return
+        now = time.time()
+        if not force and now - self.last_metrics < self.metrics_interval:
             return
+        try:
+            self.indexer.metrics.write_prometheus(self.metrics_file)
+        except OSError as e:
+            logging.error(f"Error writing metrics to {self.metrics_file}: {e}")
+        self.last_metrics = now
+
+    def urgent_paths(self):
+        """Paths that settled while a full pass is running, for it to index first.
+
+        Deleted paths are put back and handled by index_paths() after the pass.
+        """
+        ready = self.settle.poll()
+        gone = [p for p in ready if not os.path.exists(os.path.join(self.fits_dir, p))]
+        if gone:
+            self.settle.touch(gone)
+        return [p for p in ready if p not in gone]
+
+    def inline_purge(self):
+        """Full passes only purge old rows when no maintenance job does it."""
+        return self.maintenance is None or not self.maintenance.has('purge')
+
+    def run_maintenance(self):
+        """Give scheduled maintenance a slice of time while no indexing work is waiting."""
+        if self.maintenance is None:
+            return
+        with self.lock:
+            busy = self.pending_full_pass or bool(self.moves)
+        if not busy:
+            self.maintenance.run()
+
+    def requested_full_pass(self, **options):
+        """Run a full pass asked for over the control socket."""
+        try:
+            counts = self.indexer.full_pass(defer_paths=self.settle.pending_paths(), purge=self.inline_purge(),
+                                            urgent=self.urgent_paths, **options)
+        except Exception:
+            self.indexer.close()
+            raise
+        self.last_full_pass = time.time()
+        return counts
+
+    def requested_confirm_hashes(self, **options):
+        try:
+            return self.indexer.confirm_hashes(**options)
+        except Exception:
+            self.indexer.close()
+            raise
+
+    def check_and_reindex(self):
         current_time = time.time()
+        self.write_metrics(force=False)
+        if self.control is not None:
+            ran = self.control.run_pending({
+                'full_pass': self.requested_full_pass,
+                'confirm_hashes': self.requested_confirm_hashes,
+            })
+            if ran:
+                self.write_metrics(force=True)
+        # Files hidden or shown in the web app flag their directories.
+        try:
+            self.indexer.refresh_stale_directories()
+        except Exception as e:
+            logging.error(f"Error refreshing directory rollups: {e}")
+            self.indexer.close()
+        if current_time - self.last_full_pass >= self.full_pass_interval:
+            # Files rewritten in place keep their directory's mtime, so the
+            # safety-net pass must not trust the manifest.
+            self.schedule_full_pass("periodic full pass", full_scan=True)
+
+        # Moves are applied first, so the rescan's view of the old paths as
+        # deleted does not soft-delete rows that are about to be relinked.
+        with self.lock:
+            moves, self.moves = self.moves, {}
+        if moves:
+            try:
+                leftover = self.indexer.relink_moves(list(moves.items()))
+                if leftover:
+                    self.settle.touch(leftover)
+            except Exception as e:
+                logging.error(f"Error relinking moved files: {e}")
+                self.settle.touch([p for pair in moves.items() for p in pair])
+                self.indexer.close()
+            self.write_metrics(force=True)
+
+        # Changed files are indexed as soon as they have settled; the settle
+        # window takes the place of the cooldown for them.
+        ready = self.settle.poll()
+        if ready:
+            with self.lock:
+                reason = self.reindex_reason
+            logging.info(f"Indexing {len(ready)} settled path(s) (reason: {reason})")
+            try:
+                self.indexer.index_paths(ready)
+                logging.info("Reindexing completed successfully")
+            except Exception as e:
+                logging.error(f"Error during reindexing: {e}")
+                # Keep the work for the next attempt and reconnect from scratch.
+                self.settle.touch(ready)
+                self.indexer.close()
+            self.write_metrics(force=True)
+
+        if not self.pending_full_pass:
+            return
         if current_time - self.last_reindex < self.cooldown:
             return
-        logging.info(f"Cooldown elapsed, starting reindex (reason: {self.reindex_reason})")
+
+        with self.lock:
+            self.pending_full_pass = False
+            full_scan, self.pending_full_scan = self.pending_full_scan or self.full_scan, False
+            reason = self.reindex_reason
         try:
-            cmd = [
-                sys.executable, str(self.reindex_script), str(self.fits_dir),
-                "--host", self.db_params["host"], "--user", self.db_params["user"],
-                "--password", self.db_params["password"], "--database", self.db_params["database"],
-                "--retention-days", str(self.retention_days),
-                "--thumb-size", str(self.thumb_size)
-            ]
-            if self.debug:
-                cmd.append("--debug")
-            subprocess.run(cmd, check=True)
+            logging.info(f"Cooldown elapsed, starting full reindex pass (reason: {reason})")
+            # Files still being written are left for the settle tracker.
+            self.indexer.full_pass(full_scan=full_scan, defer_paths=self.settle.pending_paths(),
+                                   purge=self.inline_purge(), urgent=self.urgent_paths)
+            self.last_full_pass = current_time
             logging.info("Reindexing completed successfully")
-            self.last_reindex = current_time
-            self.pending_reindex = False
-        except subprocess.CalledProcessError as e:
+        except Exception as e:
             logging.error(f"Error during reindexing: {e}")
+            with self.lock:
+                self.pending_full_pass = True
+                self.pending_full_scan = self.pending_full_scan or full_scan
+            self.indexer.close()
+        self.last_reindex = current_time
+        self.write_metrics(force=True)
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Monitor a directory for files and trigger reindex.")
+    parser = argparse.ArgumentParser(description="Monitor a directory for files and index changes.")
     parser.add_argument("fits_dir", help="Directory to monitor")
-    parser.add_argument("--reindex-script", default=os.getenv("REINDEX_SCRIPT", "/opt/scripts/reindex.py"),help="Path to the reindex script")
     parser.add_argument("--db-host", default=os.getenv("DB_HOST", "mariadb"), help="MariaDB host")
     parser.add_argument("--db-user", default=os.getenv("DB_USER", "awi_user"), help="Database username")
     parser.add_argument("--db-password", default=os.getenv("DB_PASS", "awi_password"), help="Database password")
     parser.add_argument("--db-name", default=os.getenv("DB_NAME", "awi_db"), help="Database name")
     parser.add_argument("--rescan-interval", default=float(os.getenv("RESCAN_INTERVAL", 5)), type=float,help="Interval in seconds for periodic directory rescan to detect deletions (default: 5s)")
+    parser.add_argument("--observer", choices=["native", "polling", "none"], default=os.getenv("WATCH_OBSERVER", "native"), help="Filesystem event source used alongside the directory rescan (default: native)")
+    parser.add_argument("--settle-seconds", default=float(os.getenv("SETTLE_SECONDS", 5)), type=float, help="Seconds a file's size and mtime must stay unchanged before it is indexed (default: 5s)")
+    parser.add_argument("--full-pass-interval", default=float(os.getenv("FULL_REINDEX_INTERVAL", 21600)), type=float, help="Seconds between full reindex passes that catch anything the events missed (default: 6h)")
+    parser.add_argument("--initial-pass", action="store_true", help="Run a full reindex pass in this process at startup instead of relying on a reindex.py run before it")
+    parser.add_argument("--control-socket", default=os.getenv("CONTROL_SOCKET", ""), help="Accept reindex requests (e.g. from reindex.py) on this unix socket; empty to disable")
+    parser.add_argument("--maintenance", type=parse_schedule, default=parse_schedule(os.getenv("MAINTENANCE_SCHEDULE", "cleanup=43200,purge=86400,duplicates=604800,thumbnails=86400,hashes=3600")), help="Maintenance jobs to run in the background as job=seconds pairs (jobs: cleanup, purge, duplicates, thumbnails, hashes); empty to disable")
+    parser.add_argument("--metrics-file", default=os.getenv("METRICS_FILE", ""), help="Write indexing metrics in the Prometheus text format to this file (e.g. for the node_exporter textfile collector)")
     args = parser.parse_args()
 
     is_debug = os.getenv('DEBUG', 'false').lower() in ('true', '1')
+    check_complete = os.getenv('SETTLE_CHECK_COMPLETE', 'true').lower() in ('true', '1')
     retention_days = int(os.getenv('RETENTION_DAYS', 30))
     thumb_size = int(os.getenv('THUMB_SIZE', 300))
 
+    if is_debug:
+        logging.getLogger('reindex').setLevel(logging.DEBUG)
+
     if not os.path.isdir(args.fits_dir):
         logging.error(f"Directory {args.fits_dir} does not exist")
         sys.exit(1)
-    if not os.path.isfile(args.reindex_script):
-        logging.error(f"Reindex script {args.reindex_script} does not exist")
-        sys.exit(1)
     db_params = { "host": args.db_host, "user": args.db_user, "password": args.db_password, "database": args.db_name }
 
-    # Force PollingObserver for reliability in Docker environments
-    if PollingObserver is None:
-        logging.error("PollingObserver not available. Please install watchdog.")
-        sys.exit(1)
-    observer = PollingObserver()
-    logging.info("Using PollingObserver for reliability across all platforms.")
-    
+    indexer = Indexer(
+        args.fits_dir, db_params, thumb_size=thumb_size, retention_days=retention_days,
+        workers=int(os.getenv("REINDEX_WORKERS", 1)),
+        single_pass=os.getenv("SINGLE_PASS_READ", "false").lower() in ("true", "1"),
+        fingerprint=os.getenv("FINGERPRINT_HASH", "false").lower() in ("true", "1"),
+        prefetch_mb=int(os.getenv("PREFETCH_MB", 0)),
+        prefetch_threads=int(os.getenv("PREFETCH_THREADS", 4)),
+        decode_budget_mb=int(os.getenv("DECODE_BUDGET_MB", 1024)),
+        manifest_path=os.getenv("MANIFEST_PATH", ""),
+        thumb_dir=os.getenv("THUMB_DIR", ""),
+        thumb_format=os.getenv("THUMB_FORMAT", "webp"),
+        thumb_sizes=parse_sizes(os.getenv("THUMB_SIZES", "")),
+        chunk_rows=int(os.getenv("MAINTENANCE_CHUNK_ROWS", 200)),
+        rows_per_sec=float(os.getenv("MAINTENANCE_ROWS_PER_SEC", 1000)),
+        cache_files=True
+    )
+
+    # The directory rescan alone catches creations and deletions on any
+    # filesystem; an observer adds low-latency events on top of it.
+    observer = None
+    if args.observer == "polling":
+        if PollingObserver is None:
+            logging.error("PollingObserver not available. Please install watchdog.")
+            sys.exit(1)
+        observer = PollingObserver()
+        logging.info("Using PollingObserver in addition to the directory rescan.")
+    elif args.observer == "native":
+        observer = Observer()
+        logging.info(f"Using {type(observer).__name__} in addition to the directory rescan.")
+    else:
+        logging.info("No filesystem observer, relying on the directory rescan.")
+
+    control = ControlServer(args.control_socket) if args.control_socket else None
     event_handler = FitsHandler(
-        args.fits_dir, args.reindex_script, db_params,
-        rescan_interval=args.rescan_interval, debug=is_debug, retention_days=retention_days, thumb_size=thumb_size
+        args.fits_dir, indexer,
+        rescan_interval=args.rescan_interval, full_pass_interval=args.full_pass_interval,
+        settle_seconds=args.settle_seconds, check_complete=check_complete,
+        metrics_file=args.metrics_file, control=control,
+        maintenance=MaintenanceScheduler(indexer, args.maintenance) if args.maintenance else None,
+        # Polling and the rescan can miss or never see files rewritten in
+        # place (NFS/SMB shares), so every full pass stats every file.
+        full_scan=args.observer != "native"
     )
-    observer.schedule(event_handler, args.fits_dir, recursive=True)
-    observer.start()
+    if observer is not None:
+        observer.schedule(event_handler, args.fits_dir, recursive=True)
+        observer.start()
+    if control is not None:
+        control.start()
+    if args.initial_pass:
+        # Runs on the first loop iteration, so changes made while it is
+        # running are already being watched.
+        event_handler.last_reindex = 0
+        event_handler.schedule_full_pass("startup")
 
     logging.info(f"Started monitoring directory {args.fits_dir}")
     try:
         while True:
             event_handler.check_and_reindex()
-            # The polling observer handles this, but we keep the scan for safety
             event_handler.scan_and_detect()
-            time.sleep(1)
+            event_handler.run_maintenance()
+            if control is not None:
+                control.wait(1)
+            else:
+                time.sleep(1)
     except KeyboardInterrupt:
-        observer.stop()
         logging.info("Monitoring interrupted by user")
-    observer.join()
+    if observer is not None:
+        observer.stop()
+        observer.join()
+    if control is not None:
+        control.stop()
+    indexer.close()
 
 if __name__ == "__main__":
     main()
@@ -50,116 +50,89 @@ if (empty($ids)) {
     exit;
 }
 
-// 2. Fetch all data for the selected files
-try {
-    $conn = connectDB();
-    $placeholders = implode(',', array_fill(0, count($ids), '?'));
-    
-    $stmt = $conn->prepare(
-        "SELECT id, object, date_obs, exptime, filter, imgtype, xbinning, egain, ccd_temp, focratio
-         FROM files WHERE id IN ($placeholders)"
-    );
-    $stmt->execute($ids);
-    $files = $stmt->fetchAll(PDO::FETCH_ASSOC);
-    
-} catch (Exception $e) {
-    echo "Error: Could not retrieve file data from database.\n";
-    error_log("AstroBin CSV Export Error: " . $e->getMessage());
-    exit;
+// 2. Stream the result straight to the client instead of building it in memory
+@set_time_limit(0);
+header('X-Accel-Buffering: no');
+while (ob_get_level() > 0) {
+    ob_end_flush();
 }
 
-// 3. Process data: separate lights from calibration frames
-$lights = [];
-$cal_frames = ['darks' => 0, 'flats' => 0, 'flatDarks' => 0, 'bias' => 0];
-
-foreach ($files as $file) {
-    $imgtype_upper = strtoupper(trim($file['imgtype'] ?? ''));
-    switch ($imgtype_upper) {
-        case 'LIGHT FRAME':
-        case 'LIGHT':
-            $lights[] = $file;
-            break;
-        case 'DARK FRAME':
-        case 'DARK':
-            $cal_frames['darks']++;
-            break;
-        case 'FLAT FIELD':
-        case 'FLAT':
-            $cal_frames['flats']++;
-            break;
-        case 'FLAT DARK':
-        case 'DARK FLAT':
-            $cal_frames['flatDarks']++;
-            break;
-        case 'BIAS FRAME':
-        case 'BIAS':
-            $cal_frames['bias']++;
-            break;
-    }
-}
+// The ids were validated as numeric, so they are inlined as integers rather
+// than bound: large selections would exceed the prepared statement
+// placeholder limit.
+$id_list = implode(',', array_map('intval', $ids));
 
-// 4. Aggregate light frames into sessions using the "astro-night" logic
 $full_header = [
     'date', 'filter', 'number', 'duration', 'iso', 'binning', 'gain', 'sensorCooling', 'fNumber',
     'darks', 'flats', 'flatDarks', 'bias', 'bortle', 'meanSqm', 'meanFwhm', 'temperature'
 ];
-$sessions = [];
-if (!empty($lights)) {
-    foreach ($lights as $light) {
-        $session_date = get_astro_session_date($light['date_obs']);
-        
-        // Create a unique key for each session
-        $key = sprintf(
-            '%s|%s|%s|%s|%s',
-            $session_date,
-            $light['filter'] ?? 'N/A',
-            (string)($light['exptime'] ?? 0),
-            (string)($light['xbinning'] ?? 1),
-            (string)($light['egain'] ?? 'N/A')
-        );
-        
-        if (!isset($sessions[$key])) {
-            // Initialize with all keys from the full header to ensure column order
-            $sessions[$key] = array_fill_keys($full_header, '');
-            
-            // Populate with available data
-            $sessions[$key]['date'] = $session_date;
-            $sessions[$key]['number'] = 0;
-            $sessions[$key]['duration'] = $light['exptime'] ?? 0;
-            $sessions[$key]['binning'] = $light['xbinning'] ?? 1;
-            $sessions[$key]['gain'] = $light['egain'] ?? '';
-            $sessions[$key]['sensorCooling'] = !is_null($light['ccd_temp']) ? round($light['ccd_temp']) : '';
-            $sessions[$key]['fNumber'] = $light['focratio'] ?? '';
+
+try {
+    $conn = connectDB();
+    $conn->setAttribute(PDO::MYSQL_ATTR_USE_BUFFERED_QUERY, false);
+
+    // 3. Count calibration frames in the database
+    $stmt = $conn->query(
+        "SELECT
+            COALESCE(SUM(UPPER(TRIM(imgtype)) IN ('DARK FRAME', 'DARK')), 0) AS darks,
+            COALESCE(SUM(UPPER(TRIM(imgtype)) IN ('FLAT FIELD', 'FLAT')), 0) AS flats,
+            COALESCE(SUM(UPPER(TRIM(imgtype)) IN ('FLAT DARK', 'DARK FLAT')), 0) AS flatDarks,
+            COALESCE(SUM(UPPER(TRIM(imgtype)) IN ('BIAS FRAME', 'BIAS')), 0) AS bias
+         FROM files WHERE id IN ($id_list)"
+    );
+    $cal_frames = array_map('intval', $stmt->fetch(PDO::FETCH_ASSOC));
+    $stmt->closeCursor();
+
+    // 4. Aggregate light frames into sessions using the "astro-night" logic:
+    // a session runs from noon to noon, so shifting by 12 hours gives its date.
+    // Sessions come out in the order their first frame was indexed.
+    $stmt = $conn->prepare(
+        "SELECT COALESCE(DATE(date_obs - INTERVAL 12 HOUR), ?) AS session_date,
+                exptime, xbinning, egain,
+                ROUND(AVG(ccd_temp)) AS ccd_temp, MIN(focratio) AS focratio, COUNT(*) AS number
+         FROM files
+         WHERE id IN ($id_list) AND UPPER(TRIM(imgtype)) IN ('LIGHT FRAME', 'LIGHT')
+         GROUP BY session_date, filter, exptime, xbinning, egain
+         ORDER BY MIN(id)"
+    );
+    $stmt->execute([get_astro_session_date(null)]);
+
+    // 5. Write the CSV one session at a time
+    $output = fopen('php://output', 'w');
+    fputcsv($output, $full_header);
+
+    $written = 0;
+    while ($light = $stmt->fetch(PDO::FETCH_ASSOC)) {
+        $row = array_fill_keys($full_header, '');
+        $row['date'] = $light['session_date'];
+        $row['number'] = $light['number'];
+        $row['duration'] = $light['exptime'] ?? 0;
+        $row['binning'] = $light['xbinning'] ?? 1;
+        $row['gain'] = $light['egain'] ?? '';
+        $row['sensorCooling'] = $light['ccd_temp'] ?? '';
+        $row['fNumber'] = $light['focratio'] ?? '';
+        if ($written === 0) {
+            // Calibration data goes on the first session
+            $row = array_merge($row, $cal_frames);
+        }
+        fputcsv($output, $row);
+        if (++$written % 100 === 0) {
+            flush();
         }
-        $sessions[$key]['number']++;
     }
-}
+    $stmt->closeCursor();
 
-// 5. Create output file handle and write CSV
-$output = fopen('php://output', 'w');
-
-// Write header
-fputcsv($output, $full_header);
-
-if (empty($sessions)) {
-    // If no light frames were selected, output a single line with just calibration data
-    $cal_only_row = array_fill_keys($full_header, '');
-    $cal_only_row['date'] = get_astro_session_date(null); // Default to "yesterday's" session
-    $cal_only_row = array_merge($cal_only_row, $cal_frames);
-    fputcsv($output, $cal_only_row);
-} else {
-    // Add calibration data to the first session found
-    $first = true;
-    foreach ($sessions as $session) {
-        if ($first) {
-            $session = array_merge($session, $cal_frames);
-            $first = false;
-        }
-        // Ensure all columns are present, even if empty
-        $row_to_write = array_merge(array_fill_keys($full_header, ''), $session);
-        fputcsv($output, $row_to_write);
+    if ($written === 0) {
+        // If no light frames were selected, output a single line with just calibration data
+        $cal_only_row = array_fill_keys($full_header, '');
+        $cal_only_row['date'] = get_astro_session_date(null); // Default to "yesterday's" session
+        $cal_only_row = array_merge($cal_only_row, $cal_frames);
+        fputcsv($output, $cal_only_row);
     }
-}
 
-fclose($output);
+    fclose($output);
+} catch (Exception $e) {
+    echo "Error: Could not retrieve file data from database.\n";
+    error_log("AstroBin CSV Export Error: " . $e->getMessage());
+}
 exit;
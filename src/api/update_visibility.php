@@ -30,7 +30,7 @@ $hash = $data['hash'];
 $newState = ($action === 'hide') ? 1 : 0;
 
 // Filter out non-integer IDs for security
-$ids = array_filter($ids, 'is_int');
+$ids = array_values(array_filter($ids, 'is_int'));
 
 if (empty($ids)) {
     echo json_encode(['success' => false, 'message' => 'No valid IDs provided.']);
@@ -63,6 +63,11 @@ try {
     $updateCountsStmt = $conn->prepare("UPDATE files SET total_duplicate_count = ?, visible_duplicate_count = ? WHERE file_hash = ?");
     $updateCountsStmt->execute([$newTotalCount, $newVisibleCount, $hash]);
 
+    // Hidden files drop out of the folder totals; the indexer refreshes
+    // the rollups of the directories flagged here.
+    $dirStmt = $conn->prepare("UPDATE directories SET stale = 1 WHERE id IN (SELECT directory_id FROM files WHERE id IN ($placeholders))");
+    $dirStmt->execute($ids);
+
     $conn->commit();
 
     echo json_encode([
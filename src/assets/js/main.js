@@ -324,6 +324,7 @@ document.addEventListener('DOMContentLoaded', () => {
         urlParams.set('sort_by', column);
         urlParams.set('sort_order', newSortOrder);
         urlParams.set('page', '1');
+        urlParams.delete('cursor');
         window.location.search = urlParams.toString();
     };
 
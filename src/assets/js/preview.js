@@ -21,7 +21,7 @@ document.addEventListener("DOMContentLoaded", () => {
                     overlay.classList.add("hidden");
                     isOverlayVisible = false;
                 } else {
-                    overlayImg.src = img.src;
+                    overlayImg.src = img.dataset.full || img.currentSrc || img.src;
                     overlay.classList.remove("hidden");
 
                     // Centra l'overlay dopo che è visibile
@@ -52,7 +52,7 @@ document.addEventListener("DOMContentLoaded", () => {
         // --- LOGICA ORIGINALE PER DESKTOP (HOVER) ---
         document.querySelectorAll(".thumb").forEach(img => {
             img.addEventListener("mouseenter", () => {
-                overlayImg.src = img.src;
+                overlayImg.src = img.dataset.full || img.currentSrc || img.src;
                 overlay.classList.remove("hidden");
             });
 
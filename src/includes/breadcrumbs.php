@@ -1,5 +1,6 @@
 <?php
 $queryParams = $_GET;
+unset($queryParams['cursor']); // Cursors only make sense within the current listing
 $baseQueryParams = $queryParams;
 unset($baseQueryParams['dir']);
 $baseQueryString = http_build_query($baseQueryParams);
@@ -12,16 +13,22 @@ $baseQueryString = http_build_query($baseQueryParams);
             <span class="mx-2 text-gray-500">/</span>
         </li>
         <?php
-        $pathParts = explode('/', $dir);
-        $currentPath = '';
-        foreach ($pathParts as $part) {
-            if (empty($part)) continue;
-            $currentPath .= ($currentPath === '' ? '' : '/') . $part;
-            $queryParams['dir'] = $currentPath;
+        // Ancestors come from the directories table; fall back to the raw path if it is not indexed yet
+        $chain = getDirectoryChain($conn, $dir);
+        if (empty($chain)) {
+            $currentPath = '';
+            foreach (explode('/', $dir) as $part) {
+                if (empty($part)) continue;
+                $currentPath .= ($currentPath === '' ? '' : '/') . $part;
+                $chain[] = ['path' => $currentPath, 'name' => $part];
+            }
+        }
+        foreach ($chain as $crumb) {
+            $queryParams['dir'] = $crumb['path'];
             $queryString = http_build_query($queryParams);
         ?>
             <li class="flex items-center">
-                <a href="?<?= $queryString ?>" class="text-blue-400 hover:text-blue-300"><?= htmlspecialchars($part) ?></a>
+                <a href="?<?= $queryString ?>" class="text-blue-400 hover:text-blue-300"><?= htmlspecialchars($crumb['name']) ?></a>
                 <span class="mx-2 text-gray-500">/</span>
             </li>
         <?php
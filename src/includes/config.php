@@ -12,6 +12,7 @@ define('DB_PASSWORD', getenv('DB_PASSWORD') ?: 'awi_password');
 // File system configuration
 
 define('FITS_ROOT', getenv('FITS_DATA_PATH') ?: '/var/fits'); // Root directory for FITS files
+define('THUMB_URL', rtrim(getenv('THUMB_URL') ?: '/thumbs', '/')); // Public URL of the static thumbnail directory
 
 // Site configuration
 
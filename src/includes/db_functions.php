@@ -16,77 +16,212 @@ function connectDB(): PDO
 
 function getFolders(PDO $conn, string $currentDir): array
 {
-    $folders = [];
-    $dirPattern = $currentDir === '' ? '%' : $currentDir . '/%';
-    $dirPrefix = $currentDir === '' ? '' : $currentDir . '/';
-
+    // Subfolders come from the directories table maintained by the indexer;
+    // folders whose subtree holds no live file are left out.
     $stmt = $conn->prepare("
-        SELECT DISTINCT
-            CASE
-                WHEN :dir_param = '' THEN 
-                    CASE 
-                        WHEN LOCATE('/', path) > 0 THEN SUBSTRING_INDEX(path, '/', 1)
-                        ELSE NULL
-                    END
-                ELSE SUBSTRING_INDEX(SUBSTRING(path, LENGTH(:dir_prefix) + 1), '/', 1)
-            END as folder
-        FROM files
-        WHERE path LIKE :like_pattern AND deleted_at IS NULL AND SUBSTRING(path, LENGTH(:dir_prefix2) + 1) LIKE '%/%'
-        HAVING folder IS NOT NULL AND folder != ''
-        ORDER BY folder
+        SELECT c.name
+        FROM directories p
+        JOIN directories c ON c.parent_id = p.id
+        WHERE p.path = :dir AND c.tree_live_count > 0
+        ORDER BY c.name
     ");
-    $stmt->bindValue(':dir_param', $currentDir, PDO::PARAM_STR);
-    $stmt->bindValue(':dir_prefix', $dirPrefix, PDO::PARAM_STR);
-    $stmt->bindValue(':dir_prefix2', $dirPrefix, PDO::PARAM_STR);
-    $stmt->bindValue(':like_pattern', $dirPattern, PDO::PARAM_STR);
+    $stmt->bindValue(':dir', $currentDir, PDO::PARAM_STR);
     $stmt->execute();
-    
+
+    $folders = [];
     while ($row = $stmt->fetch()) {
-        if (!empty($row['folder'])) {
-            $folders[] = $row['folder'];
-        }
+        $folders[] = $row['name'];
     }
     return $folders;
 }
 
-function countFiles(PDO $conn, string $dir, string $object, string $filter, string $imgtype, string $dateObsFrom, string $dateObsTo): int
+/**
+ * Get the directories row (with its rollups) for a relative path, or null.
+ */
+function getDirectory(PDO $conn, string $dir): ?array
+{
+    $stmt = $conn->prepare("SELECT * FROM directories WHERE path = :dir");
+    $stmt->bindValue(':dir', $dir, PDO::PARAM_STR);
+    $stmt->execute();
+    $row = $stmt->fetch();
+    return $row ?: null;
+}
+
+/**
+ * Get the known ancestors of a directory, and the directory itself, root excluded, top-down.
+ */
+function getDirectoryChain(PDO $conn, string $dir): array
 {
+    if ($dir === '') {
+        return [];
+    }
+    $paths = [];
+    $current = '';
+    foreach (explode('/', $dir) as $part) {
+        if ($part === '') continue;
+        $current .= ($current === '' ? '' : '/') . $part;
+        $paths[] = $current;
+    }
+    $placeholders = implode(',', array_fill(0, count($paths), '?'));
+    $stmt = $conn->prepare("SELECT path, name, tree_file_count FROM directories WHERE path IN ($placeholders) ORDER BY depth");
+    $stmt->execute($paths);
+    return $stmt->fetchAll();
+}
+
+/**
+ * Count the matching files and sum their exposure time in a single scan.
+ */
+function getFileTotals(PDO $conn, string $dir, string $object, string $filter, string $imgtype, string $dateObsFrom, string $dateObsTo): array
+{
+    // Without metadata filters the folder rollups answer with a point lookup.
+    if ($object === '' && $filter === '' && $imgtype === '' && $dateObsFrom === '' && $dateObsTo === '') {
+        $directory = getDirectory($conn, $dir);
+        if ($directory !== null) {
+            return [
+                'count' => (int)$directory['tree_file_count'],
+                'exposure' => (float)$directory['tree_exposure'],
+            ];
+        }
+    }
+
+    // Object/filter/imgtype filters are summed from the folder's facet rows.
+    if ($dateObsFrom === '' && $dateObsTo === '') {
+        list($where, $params) = buildFacetConditions($dir, $object, $filter, $imgtype);
+        $stmt = $conn->prepare("SELECT SUM(f.file_count) AS cnt, SUM(f.total_exposure) AS total_exposure FROM directory_facets f JOIN directories d ON d.id = f.directory_id WHERE " . implode(' AND ', $where));
+        $stmt->execute($params);
+        $result = $stmt->fetch();
+        return [
+            'count' => (int)($result['cnt'] ?? 0),
+            'exposure' => (float)($result['total_exposure'] ?? 0),
+        ];
+    }
+
     list($sql, $params) = buildQueryParts($dir, $object, $filter, $imgtype, $dateObsFrom, $dateObsTo);
-    
-    $countSql = "SELECT COUNT(*) as cnt FROM files WHERE " . implode(' AND ', $sql);
 
-    $stmt = $conn->prepare($countSql);
+    $totalsSql = "SELECT COUNT(*) as cnt, SUM(exptime) as total_exposure FROM files WHERE " . implode(' AND ', $sql);
+
+    $stmt = $conn->prepare($totalsSql);
     foreach ($params as $key => $value) {
         $stmt->bindValue($key, $value);
     }
 
     $stmt->execute();
     $result = $stmt->fetch();
-    return (int)($result['cnt'] ?? 0);
+    return [
+        'count' => (int)($result['cnt'] ?? 0),
+        'exposure' => (float)($result['total_exposure'] ?? 0),
+    ];
+}
+
+// Columns the listing can be sorted by, mapped to their SQL expression.
+const FILE_SORT_COLUMNS = [
+    'name' => 'name', 'path' => 'path', 'object' => 'object', 'date_obs' => 'date_obs', 'exptime' => 'exptime',
+    'filter' => 'filter', 'imgtype' => 'imgtype', 'xbinning' => 'xbinning', 'ybinning' => 'ybinning', 'egain' => 'egain',
+    'offset' => '`offset`', 'xpixsz' => 'xpixsz', 'ypixsz' => 'ypixsz', 'instrume' => 'instrume', 'set_temp' => 'set_temp',
+    'ccd_temp' => 'ccd_temp', 'telescop' => 'telescop', 'focallen' => 'focallen', 'focratio' => 'focratio', 'ra' => 'ra',
+    'dec' => '`dec`', 'centalt' => 'centalt', 'centaz' => 'centaz', 'airmass' => 'airmass', 'pierside' => 'pierside',
+    'siteelev' => 'siteelev', 'sitelat' => 'sitelat', 'sitelong' => 'sitelong', 'focpos' => 'focpos',
+    'visible_duplicate_count' => 'visible_duplicate_count', 'mtime' => 'mtime', 'file_hash' => 'file_hash'
+];
+
+// FLOAT columns: cursor values are compared as FLOAT so they match the stored single-precision value exactly.
+const FILE_FLOAT_COLUMNS = ['exptime', 'egain', 'offset', 'xpixsz', 'ypixsz', 'set_temp', 'ccd_temp', 'focallen', 'focratio', 'ra', 'dec', 'centalt', 'centaz', 'airmass', 'siteelev', 'sitelat', 'sitelong'];
+
+/**
+ * Encode the position of a row in the listing as a pagination cursor.
+ * $direction is 'a' (rows after this one) or 'b' (rows before it).
+ */
+function encodeFileCursor(array $row, string $sortBy, string $direction): string
+{
+    $sortBy = array_key_exists($sortBy, FILE_SORT_COLUMNS) ? $sortBy : 'name';
+    $payload = json_encode([$row[$sortBy], (int)$row['id']]);
+    return $direction . '.' . rtrim(strtr(base64_encode($payload), '+/', '-_'), '=');
+}
+
+/**
+ * Decode a cursor into [direction, value, id], or null when it is malformed.
+ */
+function decodeFileCursor(string $cursor): ?array
+{
+    if ($cursor === 'last') {
+        return ['last', null, 0];
+    }
+    if (!preg_match('/^([ab])\.([A-Za-z0-9_-]+)$/', $cursor, $m)) {
+        return null;
+    }
+    $payload = json_decode(base64_decode(strtr($m[2], '-_', '+/')), true);
+    if (!is_array($payload) || count($payload) !== 2 || !is_int($payload[1])) {
+        return null;
+    }
+    if ($payload[0] !== null && !is_scalar($payload[0])) {
+        return null;
+    }
+    return [$m[1], $payload[0], $payload[1]];
 }
 
-function getFiles(PDO $conn, string $dir, string $object, string $filter, string $imgtype, string $dateObsFrom, string $dateObsTo, int $perPage, int $offset, string $sortBy, string $sortOrder): array
+/**
+ * Keyset predicate selecting the rows that follow (value, id) in the given order.
+ * MariaDB sorts NULLs first ascending and last descending, which this mirrors.
+ */
+function keysetCondition(string $column, bool $isFloat, string $order, $value, array &$params): string
 {
-    // Validazione e sanitizzazione di sortBy e sortOrder
-    $allowedSortBy = ['name', 'path', 'object', 'date_obs', 'exptime', 'filter', 'imgtype', 'xbinning', 'ybinning', 'egain', 'offset', 'xpixsz', 'ypixsz', 'instrume', 'set_temp', 'ccd_temp', 'telescop', 'focallen', 'focratio', 'ra', 'dec', 'centalt', 'centaz', 'airmass', 'pierside', 'siteelev', 'sitelat', 'sitelong', 'focpos', 'visible_duplicate_count', 'mtime', 'file_hash'];
-    $allowedSortOrder = ['ASC', 'DESC'];
+    $cmp = $order === 'ASC' ? '>' : '<';
+    if ($value === null) {
+        return $order === 'ASC'
+            ? "(($column IS NULL AND id > :cursor_id) OR $column IS NOT NULL)"
+            : "($column IS NULL AND id < :cursor_id)";
+    }
+    $params[':cursor_value'] = (string)$value;
+    $params[':cursor_value2'] = (string)$value;
+    $v1 = $isFloat ? 'CAST(:cursor_value AS FLOAT)' : ':cursor_value';
+    $v2 = $isFloat ? 'CAST(:cursor_value2 AS FLOAT)' : ':cursor_value2';
+    $condition = "($column $cmp $v1 OR ($column = $v2 AND id $cmp :cursor_id))";
+    return $order === 'ASC' ? $condition : "($condition OR $column IS NULL)";
+}
 
-    $sortBy = in_array($sortBy, $allowedSortBy) ? $sortBy : 'name';
-    $sortOrder = in_array(strtoupper($sortOrder), $allowedSortOrder) ? strtoupper($sortOrder) : 'ASC';
+/**
+ * Fetch one page of files.
+ *
+ * With a cursor from encodeFileCursor() the page is located with a keyset
+ * predicate on (sort column, id) instead of OFFSET, so deep pages cost the
+ * same as the first one. The special cursor 'last' fetches the final
+ * $lastPageSize rows. Without a cursor $offset is used.
+ */
+function getFiles(PDO $conn, string $dir, string $object, string $filter, string $imgtype, string $dateObsFrom, string $dateObsTo, int $perPage, int $offset, string $sortBy, string $sortOrder, string $cursor = '', int $lastPageSize = 0): array
+{
+    $sortBy = array_key_exists($sortBy, FILE_SORT_COLUMNS) ? $sortBy : 'name';
+    $sortOrder = in_array(strtoupper($sortOrder), ['ASC', 'DESC']) ? strtoupper($sortOrder) : 'ASC';
+    $column = FILE_SORT_COLUMNS[$sortBy];
 
     list($sqlConditions, $params) = buildQueryParts($dir, $object, $filter, $imgtype, $dateObsFrom, $dateObsTo);
-    
-    $sql = "SELECT id, name, path, object, date_obs, exptime, filter, imgtype, xbinning, ybinning, egain, `offset`, xpixsz, ypixsz, instrume, set_temp, ccd_temp, telescop, focallen, focratio, ra, `dec`, centalt, centaz, airmass, pierside, siteelev, sitelat, sitelong, focpos, thumb, file_hash, mtime, total_duplicate_count, visible_duplicate_count FROM files WHERE " . implode(' AND ', $sqlConditions) . " ORDER BY " . $sortBy . " " . $sortOrder . " LIMIT :per_page OFFSET :offset";
+
+    // Rows before a cursor, and the last page, are read in reverse order and flipped afterwards.
+    $position = $cursor !== '' ? decodeFileCursor($cursor) : null;
+    $reverse = $position !== null && $position[0] !== 'a';
+    $order = $reverse ? ($sortOrder === 'ASC' ? 'DESC' : 'ASC') : $sortOrder;
+    if ($position !== null && $position[0] !== 'last') {
+        $sqlConditions[] = keysetCondition($column, in_array($sortBy, FILE_FLOAT_COLUMNS), $order, $position[1], $params);
+        $params[':cursor_id'] = $position[2];
+    }
+    $limit = ($position !== null && $position[0] === 'last' && $lastPageSize > 0) ? $lastPageSize : $perPage;
+
+    $sql = "SELECT id, name, path, object, date_obs, exptime, filter, imgtype, xbinning, ybinning, egain, `offset`, xpixsz, ypixsz, instrume, set_temp, ccd_temp, telescop, focallen, focratio, ra, `dec`, centalt, centaz, airmass, pierside, siteelev, sitelat, sitelong, focpos, thumb_format, thumb_sizes, IF(thumb_format IS NULL, thumb, NULL) AS thumb, file_hash, mtime, total_duplicate_count, visible_duplicate_count FROM files WHERE " . implode(' AND ', $sqlConditions) . " ORDER BY " . $column . " " . $order . ", id " . $order . " LIMIT :per_page";
+    if ($position === null) {
+        $sql .= " OFFSET :offset";
+    }
 
     $stmt = $conn->prepare($sql);
     foreach ($params as $key => $value) {
-        $stmt->bindValue($key, $value);
+        $stmt->bindValue($key, $value, is_int($value) ? PDO::PARAM_INT : PDO::PARAM_STR);
+    }
+    $stmt->bindValue(':per_page', $limit, PDO::PARAM_INT);
+    if ($position === null) {
+        $stmt->bindValue(':offset', $offset, PDO::PARAM_INT);
     }
-    $stmt->bindValue(':per_page', $perPage, PDO::PARAM_INT);
-    $stmt->bindValue(':offset', $offset, PDO::PARAM_INT);
 
     $stmt->execute();
-    return $stmt->fetchAll();
+    $rows = $stmt->fetchAll();
+    return $reverse ? array_reverse($rows) : $rows;
 }
 
 /**
@@ -96,52 +231,71 @@ function getFiles(PDO $conn, string $dir, string $object, string $filter, string
 function getDistinctValues(PDO $conn, string $column, string $dir, string $currentObject, string $currentFilter, string $currentImgtype): array
 {
     $values = [];
-    $dirPattern = $dir === '' ? '%' : $dir . '/%';
-    
+
     // Validazione della colonna per prevenire SQL injection
     $allowedColumns = ['object', 'filter', 'imgtype'];
     if (!in_array($column, $allowedColumns)) {
         throw new InvalidArgumentException('Invalid column name');
     }
-    
-    // Costruisci la query base con i filtri già attivi
-    $sql = "SELECT DISTINCT " . $column . " FROM files WHERE path LIKE :dir_pattern AND deleted_at IS NULL";
-
-    // Aggiungi gli altri filtri, ma escludi la colonna che stiamo filtrando ora
-    if ($column !== 'object' && $currentObject !== '') $sql .= " AND object = :object";
-    if ($column !== 'filter' && $currentFilter !== '') $sql .= " AND filter = :filter";
-    if ($column !== 'imgtype' && $currentImgtype !== '') $sql .= " AND imgtype = :imgtype";
-    
-    $sql .= " AND " . $column . " IS NOT NULL AND " . $column . " != '' ORDER BY " . $column;
-    
-    $stmt = $conn->prepare($sql);
-    $stmt->bindValue(':dir_pattern', $dirPattern, PDO::PARAM_STR);
-    
-    if ($column !== 'object' && $currentObject !== '') $stmt->bindValue(':object', $currentObject, PDO::PARAM_STR);
-    if ($column !== 'filter' && $currentFilter !== '') $stmt->bindValue(':filter', $currentFilter, PDO::PARAM_STR);
-    if ($column !== 'imgtype' && $currentImgtype !== '') $stmt->bindValue(':imgtype', $currentImgtype, PDO::PARAM_STR);
 
-    $stmt->execute();
+    // I valori vengono dalle faccette della cartella, escludendo la colonna che stiamo filtrando ora
+    list($where, $params) = buildFacetConditions(
+        $dir,
+        $column === 'object' ? '' : $currentObject,
+        $column === 'filter' ? '' : $currentFilter,
+        $column === 'imgtype' ? '' : $currentImgtype
+    );
+    $where[] = "f.live_count > 0";
+    $where[] = "f." . $column . " != ''";
+
+    $sql = "SELECT DISTINCT f." . $column . " FROM directory_facets f JOIN directories d ON d.id = f.directory_id WHERE " . implode(' AND ', $where) . " ORDER BY f." . $column;
+
+    $stmt = $conn->prepare($sql);
+    $stmt->execute($params);
     while ($r = $stmt->fetch()) {
         $values[] = $r[$column];
     }
     return $values;
 }
 
-function sumExposureTime(PDO $conn, string $dir, string $object, string $filter, string $imgtype, string $dateObsFrom, string $dateObsTo): float
+/**
+ * WHERE conditions selecting the facet rows of a folder subtree (alias f,
+ * joined to directories as d) that match the given header filters.
+ */
+function buildFacetConditions(string $dir, string $object, string $filter, string $imgtype): array
 {
-    list($sql, $params) = buildQueryParts($dir, $object, $filter, $imgtype, $dateObsFrom, $dateObsTo);
-    
-    $sumSql = "SELECT SUM(exptime) as total_exposure FROM files WHERE " . implode(' AND ', $sql);
-
-    $stmt = $conn->prepare($sumSql);
-    foreach ($params as $key => $value) {
-        $stmt->bindValue($key, $value);
+    $where = ["d.path = :dir"];
+    $params = [':dir' => $dir];
+    if ($object !== '') {
+        $where[] = "f.object = :object";
+        $params[':object'] = $object;
     }
+    if ($filter !== '') {
+        $where[] = "f.filter = :filter";
+        $params[':filter'] = $filter;
+    }
+    if ($imgtype !== '') {
+        $where[] = "f.imgtype = :imgtype";
+        $params[':imgtype'] = $imgtype;
+    }
+    return [$where, $params];
+}
 
-    $stmt->execute();
-    $result = $stmt->fetch();
-    return (float)($result['total_exposure'] ?? 0);
+/**
+ * Parse a YYYY-MM-DD date filter. Returns null for an empty value and
+ * throws InvalidArgumentException for anything else that is not a date,
+ * so a supplied filter is never dropped silently.
+ */
+function parseDateFilter(string $value): ?DateTime
+{
+    if ($value === '') {
+        return null;
+    }
+    $date = DateTime::createFromFormat('!Y-m-d', $value);
+    if ($date === false || $date->format('Y-m-d') !== $value) {
+        throw new InvalidArgumentException("Invalid date filter: $value");
+    }
+    return $date;
 }
 
 function buildQueryParts(string $dir, string $object, string $filter, string $imgtype, string $dateObsFrom, string $dateObsTo): array
@@ -167,13 +321,17 @@ function buildQueryParts(string $dir, string $object, string $filter, string $im
         $sql[] = "imgtype = :imgtype";
         $params[':imgtype'] = $imgtype;
     }
-    if ($dateObsFrom !== '') {
-        $sql[] = "DATE(date_obs) >= :date_obs_from";
-        $params[':date_obs_from'] = $dateObsFrom;
+    // Plain range predicates on date_obs so the index can be used; the
+    // upper bound is exclusive at midnight of the following day.
+    $from = parseDateFilter($dateObsFrom);
+    if ($from !== null) {
+        $sql[] = "date_obs >= :date_obs_from";
+        $params[':date_obs_from'] = $from->format('Y-m-d H:i:s');
     }
-    if ($dateObsTo !== '') {
-        $sql[] = "DATE(date_obs) <= :date_obs_to";
-        $params[':date_obs_to'] = $dateObsTo;
+    $to = parseDateFilter($dateObsTo);
+    if ($to !== null) {
+        $sql[] = "date_obs < :date_obs_to";
+        $params[':date_obs_to'] = $to->modify('+1 day')->format('Y-m-d H:i:s');
     }
 
     return [$sql, $params];
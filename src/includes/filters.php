@@ -54,6 +54,9 @@
             <span class="text-gray-400">-</span>
             <input type="date" id="date_obs_to" name="date_obs_to" value="<?= htmlspecialchars($_GET['date_obs_to'] ?? '') ?>" class="bg-gray-700 border border-gray-600 text-gray-100 text-sm rounded-lg focus:ring-blue-500 focus:border-blue-500 p-2.5">
                 </div>
+        <?php foreach ($invalidDateFilters as $invalidDate): ?>
+            <p class="mt-1 text-sm text-red-400"><?= htmlspecialchars(__('invalid_date_filter', ['value' => $invalidDate])) ?></p>
+        <?php endforeach; ?>
     </div>
 
     <!-- Items per page -->
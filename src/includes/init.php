@@ -16,6 +16,22 @@ require_once __DIR__ . '/template_functions.php';
 
 
 
+// Date filters the queries cannot use are removed from the request, so
+// the inputs and every link show them as cleared, and reported in the UI.
+$invalidDateFilters = [];
+foreach (['date_obs_from', 'date_obs_to'] as $param) {
+    $value = $_GET[$param] ?? '';
+    try {
+        if (!is_string($value)) {
+            throw new InvalidArgumentException('Invalid date filter');
+        }
+        parseDateFilter($value);
+    } catch (InvalidArgumentException $e) {
+        $invalidDateFilters[] = is_string($value) ? $value : '';
+        unset($_GET[$param]);
+    }
+}
+
 // GET parameters
 $dir = $_GET['dir'] ?? '';
 $filterObject = $_GET['object'] ?? '';
@@ -27,6 +43,7 @@ $page = max(1, intval($_GET['page'] ?? 1));
 $perPage = max(10, intval($_GET['per_page'] ?? DEFAULT_PER_PAGE));
 $sortBy = $_GET['sort_by'] ?? 'name';
 $sortOrder = $_GET['sort_order'] ?? 'ASC';
+$cursor = $_GET['cursor'] ?? '';
 $showAdvanced = isset($_GET['show_advanced']);
 
 $conn = connectDB();
@@ -34,10 +51,18 @@ $conn = connectDB();
 // Get folders for navigation
 $folders = getFolders($conn, $dir);
 
-// Count total files for pagination
-$totalRecords = countFiles($conn, $dir, $filterObject, $filterFilter, $filterImgtype, $dateObsFrom, $dateObsTo);
-$totalExposure = sumExposureTime($conn, $dir, $filterObject, $filterFilter, $filterImgtype, $dateObsFrom, $dateObsTo);
+// Count total files and exposure for pagination
+$totals = getFileTotals($conn, $dir, $filterObject, $filterFilter, $filterImgtype, $dateObsFrom, $dateObsTo);
+$totalRecords = $totals['count'];
+$totalExposure = $totals['exposure'];
 $totalPages = max(1, ceil($totalRecords / $perPage));
+$page = min($page, $totalPages);
 
-// Query for files with filters, LIMIT and sorting
-$files = getFiles($conn, $dir, $filterObject, $filterFilter, $filterImgtype, $dateObsFrom, $dateObsTo, $perPage, ($page - 1) * $perPage, $sortBy, $sortOrder);
+// Query for files with filters and sorting. Previous/next/last links carry a
+// keyset cursor; plain page numbers fall back to OFFSET.
+$lastPageSize = $totalRecords - ($totalPages - 1) * $perPage;
+$files = getFiles($conn, $dir, $filterObject, $filterFilter, $filterImgtype, $dateObsFrom, $dateObsTo, $perPage, ($page - 1) * $perPage, $sortBy, $sortOrder, $cursor, $lastPageSize);
+if ($cursor !== '' && empty($files) && $page > 1) {
+    // The cursor no longer points anywhere (rows changed); show the requested page by offset.
+    $files = getFiles($conn, $dir, $filterObject, $filterFilter, $filterImgtype, $dateObsFrom, $dateObsTo, $perPage, ($page - 1) * $perPage, $sortBy, $sortOrder);
+}
@@ -11,10 +11,13 @@
         $currentPage = $page;
         $total = $totalPages;
         $query = array_merge($_GET, []); // Copy current GET parameters
+        // Keyset cursors for the neighbouring pages
+        $prevCursor = !empty($files) ? encodeFileCursor($files[0], $sortBy, 'b') : null;
+        $nextCursor = !empty($files) ? encodeFileCursor($files[count($files) - 1], $sortBy, 'a') : null;
 
         // Previous
         if ($currentPage > 1) {
-            echo getPaginationLink($query, $currentPage - 1, '← ' . __('previous'));
+            echo getPaginationLink($query, $currentPage - 1, '← ' . __('previous'), '', $currentPage - 1 > 1 ? $prevCursor : null);
         } else {
             echo '<span class="flex items-center justify-center px-3 h-8 leading-tight text-gray-500 bg-gray-700 border border-gray-600 rounded-lg cursor-not-allowed">← ' . __('previous') . '</span>';
         }
@@ -42,12 +45,12 @@
             if ($end < $total - 1) {
                 echo '<span class="px-3 h-8 leading-tight text-gray-400">...</span>';
             }
-            echo getPaginationLink($query, $total, (string)$total);
+            echo getPaginationLink($query, $total, (string)$total, '', 'last');
         }
 
         // Next
         if ($currentPage < $total) {
-            echo getPaginationLink($query, $currentPage + 1, __('next') . ' →');
+            echo getPaginationLink($query, $currentPage + 1, __('next') . ' →', '', $currentPage + 1 == $total ? 'last' : $nextCursor);
         } else {
             echo '<span class="flex items-center justify-center px-3 h-8 leading-tight text-gray-500 bg-gray-700 border border-gray-600 rounded-lg cursor-not-allowed">' . __('next') . ' →</span>';
         }
@@ -13,6 +13,7 @@
         
         // Build the query string, preserving existing GET parameters
         $query_params = $_GET;
+        unset($query_params['cursor']);
         $query_params['dir'] = $parent;
         $href = '?' . http_build_query($query_params);
     ?>
@@ -26,6 +27,7 @@
             // Build the query string for each folder link
             $new_dir = ($dir === '' ? $f : $dir.'/'.$f);
             $query_params = $_GET;
+            unset($query_params['cursor']);
             $query_params['dir'] = $new_dir;
             $href = '?' . http_build_query($query_params);
         ?>
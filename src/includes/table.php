@@ -59,8 +59,8 @@
                         <tr data-id="<?= $f['id'] ?>" class="border-b border-gray-700 hover:bg-gray-700">
                 <td class="p-3"><input type="checkbox" class="file-checkbox h-4 w-4 text-blue-600 rounded" value="<?= htmlspecialchars($f['path'] ?? '') ?>" data-id="<?= $f['id'] ?>"></td>
                 <td class="p-3">
-                    <?php if ($f['thumb']): ?>
-                        <img src="data:image/png;base64,<?= base64_encode($f['thumb']) ?>" 
+                    <?php if ($thumbAttrs = thumbAttributes($f, '250px')): ?>
+                        <img <?= $thumbAttrs ?> 
                              alt="Preview" 
                              class="thumb max-w-[150px] h-auto rounded shadow-md object-cover">
                     <?php else: ?>
@@ -143,8 +143,8 @@
             <input type="checkbox" class="file-checkbox thumb-checkbox h-4 w-4 text-blue-600 rounded" 
                    value="<?= htmlspecialchars($f['path'] ?? '') ?>" 
                    data-id="<?= $f['id'] ?>">
-            <?php if ($f['thumb']): ?>
-                <img src="data:image/png;base64,<?= base64_encode($f['thumb']) ?>" 
+            <?php if ($thumbAttrs = thumbAttributes($f, '350px')): ?>
+                <img <?= $thumbAttrs ?> 
                      alt="Preview" 
                      class="thumb max-w-full h-auto rounded shadow-md object-cover">
             <?php else: ?>
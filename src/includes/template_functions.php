@@ -7,9 +7,36 @@ function echoIcon(string $column, string $sortBy, string $sortOrder): void {
 }
 
 // Helper function for generating pagination links
-function getPaginationLink(array $query, int $pageNum, string $text, string $classes = ''): string {
+function getPaginationLink(array $query, int $pageNum, string $text, string $classes = '', ?string $cursor = null): string {
     $query['page'] = $pageNum;
+    unset($query['cursor']);
+    if ($cursor !== null) {
+        $query['cursor'] = $cursor;
+    }
     $queryString = http_build_query($query);
     return '<a href="?' . $queryString . '" class="flex items-center justify-center px-3 h-8 leading-tight text-blue-300 bg-gray-700 border border-gray-600 rounded-lg hover:bg-gray-600 hover:text-white ' . $classes . '">' . $text . '</a>';
 }
+
+// Helper function for the thumbnail <img> attributes of a file row.
+// Static thumbnails are served by nginx from THUMB_URL; rows indexed before
+// they were enabled still carry an inline PNG in the thumb column.
+function thumbAttributes(array $f, string $sizes): ?string {
+    if (!empty($f['thumb_format']) && !empty($f['thumb_sizes'])) {
+        $hash = rawurlencode($f['file_hash']);
+        $base = THUMB_URL . '/' . substr($hash, 0, 2) . '/' . $hash . '_';
+        $ext = '.' . $f['thumb_format'];
+        $widths = array_map('intval', explode(',', $f['thumb_sizes']));
+        $srcset = array_map(fn($w) => $base . $w . $ext . ' ' . $w . 'w', $widths);
+        $largest = $base . max($widths) . $ext;
+        return 'src="' . htmlspecialchars($base . $widths[0] . $ext) . '"'
+            . ' srcset="' . htmlspecialchars(implode(', ', $srcset)) . '"'
+            . ' sizes="' . htmlspecialchars($sizes) . '"'
+            . ' data-full="' . htmlspecialchars($largest) . '"'
+            . ' loading="lazy" decoding="async"';
+    }
+    if (!empty($f['thumb'])) {
+        return 'src="data:image/png;base64,' . base64_encode($f['thumb']) . '"';
+    }
+    return null;
+}
 ?>
\ No newline at end of file
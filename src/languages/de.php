@@ -60,6 +60,7 @@ return [
     'astrobin_modal_explanation' => 'Kopieren Sie den folgenden Text und fügen Sie ihn in den AstroBin-Sitzungsimporteur ein.',
     'copy_to_clipboard' => 'In die Zwischenablage kopieren',
     'observation_date' => 'Beobachtungsdatum',
+    'invalid_date_filter' => 'Ungültiges Datum ignoriert: {value} (erwartet JJJJ-MM-TT)',
     'thumbnail_size' => 'Vorschaubildgröße',
     'list_view' => 'Listenansicht',
     'thumbnail_view' => 'Miniaturansicht',
@@ -84,6 +84,7 @@ return [
     'astrobin_modal_explanation' => 'Copy the text below and paste it into the AstroBin session importer.',
     'copy_to_clipboard' => 'Copy to Clipboard',
     'observation_date' => 'Observation Date',
+    'invalid_date_filter' => 'Invalid date ignored: {value} (expected YYYY-MM-DD)',
     'thumbnail_size' => 'Thumbnail Size',
     'list_view' => 'List View',
     'thumbnail_view' => 'Thumbnail View',
@@ -60,6 +60,7 @@ return [
     'astrobin_modal_explanation' => 'Copiez le texte ci-dessous et collez-le dans l\'importateur de session d\'AstroBin.',
     'copy_to_clipboard' => 'Copier dans le Presse-papiers',
     'observation_date' => 'Date d\'observation',
+    'invalid_date_filter' => 'Date invalide ignorée : {value} (format attendu AAAA-MM-JJ)',
     'thumbnail_size' => 'Taille des vignettes',
     'list_view' => 'Vue liste',
     'thumbnail_view' => 'Vue vignettes',
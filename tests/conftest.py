@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The indexer modules are flat scripts in docker/python, imported by name.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'docker', 'python'))
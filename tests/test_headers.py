@@ -0,0 +1,65 @@
+import io
+
+from astropy.io import fits
+
+from headers import fits_card_values, read_fits_header_blocks
+
+
+def raw_header(*cards):
+    """Raw header bytes of the given 80-column cards, END card and padding included."""
+    text = ''.join(card.ljust(80) for card in cards + ('END',))
+    return text.ljust(-(-len(text) // 2880) * 2880).encode('ascii')
+
+
+def test_value_types():
+    header = raw_header(
+        "SIMPLE  =                    T / conforms to FITS",
+        "EXPTIME =                300.0 / [s]",
+        "XBINNING=                    2",
+        "CCD-TEMP=             -1.05D+1",
+        "EGAIN   =                  .25",
+        "FLIPPED =                    F",
+        "OBJECT  = 'M 31    '           / target",
+        "OBSERVER= 'O''Brien'",
+        "BLANKVAL=",
+    )
+    values = fits_card_values(header, ['SIMPLE', 'EXPTIME', 'XBINNING', 'CCD-TEMP', 'EGAIN', 'FLIPPED',
+                                       'OBJECT', 'OBSERVER', 'BLANKVAL', 'FILTER'])
+    assert values == {
+        'SIMPLE': True,
+        'EXPTIME': 300.0,
+        'XBINNING': 2,
+        'CCD-TEMP': -10.5,
+        'EGAIN': 0.25,
+        'FLIPPED': False,
+        'OBJECT': 'M 31',
+        'OBSERVER': "O'Brien",
+        'BLANKVAL': None,
+    }
+    assert type(values['XBINNING']) is int
+
+
+def test_first_card_wins():
+    header = raw_header("FILTER  = 'Ha'", "FILTER  = 'OIII'")
+    assert fits_card_values(header, ['FILTER']) == {'FILTER': 'Ha'}
+
+
+def test_comment_slash_inside_string():
+    header = raw_header("OBJECT  = 'NGC 7000 / IC 5070' / two targets")
+    assert fits_card_values(header, ['OBJECT']) == {'OBJECT': 'NGC 7000 / IC 5070'}
+
+
+def test_matches_astropy_for_long_strings():
+    h = fits.Header()
+    h['OBJECT'] = 'A' * 70 + ' and some more text that needs a CONTINUE card ' + 'B' * 60
+    h['FILTER'] = 'L'
+    raw = h.tostring().encode('ascii')
+    assert b'CONTINUE' in raw
+    assert fits_card_values(raw, ['OBJECT', 'FILTER']) == {'OBJECT': h['OBJECT'], 'FILTER': 'L'}
+
+
+def test_read_fits_header_blocks():
+    header = raw_header("SIMPLE  =                    T", *("HISTORY %d" % i for i in range(40)))
+    assert len(header) == 2 * 2880
+    assert read_fits_header_blocks(io.BytesIO(header + b'\0' * 2880)) == header
+    assert read_fits_header_blocks(io.BytesIO(header[:2880])) is None
@@ -0,0 +1,157 @@
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+from xisf import XISF
+
+import thumbnails
+from indexer import (BACKFILL, RECENT, URGENT, IngestQueue, calculate_hash, fingerprint_hash, map_xisf_image,
+                     match_moved_files)
+
+
+# --- Memory-mapped XISF ---
+def test_memory_mapped_rgb_xisf_thumbnail(tmp_path, monkeypatch):
+    path = str(tmp_path / 'colour.xisf')
+    data = np.random.default_rng(0).random((1300, 1700, 3), dtype=np.float32)
+    XISF.write(path, data, creator_app='tests')
+    mapped = map_xisf_image(path, XISF(path).get_images_metadata()[0])
+    assert isinstance(mapped, np.memmap)
+    assert mapped.shape == (1300, 1700, 3)
+    np.testing.assert_array_equal(mapped, data)
+
+    # Small strips, so the planar file is binned over many strips.
+    monkeypatch.setattr(thumbnails, 'STRIP_PIXELS', 100_000)
+    np.testing.assert_allclose(thumbnails.bin_image(mapped, 2), thumbnails.bin_image(data, 2), rtol=1e-6)
+    image = Image.open(BytesIO(thumbnails.make_thumbnail(mapped, (300, 300))))
+    assert image.mode == 'RGB'
+    assert image.size == (300, 229)
+    assert thumbnails.write_thumbnails(str(tmp_path / 'thumbs'), 'cd' * 8, mapped, (150, 300), 'png')
+
+
+# --- Move detection ---
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def task_for(root, rel_path):
+    full_path = os.path.join(root, rel_path)
+    st = os.stat(full_path)
+    return (full_path, rel_path, os.path.basename(rel_path), st.st_mtime, st.st_size)
+
+
+def record(task, file_hash, mtime=None):
+    return {'hash': file_hash, 'mtime': task[3] if mtime is None else mtime, 'size': task[4], 'deleted_at': None}
+
+
+def test_match_moved_files_by_hash(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, 'new', 'a.fits'), b'frame a')
+    write(os.path.join(root, 'new', 'b.fits'), b'frame b')
+    moved, added = task_for(root, 'new/a.fits'), task_for(root, 'new/b.fits')
+    candidates = {'old/a.fits': record(moved, calculate_hash(moved[0]))}
+    moves, remaining = match_moved_files([moved, added], candidates)
+    assert moves == [('old/a.fits', 'new/a.fits', moved[3])]
+    assert remaining == [added]
+
+
+def test_match_moved_files_needs_same_content(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, 'new', 'a.fits'), b'frame a')
+    task = task_for(root, 'new/a.fits')
+    candidates = {'old/a.fits': record(task, 'not the hash')}
+    assert match_moved_files([task], candidates) == ([], [task])
+
+
+def test_match_moved_files_needs_same_mtime(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, 'new', 'a.fits'), b'frame a')
+    task = task_for(root, 'new/a.fits')
+    candidates = {'old/a.fits': record(task, calculate_hash(task[0]), mtime=task[3] - 5)}
+    assert match_moved_files([task], candidates) == ([], [task])
+
+
+def test_match_moved_files_prefers_same_name(tmp_path):
+    # Byte-identical copies: the candidate with the same file name wins,
+    # and each candidate is used once.
+    root = str(tmp_path)
+    write(os.path.join(root, 'new', 'a.fits'), b'same')
+    write(os.path.join(root, 'new', 'b.fits'), b'same')
+    mtime = time.time() - 100
+    for name in ('a.fits', 'b.fits'):
+        os.utime(os.path.join(root, 'new', name), (mtime, mtime))
+    a, b = task_for(root, 'new/a.fits'), task_for(root, 'new/b.fits')
+    file_hash = calculate_hash(a[0])
+    candidates = {'old/b.fits': record(b, file_hash), 'old/a.fits': record(a, file_hash)}
+    moves, remaining = match_moved_files([a, b], candidates)
+    assert sorted(m[:2] for m in moves) == [('old/a.fits', 'new/a.fits'), ('old/b.fits', 'new/b.fits')]
+    assert remaining == []
+
+
+def test_match_moved_files_fingerprinted_rows(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, 'new', 'a.fits'), b'frame a' * 1000)
+    task = task_for(root, 'new/a.fits')
+    candidates = {'old/a.fits': record(task, fingerprint_hash(task[0])[0])}
+    moves, remaining = match_moved_files([task], candidates)
+    assert [m[:2] for m in moves] == [('old/a.fits', 'new/a.fits')]
+    assert remaining == []
+
+
+def test_match_moved_files_unreadable_file(tmp_path):
+    task = (str(tmp_path / 'missing.fits'), 'missing.fits', 'missing.fits', 1000.0, 7)
+    candidates = {'old/missing.fits': {'hash': 'h', 'mtime': 1000.0, 'size': 7, 'deleted_at': None}}
+    assert match_moved_files([task], candidates) == ([], [task])
+
+
+# --- Ingest queue ---
+def make_task(rel_path, mtime, size=1):
+    return ('/fits/' + rel_path, rel_path, os.path.basename(rel_path), mtime, size)
+
+
+def test_ingest_queue_tiers_and_recency():
+    now = time.time()
+    old1, old2 = make_task('old1.fits', now - 30 * 86400), make_task('old2.fits', now - 10 * 86400)
+    new1, new2 = make_task('new1.fits', now - 3600), make_task('new2.fits', now - 60)
+    queue = IngestQueue([old1, new1, old2, new2])
+    assert len(queue) == 4
+    assert list(queue) == [new2, new1, old2, old1]
+
+
+def test_ingest_queue_explicit_tier():
+    now = time.time()
+    recent, old = make_task('recent.fits', now), make_task('old.fits', now - 30 * 86400)
+    queue = IngestQueue([recent])
+    queue.push(old, URGENT)
+    assert list(queue) == [old, recent]
+    assert URGENT < RECENT < BACKFILL
+
+
+def test_ingest_queue_feed_goes_first():
+    now = time.time()
+    first, second = make_task('a.fits', now - 10), make_task('b.fits', now - 20)
+    fed = make_task('watched.fits', now - 40 * 86400)
+    feeds = [[fed]]
+    queue = IngestQueue([first, second], feed=lambda: feeds.pop() if feeds else [], feed_interval=0)
+    assert list(queue) == [fed, first, second]
+
+
+def test_ingest_queue_newer_task_supersedes():
+    now = time.time()
+    stale, fresh = make_task('a.fits', now - 100, size=1), make_task('a.fits', now - 10, size=2)
+    other = make_task('b.fits', now - 50)
+    queue = IngestQueue([stale, other])
+    queue.push(fresh, URGENT)
+    assert list(queue) == [fresh, other]
+
+
+def test_ingest_queue_hands_out_duplicates_once():
+    now = time.time()
+    task = make_task('a.fits', now)
+    queue = IngestQueue([task])
+    queue.push(task, URGENT)
+    assert list(queue) == [task]
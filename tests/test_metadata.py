@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+
+from metadata import COLUMNS, FIELDS, KEYWORDS, normalize, parse_date_obs
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-01-02T03:04:05', datetime(2024, 1, 2, 3, 4, 5)),
+    ('2024-01-02T03:04:05.123', datetime(2024, 1, 2, 3, 4, 5, 123000)),
+    ('2024-01-02T03:04:05.1234567', datetime(2024, 1, 2, 3, 4, 5, 123457)),
+    ('2024-01-02 03:04', datetime(2024, 1, 2, 3, 4)),
+    ('2024-01-02', datetime(2024, 1, 2)),
+    ('2024/01/02T03:04:05', datetime(2024, 1, 2, 3, 4, 5)),
+    ('  2024-01-02T03:04:05  ', datetime(2024, 1, 2, 3, 4, 5)),
+])
+def test_parse_date_obs(value, expected):
+    assert parse_date_obs(value) == expected
+
+
+def test_parse_date_obs_rounds_into_next_second():
+    assert parse_date_obs('2024-01-02T03:04:05.9999996') == datetime(2024, 1, 2, 3, 4, 6)
+
+
+@pytest.mark.parametrize('value', ['', 'yesterday', '2024-13-45T00:00:00'])
+def test_parse_date_obs_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        parse_date_obs(value)
+
+
+def test_columns_and_keywords_follow_fields():
+    assert COLUMNS == tuple(field.column for field in FIELDS)
+    assert len(set(COLUMNS)) == len(COLUMNS)
+    assert 'FOCUSPOS' in KEYWORDS and 'FOCPOS' in KEYWORDS
+    assert len(set(KEYWORDS)) == len(KEYWORDS)
+
+
+def test_normalize_defaults():
+    row = normalize({})
+    assert set(row) == set(COLUMNS)
+    assert row['object'] == 'Unknown'
+    assert row['imgtype'] == 'UNKNOWN'
+    assert row['exptime'] == 0.0
+    assert row['filter'] == ''
+    assert row['focpos'] is None
+
+
+def test_normalize_converts_values():
+    row = normalize({'OBJECT': '  M 31 ', 'IMAGETYP': 'Light Frame', 'EXPTIME': '300', 'XBINNING': 2,
+                     'DATE-OBS': '2024-01-02T03:04:05'})
+    assert row['object'] == 'M 31'
+    assert row['imgtype'] == 'LIGHT FRAME'
+    assert row['exptime'] == 300.0
+    assert row['xbinning'] == 2
+    assert row['date_obs'] == '2024-01-02T03:04:05'
+
+
+def test_normalize_skips_blank_and_unconvertible_values():
+    row = normalize({'OBJECT': '', 'EXPTIME': 'n/a', 'CCD-TEMP': None})
+    assert row['object'] == 'Unknown'
+    assert row['exptime'] == 0.0
+    assert row['ccd_temp'] is None
+
+
+def test_normalize_focuser_position_alias():
+    assert normalize({'FOCUSPOS': 12345})['focpos'] == 12345
+    assert normalize({'FOCPOS': 1, 'FOCUSPOS': 2})['focpos'] == 1
+    assert normalize({'FOCPOS': 'moving', 'FOCUSPOS': 2})['focpos'] == 2
@@ -0,0 +1,121 @@
+import os
+import time
+
+from manifest import Manifest
+from scanner import DirCache, is_settled, walk_tree
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x')
+
+
+def backdate(root, seconds=60):
+    """Age every directory past the scanner's settle window."""
+    then = time.time() - seconds
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (then, then))
+
+
+class Cache:
+    def __init__(self, entries):
+        self.entries = entries
+        self.lookups = []
+
+    def lookup(self, rel_dir):
+        self.lookups.append(rel_dir)
+        return self.entries.get(rel_dir)
+
+
+def test_walk_tree_lists_image_files(tmp_path):
+    touch(str(tmp_path / 'M31' / 'L' / 'a.fits'))
+    touch(str(tmp_path / 'M31' / 'b.XISF'))
+    touch(str(tmp_path / 'M31' / 'notes.txt'))
+    touch(str(tmp_path / 'c.fit'))
+    listings = {l.rel_dir: l for l in walk_tree(str(tmp_path))}
+    assert set(listings) == {'', 'M31', os.path.join('M31', 'L')}
+    assert set(listings['M31'].files) == {'b.XISF'}
+    assert listings['M31'].subdirs == ['L']
+    assert set(listings[''].files) == {'c.fit'}
+    assert not any(l.cached for l in listings.values())
+    assert listings['M31'].files['b.XISF'].st_size == 1
+
+
+def test_walk_tree_reuses_cached_listing(tmp_path):
+    touch(str(tmp_path / 'M31' / 'a.fits'))
+    mtime_ns = os.stat(str(tmp_path / 'M31')).st_mtime_ns
+    cache = Cache({'M31': (mtime_ns, [], ['a.fits', 'gone.fits'])})
+    listings = {l.rel_dir: l for l in walk_tree(str(tmp_path), cache=cache)}
+    assert listings['M31'].cached
+    assert listings['M31'].files == {'a.fits': None, 'gone.fits': None}
+    assert not listings[''].cached
+
+
+def test_walk_tree_relists_changed_directory(tmp_path):
+    touch(str(tmp_path / 'M31' / 'a.fits'))
+    mtime_ns = os.stat(str(tmp_path / 'M31')).st_mtime_ns
+    cache = Cache({'M31': (mtime_ns - 1, [], ['gone.fits'])})
+    listings = {l.rel_dir: l for l in walk_tree(str(tmp_path), cache=cache)}
+    assert not listings['M31'].cached
+    assert set(listings['M31'].files) == {'a.fits'}
+
+
+def test_is_settled():
+    now = time.time()
+    assert is_settled(int((now - 10) * 1e9), now)
+    assert not is_settled(int(now * 1e9), now)
+
+
+def test_dir_cache_reports_changes(tmp_path):
+    touch(str(tmp_path / 'M31' / 'a.fits'))
+    touch(str(tmp_path / 'M42' / 'b.fits'))
+    backdate(str(tmp_path))
+    cache = DirCache()
+    created, deleted, _ = cache.scan(str(tmp_path))
+    assert created == {os.path.join('M31', 'a.fits'), os.path.join('M42', 'b.fits')}
+    assert not deleted
+
+    created, deleted, stats = cache.scan(str(tmp_path))
+    assert not created and not deleted
+    assert stats['listed'] == 0
+
+    os.remove(str(tmp_path / 'M42' / 'b.fits'))
+    touch(str(tmp_path / 'M42' / 'c.fits'))
+    created, deleted, stats = cache.scan(str(tmp_path))
+    assert created == {os.path.join('M42', 'c.fits')}
+    assert deleted == {os.path.join('M42', 'b.fits')}
+    assert stats['listed'] == 1
+
+
+def test_manifest_is_current(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.sqlite'))
+    try:
+        assert not manifest.is_current(str(tmp_path), '0:0')
+        manifest.set_meta('fits_root', os.path.abspath(str(tmp_path)))
+        manifest.set_meta('fingerprint', '3:7')
+        manifest.commit()
+        assert manifest.is_current(str(tmp_path), '3:7')
+        assert manifest.is_current(str(tmp_path) + os.sep, '3:7')
+        assert not manifest.is_current(str(tmp_path), '3:8')
+        assert not manifest.is_current(str(tmp_path / 'other'), '3:7')
+    finally:
+        manifest.close()
+
+
+def test_manifest_lookup_feeds_walk_tree(tmp_path):
+    root = tmp_path / 'fits'
+    touch(str(root / 'M31' / 'a.fits'))
+    backdate(str(root))
+    manifest = Manifest(str(tmp_path / 'manifest.sqlite'))
+    try:
+        assert manifest.lookup('M31') is None
+        mtime_ns = os.stat(str(root / 'M31')).st_mtime_ns
+        manifest.put_files([(os.path.join('M31', 'a.fits'), 'h', 0.0, 1)])
+        manifest.replace_dirs({'': None, 'M31': mtime_ns})
+        assert manifest.lookup('M31') == (mtime_ns, [], ['a.fits'])
+        assert manifest.lookup('') is None
+        listings = {l.rel_dir: l for l in walk_tree(str(root), cache=manifest)}
+        assert listings['M31'].cached and not listings[''].cached
+    finally:
+        manifest.close()
@@ -0,0 +1,48 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from thumbnails import bin_image, make_thumbnail, thumbnail_path, write_thumbnails
+
+
+def test_bin_image_mono():
+    data = np.arange(36, dtype=np.float32).reshape(6, 6)
+    data[0, 0] = np.nan
+    binned = bin_image(data, 3)
+    assert binned.shape == (2, 2)
+    assert binned[1, 1] == data[3:, 3:].mean()
+    assert binned[0, 0] == np.nan_to_num(data[:3, :3]).mean()
+
+
+def test_bin_image_keeps_trailing_channels():
+    data = np.random.default_rng(0).random((12, 18, 3), dtype=np.float32)
+    binned = bin_image(data, 3)
+    assert binned.shape == (4, 6, 3)
+    for c in range(3):
+        np.testing.assert_allclose(binned[..., c], bin_image(np.ascontiguousarray(data[..., c]), 3), rtol=1e-6)
+
+
+def test_large_rgb_frame_renders_in_colour():
+    data = np.random.default_rng(0).random((2000, 3000, 3), dtype=np.float32)
+    data[..., 0] *= 0.1
+    image = Image.open(BytesIO(make_thumbnail(data, (300, 300))))
+    assert image.mode == 'RGB'
+    assert image.size == (300, 200)
+    red, green, blue = np.asarray(image).reshape(-1, 3).mean(axis=0)
+    assert red < green / 4 and abs(green - blue) < 5
+
+
+def test_large_mono_frame():
+    data = (np.random.default_rng(0).random((2000, 3000)) * 60000).astype(np.uint16)
+    image = Image.open(BytesIO(make_thumbnail(data, (300, 300))))
+    assert image.mode == 'L'
+    assert image.size == (300, 200)
+
+
+def test_write_thumbnails_rgb(tmp_path):
+    data = np.random.default_rng(0).random((1500, 1500, 3), dtype=np.float32)
+    assert write_thumbnails(str(tmp_path), 'ab' * 8, data, (150, 300), 'png')
+    for size in (150, 300):
+        with Image.open(thumbnail_path(str(tmp_path), 'ab' * 8, size, 'png')) as image:
+            assert image.mode == 'RGB' and image.size == (size, size)